@@ -0,0 +1,180 @@
+# =============================================================
+# Script: benchmark.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Mede tempo, vazão e pico de memória de cada etapa do pipeline sobre
+# exports sintéticos de vários tamanhos (gerar_export_sintetico.py).
+# =============================================================
+#
+# Cada etapa roda em um processo Python próprio, para que o pico de memória
+# (RSS) medido seja só dela (com --processos > 1, somado ao dos workers). As etapas são as de pipeline.ETAPAS (mais a
+# exportação do export_master.xlsx), na ordem do pipeline, e usam as saídas
+# das anteriores:
+#
+#   extracao   processar_exportacao (CSVs + Parquet)
+#   cda        processar_cda
+#   rotas      processar_rotas
+#   auditoria  gerar_auditoria_simplificada refeita a partir do export_master.csv
+#   excel      exportar_excel_do_csv (export_master.xlsx)
+#   cubo       gerar_cubo
+#   indice     gerar_indice (índice temporal por tipo)
+#   deduplicacao  gerar_deduplicacao (tipos aditivos sem fontes sobrepostas)
+#   treinos    gerar_treinos (rotas e FC ligadas a cada treino)
+#   hrv        gerar_metricas_hrv (RMSSD / pNN50 dos batimentos)
+#   metricas_rotas  gerar_metricas_rotas (distância, desnível, trajeto simplificado)
+#   resumo     auditar_saude_resumo.main
+#   series     audit_to_excel_charts.main
+#
+# Resultado: tabela no terminal e <pasta>/benchmark_resultados.{csv,json}.
+#
+# Uso:
+#   python bench\benchmark.py [--pasta bench_dados] [--tamanhos 10000 100000 1000000]
+#                             [--etapas extracao cubo] [--processos 1]
+
+import argparse
+import csv
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+AQUI = Path(__file__).resolve().parent
+SRC = AQUI.parent / "src"
+
+# etapa -> unidade de vazão (chave do resumo do gerador)
+ETAPAS = {
+    "extracao": "records",
+    "cda": "observacoes_cda",
+    "rotas": "pontos_gpx",
+    "auditoria": "records",
+    "excel": "records",
+    "cubo": "records",
+    "indice": "records",
+    "deduplicacao": "records",
+    "treinos": "workouts",
+    "hrv": "records",
+    "metricas_rotas": "pontos_gpx",
+    "resumo": "records",
+    "series": "records",
+}
+
+
+def executar_etapa(etapa, entrada, saida, processos):
+    """Roda uma etapa no processo atual e devolve {segundos, pico_mb, base_mb}."""
+    sys.path.insert(0, str(SRC))
+    import apple_health_export_to_tables_v1_3 as extracao
+    from instrumentacao import Instrumentacao, pico_memoria_mb
+    from pipeline import executar_pipeline
+
+    base = pico_memoria_mb()
+    inst = Instrumentacao(mostrar=False)
+    inicio = time.perf_counter()
+    if etapa == "excel":
+        extracao.exportar_excel_do_csv(saida / "export_master.csv", saida / "export_master.xlsx")
+    else:
+        # a mesma etapa do pipeline, sem o cache (senão seria pulada)
+        executar_pipeline(entrada, saida, processos=processos, etapas=[etapa], usar_cache=False,
+                          inst=inst)
+    segundos = time.perf_counter() - inicio
+    # com --processos > 1 os workers não entram no pico do processo: vale o
+    # maior RSS somado (processo + filhos vivos) amostrado durante a etapa
+    amostrado = max((e.pico_mb or 0 for e in inst.etapas), default=0)
+    return {"segundos": segundos, "pico_mb": max(pico_memoria_mb(), amostrado), "base_mb": base}
+
+
+def medir(etapa, entrada, saida, processos):
+    """Executa a etapa em um subprocesso e devolve as medidas."""
+    medidas = saida / f".medida_{etapa}.json"
+    cmd = [sys.executable, str(Path(__file__).resolve()), "--_etapa", etapa,
+           "--_entrada", str(entrada), "--_saida", str(saida), "--_medidas", str(medidas),
+           "--processos", str(processos)]
+    # cwd na pasta de saída: scripts que criam Saida/ relativa não sujam o repositório
+    proc = subprocess.run(cmd, cwd=saida, capture_output=True, text=True, encoding="utf-8")
+    if proc.returncode != 0 or not medidas.exists():
+        print(f"[ERRO] Etapa {etapa} falhou:\n{proc.stderr[-2000:]}")
+        return None
+    dados = json.loads(medidas.read_text(encoding="utf-8"))
+    medidas.unlink()
+    return dados
+
+
+def preparar_dados(pasta, tamanho):
+    """Gera (uma vez) o export sintético do tamanho pedido; devolve (entrada, resumo)."""
+    sys.path.insert(0, str(AQUI))
+    from gerar_export_sintetico import gerar_export
+
+    destino = pasta / f"dados_{tamanho}"
+    marca = destino / "resumo.json"
+    if marca.exists():
+        return destino / "apple_health_export", json.loads(marca.read_text(encoding="utf-8"))
+    print(f"[INFO] Gerando export sintético com {tamanho:,} registros...".replace(",", "."))
+    resumo = gerar_export(destino, registros=tamanho, anos=max(1, tamanho // 500_000 + 1),
+                          observacoes_cda=max(tamanho // 20, 100), rotas=max(tamanho // 2_000, 5))
+    marca.write_text(json.dumps(resumo), encoding="utf-8")
+    return destino / "apple_health_export", resumo
+
+
+def rodar(pasta, tamanhos, etapas, processos):
+    pasta = Path(pasta).resolve()
+    pasta.mkdir(parents=True, exist_ok=True)
+    resultados = []
+    for tamanho in tamanhos:
+        entrada, resumo = preparar_dados(pasta, tamanho)
+        saida = pasta / f"saida_{tamanho}"
+        saida.mkdir(exist_ok=True)
+        for etapa in etapas:
+            medidas = medir(etapa, entrada, saida, processos)
+            if medidas is None:
+                continue
+            itens = resumo[ETAPAS[etapa]]
+            linha = {
+                "tamanho": tamanho, "etapa": etapa, "itens": itens,
+                "segundos": round(medidas["segundos"], 3),
+                "itens_por_s": round(itens / medidas["segundos"]) if medidas["segundos"] else None,
+                "pico_mb": round(medidas["pico_mb"], 1),
+                "incremento_mb": round(medidas["pico_mb"] - medidas["base_mb"], 1),
+                "mb_export": round(resumo["bytes_export"] / 2**20, 1),
+            }
+            resultados.append(linha)
+            print(f"  {tamanho:>10,}  {etapa:<14} {linha['segundos']:>9.2f} s  "
+                  f"{linha['itens_por_s'] or 0:>10,}/s  pico {linha['pico_mb']:>8.1f} MB "
+                  f"(+{linha['incremento_mb']:.1f})".replace(",", "."))
+
+    ambiente = {
+        "data": f"{datetime.now():%Y-%m-%d %H:%M:%S}", "python": platform.python_version(),
+        "plataforma": platform.platform(), "cpus": os.cpu_count(), "processos": processos,
+    }
+    (pasta / "benchmark_resultados.json").write_text(
+        json.dumps({"ambiente": ambiente, "resultados": resultados}, ensure_ascii=False, indent=1),
+        encoding="utf-8")
+    if resultados:
+        with open(pasta / "benchmark_resultados.csv", "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=list(resultados[0]))
+            w.writeheader()
+            w.writerows(resultados)
+    print(f"[OK] Resultados em {pasta / 'benchmark_resultados.csv'}")
+    return resultados
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark das etapas do pipeline Apple Saúde.")
+    parser.add_argument("--pasta", default="bench_dados", help="pasta para os dados sintéticos e saídas")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--etapas", nargs="+", choices=list(ETAPAS), default=list(ETAPAS))
+    parser.add_argument("--processos", type=int, default=1)
+    # uso interno: execução de uma etapa no subprocesso
+    parser.add_argument("--_etapa", help=argparse.SUPPRESS)
+    parser.add_argument("--_entrada", help=argparse.SUPPRESS)
+    parser.add_argument("--_saida", help=argparse.SUPPRESS)
+    parser.add_argument("--_medidas", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._etapa:
+        medidas = executar_etapa(args._etapa, Path(args._entrada), Path(args._saida), args.processos)
+        Path(args._medidas).write_text(json.dumps(medidas), encoding="utf-8")
+    else:
+        print(f"{'tamanho':>12}  {'etapa':<14} {'tempo':>11}  {'vazão':>12}  memória")
+        rodar(args.pasta, args.tamanhos, args.etapas, args.processos)
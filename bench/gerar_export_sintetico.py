@@ -0,0 +1,271 @@
+# =============================================================
+# Script: gerar_export_sintetico.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Gera um export sintético do Apple Saúde (export.xml, export_cda.xml e
+# workout-routes/*.gpx), determinístico, para testes de desempenho sem
+# dados reais de participantes.
+# =============================================================
+#
+# O layout segue o do export real: apple_health_export/ com o export.xml
+# (um <Record> por linha, agrupados por tipo e em ordem de tempo, alguns com
+# MetadataEntry; HRV com a lista de batimentos instantâneos; <Workout> com
+# estatísticas e referência à rota; <ActivitySummary> diários), o
+# export_cda.xml (HL7 CDA) e um GPX por treino com rota.
+#
+# A mesma semente e os mesmos parâmetros produzem sempre os mesmos bytes.
+#
+# Uso:
+#   python bench\gerar_export_sintetico.py <destino> [--registros 100000]
+#          [--anos 2] [--fontes 2] [--sobreposicao 0.2] [--observacoes-cda 5000]
+#          [--rotas 50] [--pontos-rota 600] [--semente 0] [--zip]
+
+import argparse
+import random
+import zipfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# fim fixo do período (o export "foi feito" nesta data)
+FIM_PERIODO = datetime(2025, 10, 30, 9, 0, 0)
+FUSO = "-0300"
+FORMATO = "%Y-%m-%d %H:%M:%S " + FUSO
+# os GPX da Apple trazem os horários em UTC (os do export.xml, em FUSO)
+PARA_UTC = -datetime.strptime(FUSO, "%z").utcoffset()
+
+# (tipo, unidade, peso na mistura, duração típica em s, gerador do valor)
+TIPOS = [
+    ("HKQuantityTypeIdentifierHeartRate", "count/min", 35, 0, lambda r: r.randint(48, 160)),
+    ("HKQuantityTypeIdentifierStepCount", "count", 20, 600, lambda r: r.randint(5, 1200)),
+    ("HKQuantityTypeIdentifierActiveEnergyBurned", "Cal", 15, 300, lambda r: round(r.uniform(0.05, 25), 3)),
+    ("HKQuantityTypeIdentifierBasalEnergyBurned", "Cal", 5, 900, lambda r: round(r.uniform(5, 20), 3)),
+    ("HKQuantityTypeIdentifierDistanceWalkingRunning", "km", 5, 600, lambda r: round(r.uniform(0.001, 0.9), 5)),
+    ("HKQuantityTypeIdentifierOxygenSaturation", "%", 3, 0, lambda r: round(r.uniform(0.92, 1.0), 2)),
+    ("HKQuantityTypeIdentifierRespiratoryRate", "count/min", 4, 0, lambda r: r.randint(11, 22)),
+    ("HKQuantityTypeIdentifierRestingHeartRate", "count/min", 1, 0, lambda r: r.randint(50, 75)),
+    ("HKQuantityTypeIdentifierWalkingHeartRateAverage", "count/min", 1, 0, lambda r: r.randint(80, 120)),
+    ("HKQuantityTypeIdentifierHeartRateVariabilitySDNN", "ms", 2, 60, lambda r: round(r.uniform(10, 90), 4)),
+    ("HKCategoryTypeIdentifierSleepAnalysis", None, 8, 1800, lambda r: r.choice(ESTAGIOS_SONO)),
+    ("HKQuantityTypeIdentifierBodyMass", "kg", 1, 0, lambda r: round(r.uniform(60, 80), 1)),
+]
+ESTAGIOS_SONO = [
+    "HKCategoryValueSleepAnalysisInBed", "HKCategoryValueSleepAnalysisAsleepCore",
+    "HKCategoryValueSleepAnalysisAsleepDeep", "HKCategoryValueSleepAnalysisAsleepREM",
+    "HKCategoryValueSleepAnalysisAwake",
+]
+# tipos aditivos registrados por mais de uma fonte ao mesmo tempo
+ADITIVOS = {"HKQuantityTypeIdentifierStepCount", "HKQuantityTypeIdentifierActiveEnergyBurned",
+            "HKQuantityTypeIdentifierDistanceWalkingRunning"}
+DISPOSITIVO = ("&lt;&lt;HKDevice: 0x280a1c000&gt;, name:Apple Watch, manufacturer:Apple Inc., "
+               "model:Watch, hardware:Watch6,2, software:10.1&gt;")
+
+ATIVIDADES = ["HKWorkoutActivityTypeWalking", "HKWorkoutActivityTypeRunning",
+              "HKWorkoutActivityTypeCycling"]
+
+PROLOGO = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary|ClinicalRecord)*)>
+<!ATTLIST HealthData locale CDATA #REQUIRED>
+]>
+<HealthData locale="pt_BR">
+ <ExportDate value="{export}"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth="1950-04-12" HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexFemale" HKCharacteristicTypeIdentifierBloodType="HKBloodTypeNotSet" HKCharacteristicTypeIdentifierFitzpatrickSkinType="HKFitzpatrickSkinTypeNotSet" HKCharacteristicTypeIdentifierCardioFitnessMedicationsUse="None"/>
+"""
+
+
+def _data(t):
+    return t.strftime(FORMATO)
+
+
+def nomes_fontes(n):
+    """Watch e iPhone primeiro (as fontes reais mais comuns), depois apps."""
+    base = ["Apple Watch de Participante", "iPhone de Participante"]
+    return (base + [f"App Saúde {k}" for k in range(1, max(n - 1, 1))])[:max(n, 1)]
+
+
+def _instantes(r, inicio, n=60):
+    """Lista de batimentos instantâneos de uma medição de HRV."""
+    linhas = ["  <HeartRateVariabilityMetadataList>"]
+    t = inicio
+    for _ in range(n):
+        t += timedelta(seconds=r.uniform(0.6, 1.2))
+        hora = t.strftime("%I:%M:%S.") + f"{t.microsecond // 10000:02d} " + t.strftime("%p")
+        linhas.append(f'   <InstantaneousBeatsPerMinute bpm="{r.randint(55, 95)}" time="{hora.lstrip("0")}"/>')
+    linhas.append("  </HeartRateVariabilityMetadataList>")
+    return "\n".join(linhas)
+
+
+def _escrever_records(f, r, registros, anos, fontes, sobreposicao):
+    inicio_periodo = FIM_PERIODO - timedelta(days=365 * anos)
+    segundos = (FIM_PERIODO - inicio_periodo).total_seconds()
+    peso_total = sum(t[2] for t in TIPOS)
+    total = 0
+    for tipo, unidade, peso, duracao, valor in TIPOS:
+        n = max(int(registros * peso / peso_total), 1)
+        passo = segundos / n
+        for i in range(n):
+            inicio = inicio_periodo + timedelta(seconds=i * passo + r.uniform(0, passo * 0.5))
+            fim = inicio + timedelta(seconds=r.uniform(duracao * 0.5, duracao * 1.5) if duracao else 0)
+            copias = [r.choice(fontes)]
+            if tipo in ADITIVOS and len(fontes) > 1 and r.random() < sobreposicao:
+                # mesma atividade registrada por outra fonte, com janela deslocada
+                copias.append(next(s for s in fontes if s != copias[0]))
+            for k, fonte in enumerate(copias):
+                ini_k = inicio + timedelta(seconds=k * duracao * 0.3)
+                fim_k = fim + timedelta(seconds=k * duracao * 0.3)
+                attrs = (f'type="{tipo}" sourceName="{fonte}" sourceVersion="10.1"'
+                         + (f' unit="{unidade}"' if unidade else "")
+                         + f' creationDate="{_data(fim_k)}" startDate="{_data(ini_k)}"'
+                         f' endDate="{_data(fim_k)}" value="{valor(r)}"')
+                if fonte.startswith("Apple Watch"):
+                    attrs += f' device="{DISPOSITIVO}"'
+                if tipo == "HKQuantityTypeIdentifierHeartRateVariabilitySDNN":
+                    f.write(f" <Record {attrs}>\n{_instantes(r, ini_k)}\n </Record>\n")
+                elif i % 10 == 0:
+                    f.write(f' <Record {attrs}>\n  <MetadataEntry key="HKTimeZone" value="America/Sao_Paulo"/>\n </Record>\n')
+                else:
+                    f.write(f" <Record {attrs}/>\n")
+                total += 1
+    return total
+
+
+def _treinos(r, rotas, anos):
+    """(inicio, fim, atividade, arquivo GPX) de cada treino com rota, em ordem de tempo."""
+    inicio_periodo = FIM_PERIODO - timedelta(days=365 * anos)
+    passo = (FIM_PERIODO - inicio_periodo).total_seconds() / max(rotas, 1)
+    treinos = []
+    for k in range(rotas):
+        inicio = inicio_periodo + timedelta(seconds=k * passo + r.uniform(0, passo * 0.5))
+        inicio = inicio.replace(hour=7 + k % 3, microsecond=0)
+        fim = inicio + timedelta(minutes=r.randint(20, 60))
+        treinos.append((inicio, fim, r.choice(ATIVIDADES), f"route_{inicio:%Y-%m-%d_%H.%M}_{k:05d}.gpx"))
+    return treinos
+
+
+def _escrever_workouts(f, r, treinos, fonte):
+    for inicio, fim, atividade, rota in treinos:
+        minutos = (fim - inicio).total_seconds() / 60
+        f.write(
+            f' <Workout workoutActivityType="{atividade}" duration="{minutos:.4f}" durationUnit="min"'
+            f' sourceName="{fonte}" sourceVersion="10.1" device="{DISPOSITIVO}"'
+            f' creationDate="{_data(fim)}" startDate="{_data(inicio)}" endDate="{_data(fim)}">\n'
+            f'  <MetadataEntry key="HKIndoorWorkout" value="0"/>\n'
+            f'  <WorkoutEvent type="HKWorkoutEventTypeSegment" date="{_data(inicio)}"'
+            f' duration="{minutos:.4f}" durationUnit="min"/>\n'
+            f'  <WorkoutStatistics type="HKQuantityTypeIdentifierActiveEnergyBurned"'
+            f' startDate="{_data(inicio)}" endDate="{_data(fim)}" sum="{minutos * r.uniform(4, 9):.3f}" unit="Cal"/>\n'
+            f'  <WorkoutStatistics type="HKQuantityTypeIdentifierHeartRate"'
+            f' startDate="{_data(inicio)}" endDate="{_data(fim)}" average="{r.uniform(95, 140):.2f}"'
+            f' minimum="{r.randint(70, 95)}" maximum="{r.randint(140, 175)}" unit="count/min"/>\n'
+            f'  <WorkoutRoute sourceName="{fonte}" sourceVersion="10.1"'
+            f' creationDate="{_data(fim)}" startDate="{_data(inicio)}" endDate="{_data(fim)}">\n'
+            f'   <FileReference path="/workout-routes/{rota}"/>\n'
+            f'  </WorkoutRoute>\n'
+            f' </Workout>\n')
+
+
+def _escrever_resumos(f, r, anos):
+    dia = (FIM_PERIODO - timedelta(days=365 * anos)).date()
+    while dia <= FIM_PERIODO.date():
+        f.write(f' <ActivitySummary dateComponents="{dia:%Y-%m-%d}"'
+                f' activeEnergyBurned="{r.uniform(100, 600):.3f}" activeEnergyBurnedGoal="400"'
+                f' activeEnergyBurnedUnit="Cal" appleMoveTime="0" appleMoveTimeGoal="0"'
+                f' appleExerciseTime="{r.randint(0, 90)}" appleExerciseTimeGoal="30"'
+                f' appleStandHours="{r.randint(4, 14)}" appleStandHoursGoal="12"/>\n')
+        dia += timedelta(days=1)
+
+
+def _escrever_gpx(pasta, r, treinos, pontos):
+    for inicio, fim, _, rota in treinos:
+        lat, lon, ele = -22.82 + r.uniform(-0.05, 0.05), -47.06 + r.uniform(-0.05, 0.05), 600.0
+        passo = (fim - inicio).total_seconds() / max(pontos, 1)
+        linhas = ['<?xml version="1.0" encoding="UTF-8"?>',
+                  '<gpx version="1.1" creator="Apple Health Export" xmlns="http://www.topografix.com/GPX/1/1">',
+                  f" <metadata><time>{inicio + PARA_UTC:%Y-%m-%dT%H:%M:%S}Z</time></metadata>",
+                  " <trk><name>Rota</name><trkseg>"]
+        for i in range(pontos):
+            lat += r.uniform(-0.0001, 0.0001)
+            lon += r.uniform(-0.0001, 0.0001)
+            ele += r.uniform(-0.5, 0.5)
+            t = inicio + PARA_UTC + timedelta(seconds=i * passo)
+            linhas.append(f'  <trkpt lon="{lon:.6f}" lat="{lat:.6f}"><ele>{ele:.2f}</ele>'
+                          f"<time>{t:%Y-%m-%dT%H:%M:%S}Z</time></trkpt>")
+        linhas += [" </trkseg></trk>", "</gpx>", ""]
+        (pasta / rota).write_text("\n".join(linhas), encoding="utf-8")
+
+
+def _escrever_cda(path, r, observacoes, anos):
+    inicio_periodo = FIM_PERIODO - timedelta(days=365 * anos)
+    passo = (FIM_PERIODO - inicio_periodo).total_seconds() / max(observacoes, 1)
+    codigos = [("8867-4", "Heart rate", "count/min", 48, 160),
+               ("9279-1", "Respiratory rate", "count/min", 11, 22),
+               ("29463-7", "Body weight", "kg", 60, 80),
+               ("59408-5", "Oxygen saturation", "%", 92, 100)]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0"?>\n<ClinicalDocument xmlns="urn:hl7-org:v3"'
+                ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">\n'
+                ' <title>Dados de Saúde</title>\n <component>\n  <structuredBody>\n'
+                '   <component>\n    <section>\n')
+        for i in range(observacoes):
+            codigo, nome, unidade, lo, hi = codigos[i % len(codigos)]
+            t = inicio_periodo + timedelta(seconds=i * passo)
+            f.write(f'     <entry><organizer classCode="CLUSTER" moodCode="EVN"><component>'
+                    f'<observation classCode="OBS" moodCode="EVN">'
+                    f'<code code="{codigo}" codeSystem="2.16.840.1.113883.6.1" displayName="{nome}"/>'
+                    f'<value xsi:type="PQ" value="{r.randint(lo, hi)}" unit="{unidade}"/>'
+                    f'<effectiveTime><low value="{t:%Y%m%d%H%M%S}{FUSO}"/>'
+                    f'<high value="{t:%Y%m%d%H%M%S}{FUSO}"/></effectiveTime>'
+                    f'</observation></component></organizer></entry>\n')
+        f.write('    </section>\n   </component>\n  </structuredBody>\n </component>\n</ClinicalDocument>\n')
+
+
+def gerar_export(destino, registros=100_000, anos=2, fontes=2, sobreposicao=0.2,
+                 observacoes_cda=5_000, rotas=50, pontos_rota=600, semente=0, gerar_zip=False):
+    """
+    Grava <destino>/apple_health_export/ (e, com gerar_zip, <destino>/export.zip).
+    Devolve um resumo com as contagens geradas.
+    """
+    r = random.Random(semente)
+    pasta = Path(destino) / "apple_health_export"
+    (pasta / "workout-routes").mkdir(parents=True, exist_ok=True)
+    lista_fontes = nomes_fontes(fontes)
+    treinos = _treinos(r, rotas, anos)
+
+    with open(pasta / "export.xml", "w", encoding="utf-8") as f:
+        f.write(PROLOGO.format(export=_data(FIM_PERIODO)))
+        n_records = _escrever_records(f, r, registros, anos, lista_fontes, sobreposicao)
+        _escrever_workouts(f, r, treinos, lista_fontes[0])
+        _escrever_resumos(f, r, anos)
+        f.write("</HealthData>\n")
+    _escrever_cda(pasta / "export_cda.xml", r, observacoes_cda, anos)
+    _escrever_gpx(pasta / "workout-routes", r, treinos, pontos_rota)
+
+    if gerar_zip:
+        with zipfile.ZipFile(Path(destino) / "export.zip", "w", zipfile.ZIP_DEFLATED) as zf:
+            for arq in sorted(pasta.rglob("*")):
+                if arq.is_file():
+                    zf.write(arq, arq.relative_to(Path(destino)).as_posix())
+
+    return {"records": n_records, "workouts": len(treinos), "observacoes_cda": observacoes_cda,
+            "pontos_gpx": len(treinos) * pontos_rota,
+            "bytes_export": (pasta / "export.xml").stat().st_size}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um export sintético do Apple Saúde.")
+    parser.add_argument("destino")
+    parser.add_argument("--registros", type=int, default=100_000, help="<Record> aproximados (sem as cópias sobrepostas)")
+    parser.add_argument("--anos", type=int, default=2, help="anos cobertos, terminando em 30/10/2025")
+    parser.add_argument("--fontes", type=int, default=2, help="número de fontes (sourceName)")
+    parser.add_argument("--sobreposicao", type=float, default=0.2, help="fração dos registros aditivos duplicados por outra fonte")
+    parser.add_argument("--observacoes-cda", type=int, default=5_000)
+    parser.add_argument("--rotas", type=int, default=50, help="treinos com rota GPX")
+    parser.add_argument("--pontos-rota", type=int, default=600)
+    parser.add_argument("--semente", type=int, default=0)
+    parser.add_argument("--zip", action="store_true", help="gera também o export.zip")
+    args = parser.parse_args()
+
+    resumo = gerar_export(args.destino, args.registros, args.anos, args.fontes, args.sobreposicao,
+                          args.observacoes_cda, args.rotas, args.pontos_rota, args.semente, args.zip)
+    print(f"[OK] Export sintético em {args.destino}: {resumo['records']:,} registros; "
+          f"{resumo['workouts']} treinos; {resumo['observacoes_cda']:,} observações CDA; "
+          f"{resumo['bytes_export'] / 1e6:.1f} MB".replace(",", "."))
@@ -6,44 +6,50 @@
 # Execução local simplificada — versão ampliada (Cardíaco, Passos, Sono, Respiração, Energia)
 # =============================================================
 
-import os, sys, csv, math, time, threading
+import os, re, sys, csv, json, math, mmap, time, shutil, fnmatch, hashlib, zipfile
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import xml.etree.ElementTree as ET
 
+from catalogo_metricas import DOMINIOS, dominio_do_tipo, ler_lista_metricas
+from datas_apple import parse_date, epoch_apple, texto_apple
+from instrumentacao import Instrumentacao, LeituraContada
+
+try:
+    from tabela_registros import TabelaRegistros
+except ImportError:  # requer numpy
+    TabelaRegistros = None
+
+try:
+    from batimentos_hrv import PASTA_HRV, GravadorBatimentos, juntar_batimentos
+except ImportError:  # requer numpy
+    GravadorBatimentos = None
+
 try:
     import pandas as pd
 except ImportError:
     pd = None
 
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
 # -------------------------------------------------------------
 # ========== BLOCO A - PROGRESSO E AUDITORIA SIMPLIFICADA ======
 # -------------------------------------------------------------
 
-class Spinner:
-    def __init__(self, msg="Processando..."):
-        self.msg = msg
-        self._stop = False
-        self._thread = None
-
-    def start(self):
-        def spin():
-            symbols = "|/-\\"
-            i = 0
-            while not self._stop:
-                sys.stdout.write(f"\r{self.msg} {symbols[i % 4]}")
-                sys.stdout.flush()
-                i += 1
-                time.sleep(0.1)
-            sys.stdout.write("\r" + " " * (len(self.msg) + 2) + "\r")
-
-        self._thread = threading.Thread(target=spin, daemon=True)
-        self._thread.start()
-
-    def stop(self):
-        self._stop = True
-        if self._thread:
-            self._thread.join()
+# O antigo Spinner deu lugar a instrumentacao.Instrumentacao: progresso pelos
+# bytes lidos da entrada, registros/s, tempo e pico de memória por etapa e o
+# arquivo metricas_execucao.json na pasta de saída. As funções de extração
+# recebem a etapa em curso no parâmetro opcional progresso.
 
 # -------------------------------------------------------------
 # ========== BLOCO B - FUNÇÕES DE LEITURA E AUDITORIA ==========
@@ -55,316 +61,1494 @@ def safe_float(x):
     except Exception:
         return math.nan
 
-def parse_date(s):
-    if not s:
-        return None
-    for fmt in ("%Y-%m-%d %H:%M:%S %z", "%Y-%m-%d %H:%M:%S",
-                "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d"):
-        try:
-            return datetime.strptime(s, fmt)
-        except Exception:
-            pass
-    return None
+class AcumuladorTipo:
+    """
+    Estatísticas de um tipo HK acumuladas em fluxo, durante a extração:
+    contagem, soma/mín/máx dos valores numéricos e primeiro/último horário.
+    """
+
+    __slots__ = ("registros", "valores", "soma", "minimo", "maximo",
+                 "t_inicio", "inicio", "t_fim", "fim")
+
+    def __init__(self):
+        self.registros = 0
+        self.valores = 0
+        self.soma = 0.0
+        self.minimo = None
+        self.maximo = None
+        self.t_inicio = self.inicio = None
+        self.t_fim = self.fim = None
+
+    def adicionar(self, valor, inicio, fim):
+        self.registros += 1
+        if valor:
+            v = safe_float(valor)
+            if not math.isnan(v):
+                self.valores += 1
+                self.soma += v
+                if self.minimo is None or v < self.minimo:
+                    self.minimo = v
+                if self.maximo is None or v > self.maximo:
+                    self.maximo = v
+        ts = epoch_apple(inicio)[0]
+        if ts is None:
+            return
+        te = epoch_apple(fim)[0]
+        if te is None:
+            te, fim = ts, inicio
+        if self.t_inicio is None or ts < self.t_inicio:
+            self.t_inicio, self.inicio = ts, inicio
+        if self.t_fim is None or te > self.t_fim:
+            self.t_fim, self.fim = te, fim
+
+    def mesclar(self, outro):
+        self.registros += outro.registros
+        self.valores += outro.valores
+        self.soma += outro.soma
+        if outro.minimo is not None and (self.minimo is None or outro.minimo < self.minimo):
+            self.minimo = outro.minimo
+        if outro.maximo is not None and (self.maximo is None or outro.maximo > self.maximo):
+            self.maximo = outro.maximo
+        if outro.t_inicio is not None and (self.t_inicio is None or outro.t_inicio < self.t_inicio):
+            self.t_inicio, self.inicio = outro.t_inicio, outro.inicio
+        if outro.t_fim is not None and (self.t_fim is None or outro.t_fim > self.t_fim):
+            self.t_fim, self.fim = outro.t_fim, outro.fim
+
+    @property
+    def media(self):
+        return self.soma / self.valores if self.valores else None
+
+    def como_dict(self):
+        return {
+            "registros": self.registros, "valores": self.valores, "soma": self.soma,
+            "min": self.minimo, "max": self.maximo, "media": self.media,
+            "inicio": self.inicio, "fim": self.fim,
+            "inicio_epoch": self.t_inicio, "fim_epoch": self.t_fim,
+        }
+
+    @classmethod
+    def de_dict(cls, d):
+        acc = cls()
+        acc.registros, acc.valores, acc.soma = d["registros"], d["valores"], d["soma"]
+        acc.minimo, acc.maximo = d["min"], d["max"]
+        acc.t_inicio, acc.inicio = d["inicio_epoch"], d["inicio"]
+        acc.t_fim, acc.fim = d["fim_epoch"], d["fim"]
+        return acc
+
+
+class AuditoriaOnline:
+    """Acumuladores por tipo HK, alimentados registro a registro."""
+
+    def __init__(self):
+        self.tipos = {}
+
+    def registrar(self, r):
+        tipo = r.get("type") or ""
+        acc = self.tipos.get(tipo)
+        if acc is None:
+            acc = self.tipos[tipo] = AcumuladorTipo()
+        acc.adicionar(r.get("value"), r.get("startDate"), r.get("endDate"))
+
+    def mesclar(self, outra):
+        for tipo, acc in outra.tipos.items():
+            if tipo in self.tipos:
+                self.tipos[tipo].mesclar(acc)
+            else:
+                self.tipos[tipo] = acc
+
+    @property
+    def total(self):
+        return sum(acc.registros for acc in self.tipos.values())
+
+    def dominio(self, nome):
+        """Acumulador do domínio: soma dos tipos cujos registros vão para export_<nome>.csv."""
+        acc = AcumuladorTipo()
+        for tipo in sorted(self.tipos):
+            if nome in dominios_do_tipo(tipo):
+                acc.mesclar(self.tipos[tipo])
+        return acc
+
+    def como_dict(self):
+        return {
+            "gerado_em": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+            "total_registros": self.total,
+            "tipos": {t: self.tipos[t].como_dict() for t in sorted(self.tipos)},
+            "dominios": {n: self.dominio(n).como_dict() for n in DOMINIOS},
+        }
 
-def periodo(rows, start="startDate", end="endDate"):
-    dmin, dmax = None, None
-    for r in rows:
-        s = parse_date(r.get(start) or r.get(start.capitalize()))
-        e = parse_date(r.get(end) or r.get(end.capitalize())) or s
-        if s:
-            dmin = s if (dmin is None or s < dmin) else dmin
-            dmax = e if (dmax is None or e > dmax) else dmax
-    return dmin, dmax
-
-def gerar_auditoria_simplificada(outdir):
-    """Cria audit_simplificado.txt com resumo básico"""
+    @classmethod
+    def carregar(cls, path):
+        aud = cls()
+        dados = json.loads(Path(path).read_text(encoding="utf-8"))
+        aud.tipos = {t: AcumuladorTipo.de_dict(d) for t, d in dados.get("tipos", {}).items()}
+        return aud
+
+    @classmethod
+    def da_tabela(cls, tabela, inicio=0):
+        """Acumuladores das linhas de uma TabelaRegistros (a partir de inicio), sem dicts."""
+        aud = cls()
+        for tipo, d in tabela.resumo_por_tipo(inicio).items():
+            acc = AcumuladorTipo()
+            acc.registros, acc.valores, acc.soma = d["registros"], d["valores"], d["soma"]
+            acc.minimo, acc.maximo = d["min"], d["max"]
+            if d["inicio"] is not None:
+                acc.t_inicio, acc.inicio = d["inicio"][0], texto_apple(*d["inicio"])
+                acc.t_fim, acc.fim = d["fim"][0], texto_apple(*d["fim"])
+            tipo = tipo or ""
+            if tipo in aud.tipos:
+                aud.tipos[tipo].mesclar(acc)
+            else:
+                aud.tipos[tipo] = acc
+        return aud
+
+    @classmethod
+    def do_csv(cls, path):
+        """Reconstrói os acumuladores lendo o export_master.csv em fluxo (um passe)."""
+        aud = cls()
+        with open(path, encoding="utf-8", errors="ignore", newline="") as f:
+            for r in csv.DictReader(f):
+                aud.registrar(r)
+        return aud
+
+
+def gerar_auditoria_simplificada(outdir, auditoria=None):
+    """
+    Cria audit_simplificado.txt (resumo básico) e audit_simplificado.json
+    (acumuladores por tipo HK e por domínio) a partir da AuditoriaOnline
+    montada durante a extração. Sem ela, os acumuladores são refeitos a
+    partir do export_master.csv.
+    """
     outdir = Path(outdir)
     out_txt = outdir / "audit_simplificado.txt"
+    out_json = outdir / "audit_simplificado.json"
 
-    def ler_csv(nome):
-        p = outdir / nome
-        return list(csv.DictReader(open(p, encoding="utf-8", errors="ignore"))) if p.exists() else []
-
-    master = ler_csv("export_master.csv")
-    cardiaco = ler_csv("export_cardiaco.csv")
-    passos = ler_csv("export_passos.csv")
-    sono = ler_csv("export_sono.csv")
-    resp = ler_csv("export_respiracao.csv")
-    energia = ler_csv("export_energia.csv")
+    if auditoria is None:
+        master_csv = outdir / "export_master.csv"
+        auditoria = AuditoriaOnline.do_csv(master_csv) if master_csv.exists() else AuditoriaOnline()
 
     lines = [f"Auditoria Simplificada — {datetime.now():%Y-%m-%d %H:%M:%S}", ""]
-    lines.append(f"Total de registros (master): {len(master):,}".replace(",", "."))
+    lines.append(f"Total de registros (master): {auditoria.total:,}".replace(",", "."))
+
+    def periodo(acc):
+        return parse_date(acc.inicio), parse_date(acc.fim)
 
     # Cardíaco
-    if cardiaco:
-        vals = [safe_float(r.get("value") or r.get("Value")) for r in cardiaco if r.get("value")]
-        vals = [v for v in vals if not math.isnan(v)]
+    cardiaco = auditoria.dominio("cardiaco")
+    if cardiaco.registros:
         dmin, dmax = periodo(cardiaco)
         lines.append("\n🩺 Cardíaco:")
-        lines.append(f"  Registros: {len(cardiaco):,}".replace(",", "."))
+        lines.append(f"  Registros: {cardiaco.registros:,}".replace(",", "."))
         if dmin and dmax:
             lines.append(f"  Período: {dmin:%d/%m/%Y %H:%M} → {dmax:%d/%m/%Y %H:%M}")
-        if vals:
-            lines.append(f"  BPM (média/máx/mín): {sum(vals)/len(vals):.1f} / {max(vals):.1f} / {min(vals):.1f}")
+        if cardiaco.valores:
+            lines.append(f"  BPM (média/máx/mín): {cardiaco.media:.1f} / {cardiaco.maximo:.1f} / {cardiaco.minimo:.1f}")
 
     # Passos
-    if passos:
-        total = sum(safe_float(r.get("value")) for r in passos)
+    passos = auditoria.dominio("passos")
+    if passos.registros:
         dmin, dmax = periodo(passos)
         lines.append("\n🚶‍♂️ Passos:")
-        lines.append(f"  Registros: {len(passos):,}".replace(",", "."))
+        lines.append(f"  Registros: {passos.registros:,}".replace(",", "."))
         if dmin and dmax:
             lines.append(f"  Período: {dmin:%d/%m/%Y} → {dmax:%d/%m/%Y}")
-        lines.append(f"  Total de passos: {int(total):,}".replace(",", "."))
-        lines.append(f"  Média por registro: {int(total/len(passos)):,} passos".replace(",", "."))
+        lines.append(f"  Total de passos: {int(passos.soma):,}".replace(",", "."))
+        lines.append(f"  Média por registro: {int(passos.soma/passos.registros):,} passos".replace(",", "."))
 
     # Sono
-    if sono:
+    sono = auditoria.dominio("sono")
+    if sono.registros:
         dmin, dmax = periodo(sono)
         lines.append("\n😴 Sono:")
-        lines.append(f"  Registros: {len(sono):,}".replace(",", "."))
+        lines.append(f"  Registros: {sono.registros:,}".replace(",", "."))
         if dmin and dmax:
             lines.append(f"  Período: {dmin:%d/%m/%Y} → {dmax:%d/%m/%Y}")
 
     # Respiração
-    if resp:
-        vals = [safe_float(r.get("value")) for r in resp if r.get("value")]
-        vals = [v for v in vals if not math.isnan(v)]
+    resp = auditoria.dominio("respiracao")
+    if resp.registros:
         dmin, dmax = periodo(resp)
         lines.append("\n🌬️ Respiração:")
-        lines.append(f"  Registros: {len(resp):,}".replace(",", "."))
+        lines.append(f"  Registros: {resp.registros:,}".replace(",", "."))
         if dmin and dmax:
             lines.append(f"  Período: {dmin:%d/%m/%Y} → {dmax:%d/%m/%Y}")
-        if vals:
-            lines.append(f"  Média de respirações: {sum(vals)/len(vals):.2f} rpm")
+        if resp.valores:
+            lines.append(f"  Média de respirações: {resp.media:.2f} rpm")
 
     # Energia
-    if energia:
-        total = sum(safe_float(r.get("value")) for r in energia if r.get("value"))
+    energia = auditoria.dominio("energia")
+    if energia.registros:
         dmin, dmax = periodo(energia)
         lines.append("\n⚡ Energia:")
-        lines.append(f"  Registros: {len(energia):,}".replace(",", "."))
+        lines.append(f"  Registros: {energia.registros:,}".replace(",", "."))
         if dmin and dmax:
             lines.append(f"  Período: {dmin:%d/%m/%Y} → {dmax:%d/%m/%Y}")
-        lines.append(f"  Energia total: {total:.2f} kcal")
+        lines.append(f"  Energia total: {energia.soma:.2f} kcal")
 
     out_txt.write_text("\n".join(lines), encoding="utf-8")
+    out_json.write_text(json.dumps(auditoria.como_dict(), ensure_ascii=False, indent=1), encoding="utf-8")
     print(f"[AUDIT] Gerado: {out_txt}")
+    print(f"[AUDIT] Gerado: {out_json}")
 
 # -------------------------------------------------------------
 # ========== BLOCO C - PROCESSAMENTO DOS XMLs =================
 # -------------------------------------------------------------
 
-def processar_exportacao(indir, outdir, gerar_excel=False):
+# Atributos dos elementos <Record> do export.xml. O cabeçalho dos CSVs é fixo
+# (em ordem alfabética, como nas versões anteriores) para que as linhas possam
+# ser gravadas à medida que são lidas, sem conhecer o arquivo inteiro antes.
+CAMPOS_RECORD = sorted([
+    "creationDate", "device", "endDate", "sourceName", "sourceVersion",
+    "startDate", "type", "unit", "value",
+])
+CAMPOS_RECORD_SET = frozenset(CAMPOS_RECORD)
+
+# Demais filhos da raiz extraídos no mesmo passe. Workout e ActivitySummary
+# são poucos e vêm inteiros em cada export: as suas tabelas são reescritas a
+# cada execução. Os MetadataEntry dos <Record> acompanham os registros
+# (no modo incremental, só os dos registros novos).
+TAGS_EXPORT = ("Record", "Workout", "ActivitySummary")
+
+CAMPOS_METADADOS = ["type", "sourceName", "startDate", "endDate", "key", "value"]
+CAMPOS_WORKOUT = [
+    "workout_id", "workoutActivityType", "duration", "durationUnit",
+    "totalDistance", "totalDistanceUnit", "totalEnergyBurned", "totalEnergyBurnedUnit",
+    "sourceName", "sourceVersion", "device", "creationDate", "startDate", "endDate", "rota",
+]
+CAMPOS_WORKOUT_METADADOS = ["workout_id", "key", "value"]
+CAMPOS_WORKOUT_EVENTOS = ["workout_id", "type", "date", "duration", "durationUnit"]
+CAMPOS_WORKOUT_ESTATISTICAS = ["workout_id", "type", "startDate", "endDate",
+                               "average", "minimum", "maximum", "sum", "unit"]
+CAMPOS_ACTIVITY_SUMMARY = [
+    "dateComponents", "activeEnergyBurned", "activeEnergyBurnedGoal", "activeEnergyBurnedUnit",
+    "appleMoveTime", "appleMoveTimeGoal", "appleExerciseTime", "appleExerciseTimeGoal",
+    "appleStandHours", "appleStandHoursGoal",
+]
+# arquivo -> (campos, acompanha o modo incremental)
+SAIDAS_ELEMENTOS = {
+    "export_metadados.csv": (CAMPOS_METADADOS, True),
+    "export_workouts.csv": (CAMPOS_WORKOUT, False),
+    "export_workout_metadados.csv": (CAMPOS_WORKOUT_METADADOS, False),
+    "export_workout_eventos.csv": (CAMPOS_WORKOUT_EVENTOS, False),
+    "export_workout_estatisticas.csv": (CAMPOS_WORKOUT_ESTATISTICAS, False),
+    "export_activity_summary.csv": (CAMPOS_ACTIVITY_SUMMARY, False),
+}
+
+# Domínios principais (export_<domínio>.csv) e os tipos HK de cada um vêm de
+# catalogo_metricas.DOMINIOS
+
+
+class FiltroRecords:
+    """
+    Filtro de tipos aplicado aos bytes do export.xml antes do parser: os
+    <Record> de primeiro nível cujo type não foi pedido são removidos do
+    texto (com os seus filhos), sem passar pelo expat nem virar dict de
+    atributos. Usa o layout do export da Apple (um filho da raiz por linha,
+    com um espaço de indentação, e type como primeiro atributo); o que não
+    seguir esse layout passa adiante e é descartado depois, pelo type.
+    """
+
+    def __init__(self, tipos):
+        pedidos = b"|".join(re.escape(t.encode("utf-8")) for t in sorted(tipos))
+        self._regex = re.compile(
+            # linha do <Record> inteira e, se ele tem filhos, as linhas mais
+            # indentadas até o </Record>, casadas linha a linha
+            rb'\n <Record type="(?!(?:' + pedidos + rb')")[^\n]*(?:/>|[^/\n]>(?:\n  [^\n]*)*\n </Record>)')
+        self._resto = b""
+
+    def filtrar(self, dados):
+        """Bytes filtrados de um pedaço; o último filho da raiz, talvez incompleto, fica para o próximo."""
+        dados = self._resto + dados
+        # corta no início do último filho da raiz (não em um </Record>, nem
+        # em um "\n <" no fim do pedaço, que ainda pode ser um)
+        corte = dados.rfind(b"\n <")
+        while corte >= 0 and dados[corte + 3:corte + 4] in (b"/", b""):
+            corte = dados.rfind(b"\n <", 0, corte)
+        if corte < 0:
+            self._resto = dados
+            return b""
+        self._resto = dados[corte:]
+        return self._regex.sub(b"", dados[:corte])
+
+    def final(self):
+        """Filtra o que sobrou no fim da entrada."""
+        dados, self._resto = self._resto + b"\n", b""
+        return self._regex.sub(b"", dados)[:-1]
+
+
+class LeituraFiltrada:
+    """Arquivo binário cujo read() devolve os bytes já passados por um FiltroRecords."""
+
+    def __init__(self, f, filtro):
+        self._f = f
+        self._filtro = filtro
+        self._fim = False
+
+    def read(self, n=-1):
+        # b"" só no fim do arquivo (é o sinal de EOF para o iterparse)
+        while not self._fim:
+            dados = self._f.read(n if n and n > 0 else BLOCO_LEITURA)
+            if not dados:
+                self._fim = True
+                return self._filtro.final()
+            saida = self._filtro.filtrar(dados)
+            if saida:
+                return saida
+        return b""
+
+
+def _filhos_da_raiz(eventos, tags=None):
+    """
+    Recebe eventos ("start"/"end", elem) de um parser incremental e entrega
+    os filhos diretos da raiz já completos (com seus filhos), liberando cada
+    um em seguida. A memória fica constante, qualquer que seja o tamanho do XML.
+    """
+    raiz = None
+    nivel = 0
+    for evento, elem in eventos:
+        if evento == "start":
+            if raiz is None:
+                raiz = elem
+            nivel += 1
+            continue
+        nivel -= 1
+        if nivel != 1:
+            continue
+        if tags is None or elem.tag in tags:
+            yield elem
+        # descarta o elemento já tratado e a referência mantida pela raiz
+        elem.clear()
+        raiz.clear()
+
+
+def iterar_elementos(xml_path, tags=None, progresso=None, tipos=None):
+    """
+    Percorre os filhos diretos da raiz do XML com ET.iterparse. Aceita um
+    Path ou um MembroZip (lido em streaming de dentro do export.zip). Com
+    progresso (instrumentacao.Etapa), soma em progresso.bytes o que foi lido.
+    Com tipos, os <Record> de outros tipos são cortados antes do parser
+    (FiltroRecords).
+    """
+    with xml_path.open("rb") as f:
+        fonte = f if progresso is None else LeituraContada(f, progresso)
+        if tipos is not None:
+            fonte = LeituraFiltrada(fonte, FiltroRecords(tipos))
+        yield from _filhos_da_raiz(ET.iterparse(fonte, events=("start", "end")), tags)
+
+
+def tamanho_entrada(xml_path):
+    """Bytes (descomprimidos) de um Path ou MembroZip, para o percentual de progresso."""
+    return xml_path.tamanho if isinstance(xml_path, MembroZip) else xml_path.stat().st_size
+
+
+# ---------- Entrada: pasta extraída ou export.zip ----------------------------
+
+class MembroZip:
+    """
+    Arquivo dentro do export.zip, lido direto do ZIP (sem extrair para o
+    disco). Imita o pouco que os leitores usam de Path: name, stem, open().
+    relativo é o caminho a partir da pasta do export.xml no ZIP.
+    """
+
+    def __init__(self, zip_path, nome, relativo, tamanho=None):
+        self.zip_path = str(zip_path)
+        self.nome = nome
+        self.relativo = relativo
+        self.tamanho = tamanho
+        self.name = nome.rsplit("/", 1)[-1]
+        self.stem = self.name.rsplit(".", 1)[0]
+
+    def open(self, mode="rb"):
+        # o ZipFile pode ser fechado: o arquivo subjacente fica aberto até o
+        # membro ser fechado
+        with zipfile.ZipFile(self.zip_path) as zf:
+            return zf.open(self.nome)
+
+    def __str__(self):
+        return f"{Path(self.zip_path).name}:{self.nome}"
+
+
+def eh_zip(indir):
+    indir = Path(indir)
+    return indir.is_file() and zipfile.is_zipfile(indir)
+
+
+def _eh_export_principal(nome):
+    return fnmatch.fnmatch(nome, "export*.xml") and "cda" not in nome
+
+
+def membros_zip(zip_path):
+    """MembroZip de todos os arquivos do ZIP, relativos à pasta do export.xml."""
+    with zipfile.ZipFile(zip_path) as zf:
+        tamanhos = {i.filename: i.file_size for i in zf.infolist() if not i.is_dir()}
+    nomes = sorted(tamanhos)
+    # o export.zip da Apple traz tudo dentro de apple_health_export/
+    raiz = ""
+    for nome in nomes:
+        if _eh_export_principal(nome.rsplit("/", 1)[-1]):
+            raiz = nome[:nome.rfind("/") + 1]
+            break
+    return [MembroZip(zip_path, nome, nome[len(raiz):] if nome.startswith(raiz) else nome,
+                      tamanhos[nome])
+            for nome in nomes]
+
+
+def localizar_xml(indir, padrao, principal=False):
+    """
+    Primeiro XML de indir (pasta ou export.zip) cujo nome casa com padrao,
+    ou None. Com principal=True ignora o export_cda.xml, que também casa com
+    'export*.xml'.
+    """
+    indir = Path(indir)
+    if eh_zip(indir):
+        candidatos = [m for m in membros_zip(indir) if "/" not in m.relativo]
+    else:
+        candidatos = sorted(indir.glob("*.xml"))
+    for c in candidatos:
+        if fnmatch.fnmatch(c.name, padrao) and (not principal or _eh_export_principal(c.name)):
+            return c
+    return None
+
+
+class _GravadorCSV:
+    """
+    CSV de saída aberto durante toda a execução. O arquivo só é criado no
+    primeiro registro (domínios sem dados não geram arquivo vazio).
+    """
+
+    def __init__(self, path, fieldnames, anexar=False, avisar=True):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.anexar = anexar
+        self.avisar = avisar
+        self.linhas = 0
+        self._f = None
+        self._w = None
+
+    def gravar(self, linha):
+        """Grava uma linha já montada como lista, na ordem de fieldnames."""
+        if self._w is None:
+            # no modo incremental acrescenta ao CSV existente (sem repetir o cabeçalho)
+            novo = not (self.anexar and self.path.exists() and self.path.stat().st_size > 0)
+            self._f = self.path.open("w" if novo else "a", newline="", encoding="utf-8")
+            self._w = csv.writer(self._f)
+            if novo:
+                self._w.writerow(self.fieldnames)
+        self._w.writerow(linha)
+        self.linhas += 1
+
+    def fechar(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+            if self.avisar:
+                print(f"[OK] Gerado: {self.path}")
+
+
+class _GravadorParquet:
+    """
+    Grava os registros em um dataset Parquet particionado por tipo HK e ano
+    (layout hive: parquet/type=<tipo>/year=<ano>/part-NNNNN.parquet).
+    Datas viram int64 (epoch UTC, em segundos) + offset em minutos, valores
+    numéricos viram float64 e as strings repetidas são dictionary-encoded.
+    As linhas ficam em buffers por partição e são descarregadas em blocos.
+    """
+
+    LIMITE_BUFFER = 250_000
+
+    SCHEMA = None if pa is None else pa.schema([
+        ("sourceName", pa.dictionary(pa.int32(), pa.string())),
+        ("sourceVersion", pa.dictionary(pa.int32(), pa.string())),
+        ("unit", pa.dictionary(pa.int32(), pa.string())),
+        ("device", pa.dictionary(pa.int32(), pa.string())),
+        ("creationDate", pa.int64()),
+        ("startDate", pa.int64()),
+        ("endDate", pa.int64()),
+        ("tzOffsetMin", pa.int16()),
+        ("value", pa.float64()),
+        ("valueText", pa.dictionary(pa.int32(), pa.string())),
+    ])
+
+    def __init__(self, pasta, prefixo="part", avisar=True):
+        self.pasta = Path(pasta)
+        self.prefixo = prefixo
+        self.avisar = avisar
+        self.buffers = {}
+        self.partes = {}
+        self.pendentes = 0
+        self.linhas = 0
+
+    def gravar(self, r):
+        tipo = r.get("type") or "desconhecido"
+        inicio = r.get("startDate") or ""
+        chave = (tipo, inicio[:4] if inicio[:4].isdigit() else "0")
+        buf = self.buffers.get(chave)
+        if buf is None:
+            buf = self.buffers[chave] = {n: [] for n in self.SCHEMA.names}
+
+        start, offset = epoch_apple(inicio)
+        valor = r.get("value")
+        num = safe_float(valor) if valor is not None else math.nan
+        buf["sourceName"].append(r.get("sourceName"))
+        buf["sourceVersion"].append(r.get("sourceVersion"))
+        buf["unit"].append(r.get("unit"))
+        buf["device"].append(r.get("device"))
+        buf["creationDate"].append(epoch_apple(r.get("creationDate"))[0])
+        buf["startDate"].append(start)
+        buf["endDate"].append(epoch_apple(r.get("endDate"))[0])
+        buf["tzOffsetMin"].append(offset)
+        buf["value"].append(num)
+        buf["valueText"].append(valor if math.isnan(num) else None)
+
+        self.pendentes += 1
+        self.linhas += 1
+        if self.pendentes >= self.LIMITE_BUFFER:
+            self.descarregar()
+
+    def descarregar(self):
+        for (tipo, ano), buf in self.buffers.items():
+            if not buf["startDate"]:
+                continue
+            n = self.partes.get((tipo, ano), 0)
+            self.partes[(tipo, ano)] = n + 1
+            destino = self.pasta / f"type={tipo}" / f"year={ano}"
+            destino.mkdir(parents=True, exist_ok=True)
+            colunas = []
+            for campo in self.SCHEMA:
+                if pa.types.is_dictionary(campo.type):
+                    colunas.append(pa.array(buf[campo.name], type=pa.string()).dictionary_encode())
+                else:
+                    colunas.append(pa.array(buf[campo.name], type=campo.type))
+            tabela = pa.Table.from_arrays(colunas, schema=self.SCHEMA)
+            pq.write_table(tabela, destino / f"{self.prefixo}-{n:05d}.parquet")
+            for lista in buf.values():
+                lista.clear()
+        self.pendentes = 0
+
+    def fechar(self):
+        self.descarregar()
+        if self.linhas and self.avisar:
+            print(f"[OK] Gerado: {self.pasta} ({len(self.partes)} partições tipo/ano)")
+
+
+class _GravadorExcel:
+    """
+    Planilha export_master.xlsx gravada linha a linha pelo xlsxwriter em modo
+    constant_memory (memória constante, sem passar pelo pandas). Ao atingir o
+    limite de linhas do Excel, continua em uma nova aba (export_master_2, ...).
+    """
+
+    LIMITE_LINHAS = 1_048_576  # inclui a linha de cabeçalho
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = fieldnames
+        self.i_valor = fieldnames.index("value") if "value" in fieldnames else None
+        self.wb = xlsxwriter.Workbook(str(path), {"constant_memory": True})
+        self.ws = None
+        self.abas = 0
+        self.linha = 0
+        self.linhas = 0
+
+    def _nova_aba(self):
+        self.abas += 1
+        nome = "export_master" if self.abas == 1 else f"export_master_{self.abas}"
+        self.ws = self.wb.add_worksheet(nome)
+        self.ws.write_row(0, 0, self.fieldnames)
+        self.linha = 1
+
+    def gravar(self, linha):
+        if self.ws is None or self.linha >= self.LIMITE_LINHAS:
+            self._nova_aba()
+        if self.i_valor is not None and linha[self.i_valor]:
+            v = safe_float(linha[self.i_valor])
+            if not math.isnan(v):
+                linha = list(linha)
+                linha[self.i_valor] = v
+        self.ws.write_row(self.linha, 0, linha)
+        self.linha += 1
+        self.linhas += 1
+
+    def fechar(self):
+        if self.ws is None:
+            self._nova_aba()
+        self.wb.close()
+        extra = f" ({self.abas} abas)" if self.abas > 1 else ""
+        print(f"[OK] Gerado: {self.path}{extra}")
+
+
+def exportar_excel_do_csv(master_csv, xlsx_path):
+    """Gera o export_master.xlsx lendo o CSV em fluxo (modo paralelo/incremental)."""
+    excel = _GravadorExcel(xlsx_path, CAMPOS_RECORD)
+    with open(master_csv, encoding="utf-8", newline="") as f:
+        leitor = csv.reader(f)
+        next(leitor, None)
+        for linha in leitor:
+            excel.gravar(linha)
+    excel.fechar()
+
+
+class _ManifestoIncremental:
+    """
+    Manifesto do modo incremental (manifesto_incremental.json no outdir do
+    participante). Os exports da Apple são cumulativos; para cada par
+    tipo/fonte guardamos a marca d'água (maior startDate já ingerido, em
+    epoch) e as impressões digitais dos registros próximos dessa marca.
+
+    Um registro é considerado já ingerido quando:
+      - começa antes de (marca - JANELA_S), ou
+      - começa dentro da janela e sua impressão já está no manifesto.
+    A janela cobre registros que chegam atrasados (sincronização do Watch).
+
+    Antes da janela os registros não são conferidos um a um. Para que um
+    registro que chegou mais atrasado que isso não se perca em silêncio, o
+    manifesto guarda também quantos registros de cada par já ingeridos
+    começam antes da janela ("anteriores"): se o export novo traz mais que
+    isso, a diferença é avisada (atrasados()) — só uma extração completa os
+    recupera. Registros sem startDate válido não têm marca: as impressões
+    deles ficam no manifesto sem prazo ("sem_data").
+    """
+
+    JANELA_S = 7 * 86400
+    VERSAO = 2
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.marcas = {}
+        self.impressoes = {}
+        self.sem_data = {}
+        self.anteriores = {}
+        if self.path.exists():
+            dados = json.loads(self.path.read_text(encoding="utf-8"))
+            self.marcas = dados.get("marcas", {})
+            self.impressoes = {k: dict(v) for k, v in dados.get("impressoes", {}).items()}
+            self.sem_data = {k: set(v) for k, v in dados.get("sem_data", {}).items()}
+            # manifestos da versão 1 não têm a contagem (sem aviso nesta execução)
+            self.anteriores = dados.get("anteriores", {})
+        self.existia = bool(self.marcas)
+        # limites da execução anterior (fixos durante o passe)
+        self._corte = {k: m - self.JANELA_S for k, m in self.marcas.items()}
+        self._vistos = {k: set(v) for k, v in self.impressoes.items()}
+        for k, fps in self.sem_data.items():
+            self._vistos.setdefault(k, set()).update(fps)
+        self._na_janela = {k: len(v) for k, v in self.impressoes.items()}
+        self.novos = 0
+        self.ignorados = 0
+        # por par tipo/fonte: novos com data e registros do export antes do corte
+        self.novos_chave = {}
+        self.antes_chave = {}
+
+    @staticmethod
+    def impressao(r):
+        texto = "\x1f".join(r.get(c) or "" for c in CAMPOS_RECORD)
+        return hashlib.blake2b(texto.encode("utf-8"), digest_size=8).hexdigest()
+
+    def eh_novo(self, r):
+        """Decide se o registro ainda não foi ingerido e atualiza o manifesto."""
+        chave = f"{r.get('type') or ''}|{r.get('sourceName') or ''}"
+        inicio = epoch_apple(r.get("startDate"))[0]
+        corte = self._corte.get(chave)
+        if inicio is not None and corte is not None and inicio < corte:
+            self.antes_chave[chave] = self.antes_chave.get(chave, 0) + 1
+            self.ignorados += 1
+            return False
+
+        fp = self.impressao(r)
+        if fp in self._vistos.get(chave, ()):
+            self.ignorados += 1
+            return False
+
+        if inicio is None:
+            self.sem_data.setdefault(chave, set()).add(fp)
+        else:
+            marca = self.marcas.get(chave)
+            if marca is None or inicio > marca:
+                self.marcas[chave] = marca = inicio
+            if inicio >= marca - self.JANELA_S:
+                self.impressoes.setdefault(chave, {})[fp] = inicio
+            self.novos_chave[chave] = self.novos_chave.get(chave, 0) + 1
+        self.novos += 1
+        return True
+
+    def atrasados(self):
+        """{par tipo/fonte: registros antes da janela além dos já ingeridos}."""
+        return {k: n - self.anteriores[k] for k, n in sorted(self.antes_chave.items())
+                if k in self.anteriores and n > self.anteriores[k]}
+
+    def estado(self):
+        """Parte mesclável do manifesto (usada pelos processos do modo paralelo)."""
+        return {"marcas": self.marcas, "impressoes": self.impressoes,
+                "sem_data": {k: sorted(v) for k, v in self.sem_data.items()},
+                "novos": self.novos, "ignorados": self.ignorados,
+                "novos_chave": self.novos_chave, "antes_chave": self.antes_chave}
+
+    def mesclar(self, estado):
+        for chave, marca in estado["marcas"].items():
+            if chave not in self.marcas or marca > self.marcas[chave]:
+                self.marcas[chave] = marca
+        for chave, fps in estado["impressoes"].items():
+            self.impressoes.setdefault(chave, {}).update(fps)
+        for chave, fps in estado["sem_data"].items():
+            self.sem_data.setdefault(chave, set()).update(fps)
+        for campo in ("novos_chave", "antes_chave"):
+            contagem = getattr(self, campo)
+            for chave, n in estado[campo].items():
+                contagem[chave] = contagem.get(chave, 0) + n
+        self.novos += estado["novos"]
+        self.ignorados += estado["ignorados"]
+
+    def salvar(self):
+        # mantém só as impressões dentro da janela da nova marca d'água; as que
+        # saem dela passam a contar em "anteriores"
+        impressoes, anteriores = {}, {}
+        for chave in self.marcas:
+            limite = self.marcas[chave] - self.JANELA_S
+            manter = {fp: t for fp, t in self.impressoes.get(chave, {}).items() if t >= limite}
+            if manter:
+                impressoes[chave] = manter
+            # ingeridos com data = anteriores + na janela (execução anterior) + novos
+            base = self.anteriores.get(chave, self.antes_chave.get(chave, 0))
+            total = base + self._na_janela.get(chave, 0) + self.novos_chave.get(chave, 0)
+            anteriores[chave] = total - len(manter)
+        dados = {
+            "versao": self.VERSAO,
+            "atualizado_em": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+            "marcas": self.marcas,
+            "anteriores": anteriores,
+            "impressoes": impressoes,
+            "sem_data": {k: sorted(v) for k, v in self.sem_data.items()},
+        }
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(dados, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.path)
+
+
+def incremental_anexa(outdir):
+    """True se a extração incremental em outdir acrescenta a uma anterior (há manifesto)."""
+    return _ManifestoIncremental(Path(outdir) / "manifesto_incremental.json").existia
+
+
+def dominios_do_tipo(tipo):
+    """Domínios (0 ou 1) em que o tipo HK é gravado, pelo catalogo_metricas."""
+    dominio = dominio_do_tipo(tipo)
+    return [dominio] if dominio else []
+
+
+class _Despacho:
+    """
+    Tabela de despacho tipo HK -> gravadores de destino (master + domínios).
+    Cada tipo é resolvido uma única vez; os registros seguintes do mesmo tipo
+    usam a tupla já montada, em um único passe sobre o export.
+    """
+
+    def __init__(self, master, gravadores):
+        self.master = master
+        self.gravadores = gravadores
+        self.tabela = {}
+
+    def destinos(self, tipo):
+        alvo = self.tabela.get(tipo)
+        if alvo is None:
+            alvo = (self.master,) + tuple(self.gravadores[n] for n in dominios_do_tipo(tipo))
+            self.tabela[tipo] = alvo
+        return alvo
+
+    def fechar(self):
+        self.master.fechar()
+        for g in self.gravadores.values():
+            g.fechar()
+
+
+def id_workout(r):
+    """Identificador estável de um <Workout> (tipo, fonte e início), igual entre exports."""
+    texto = "\x1f".join(r.get(c) or "" for c in ("workoutActivityType", "sourceName", "startDate"))
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=6).hexdigest()
+
+
+class _ExtratorRecords:
+    """
+    Estado de um passe de extração sobre os <Record>: despacho para os CSVs,
+    Parquet opcional e manifesto incremental. Usado tanto no passe serial
+    quanto em cada bloco do modo paralelo. Os <Workout> (com eventos,
+    estatísticas, metadados e rota), os <ActivitySummary> e os MetadataEntry
+    dos registros vão para as tabelas de SAIDAS_ELEMENTOS no mesmo passe; os
+    batimentos das medições de HRV, para o armazenamento de batimentos_hrv.
+
+    Com uma TabelaRegistros, os registros também vão para a tabela em
+    memória e a auditoria é calculada dela ao fim do passe (vetorizada),
+    em vez de registro a registro.
+
+    Com tipos (conjunto de tipos HK), os <Record> de outros tipos são
+    ignorados; em geral já chegam cortados pelo FiltroRecords.
+    """
+
+    def __init__(self, outdir, anexar=False, avisar=True, parquet=None, manifesto=None,
+                 excel=None, tabela=None, progresso=None, tipos=None):
+        outdir = Path(outdir)
+        self.despacho = _Despacho(
+            _GravadorCSV(outdir / "export_master.csv", CAMPOS_RECORD, anexar=anexar, avisar=avisar),
+            {nome: _GravadorCSV(outdir / f"export_{nome}.csv", CAMPOS_RECORD, anexar=anexar, avisar=avisar)
+             for nome in DOMINIOS},
+        )
+        self.parquet = parquet
+        self.manifesto = manifesto
+        self.excel = excel
+        self.tabela = tabela
+        self.progresso = progresso
+        self.tipos = tipos
+        self.auditoria = AuditoriaOnline()
+        self.campos_extras = set()
+        self.elementos = {
+            nome: _GravadorCSV(outdir / nome, campos, anexar=anexar and incremental, avisar=avisar)
+            for nome, (campos, incremental) in SAIDAS_ELEMENTOS.items()
+        }
+        self.hrv = (GravadorBatimentos(outdir / PASTA_HRV, anexar=anexar, avisar=avisar)
+                    if GravadorBatimentos is not None else None)
+
+    def consumir(self, elementos):
+        tabela = self.tabela
+        inicio_tabela = len(tabela) if tabela is not None else 0
+        progresso = self.progresso
+        tipos = self.tipos
+        n = 0
+        for n, elem in enumerate(elementos, 1):
+            if progresso is not None and not n & 0x3FF:
+                progresso.itens = n
+            if elem.tag != "Record":
+                self._outro_elemento(elem)
+                continue
+            r = elem.attrib
+            if tipos is not None and r.get("type") not in tipos:
+                continue
+            if self.manifesto is not None and not self.manifesto.eh_novo(r):
+                continue
+            if not CAMPOS_RECORD_SET.issuperset(r):
+                self.campos_extras.update(k for k in r if k not in CAMPOS_RECORD_SET)
+            linha = [r.get(c) for c in CAMPOS_RECORD]
+            for g in self.despacho.destinos(r.get("type")):
+                g.gravar(linha)
+            if tabela is not None:
+                tabela.adicionar(r)
+            else:
+                self.auditoria.registrar(r)
+            if self.parquet is not None:
+                self.parquet.gravar(r)
+            if self.excel is not None:
+                self.excel.gravar(linha)
+            if len(elem):
+                self._filhos_record(elem, r)
+        if progresso is not None:
+            progresso.itens = n
+        if tabela is not None:
+            self.auditoria.mesclar(AuditoriaOnline.da_tabela(tabela, inicio_tabela))
+
+    def _filhos_record(self, elem, r):
+        chave = [r.get("type"), r.get("sourceName"), r.get("startDate"), r.get("endDate")]
+        for filho in elem:
+            if filho.tag == "MetadataEntry":
+                self.elementos["export_metadados.csv"].gravar(chave + [filho.get("key"), filho.get("value")])
+            elif filho.tag == "HeartRateVariabilityMetadataList" and self.hrv is not None:
+                self.hrv.adicionar(r, filho)
+
+    def _outro_elemento(self, elem):
+        r = elem.attrib
+        if elem.tag == "ActivitySummary":
+            self.elementos["export_activity_summary.csv"].gravar(
+                [r.get(c) for c in CAMPOS_ACTIVITY_SUMMARY])
+            return
+
+        # <Workout>
+        wid = id_workout(r)
+        rota = None
+        for filho in elem:
+            a = filho.attrib
+            if filho.tag == "MetadataEntry":
+                self.elementos["export_workout_metadados.csv"].gravar([wid, a.get("key"), a.get("value")])
+            elif filho.tag == "WorkoutEvent":
+                self.elementos["export_workout_eventos.csv"].gravar(
+                    [wid] + [a.get(c) for c in CAMPOS_WORKOUT_EVENTOS[1:]])
+            elif filho.tag == "WorkoutStatistics":
+                self.elementos["export_workout_estatisticas.csv"].gravar(
+                    [wid] + [a.get(c) for c in CAMPOS_WORKOUT_ESTATISTICAS[1:]])
+            elif filho.tag == "WorkoutRoute" and rota is None:
+                ref = filho.find("FileReference")
+                rota = ref.get("path") if ref is not None else None
+        self.elementos["export_workouts.csv"].gravar(
+            [wid] + [r.get(c) for c in CAMPOS_WORKOUT[1:-1]] + [rota])
+
+    def fechar(self):
+        self.despacho.fechar()
+        for g in self.elementos.values():
+            g.fechar()
+        if self.hrv is not None:
+            self.hrv.fechar()
+        if self.parquet is not None:
+            self.parquet.fechar()
+        if self.excel is not None:
+            self.excel.fechar()
+
+
+# ---------- Modo paralelo: blocos de bytes alinhados em <Record -------------
+
+# No export.xml da Apple cada filho da raiz fica em uma linha com um espaço de
+# indentação; <Record> aninhados (dentro de <Correlation>) têm indentação maior.
+MARCA_RECORD = b"\n <Record"
+# Abaixo disso o custo de subir processos não compensa
+MIN_BYTES_PARALELO = 64 * 1024 * 1024
+BLOCO_LEITURA = 1024 * 1024
+
+
+def dividir_em_blocos(xml_path, n_blocos):
+    """
+    Divide o export.xml em até n_blocos faixas de bytes [inicio, fim); a
+    primeira começa logo após a tag <HealthData> e as demais em um <Record>
+    de primeiro nível. Devolve (prologo, faixas), onde prologo é o tamanho do
+    trecho inicial (declaração, DTD, <HealthData>) que cada bloco precisa
+    para ser analisado isoladamente, ou (0, []) se o arquivo não tem o
+    layout esperado. Os filhos da raiz anteriores ao primeiro <Record>
+    (ExportDate, Me...) ficam só no primeiro bloco.
+    """
+    with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        raiz = mm.find(b"<HealthData")
+        primeiro = mm.find(MARCA_RECORD)
+        fim_dados = mm.rfind(b"</HealthData>")
+        if raiz < 0 or primeiro < raiz or fim_dados < primeiro:
+            return 0, []
+        prologo = mm.find(b">", raiz) + 1
+        primeiro += 1
+        passo = max((fim_dados - primeiro) // n_blocos, 1)
+        cortes = [prologo]
+        for k in range(1, n_blocos):
+            pos = mm.find(MARCA_RECORD, max(primeiro + k * passo, cortes[-1]), fim_dados)
+            if pos < 0:
+                break
+            if pos + 1 > cortes[-1]:
+                cortes.append(pos + 1)
+        cortes.append(fim_dados)
+    return prologo, list(zip(cortes[:-1], cortes[1:]))
+
+
+def _eventos_do_bloco(mm, prologo, inicio, fim, tipos=None):
+    """
+    Alimenta um XMLPullParser com o prólogo + a faixa do mmap, em pedaços
+    (com tipos, passados antes pelo FiltroRecords).
+    """
+    filtro = FiltroRecords(tipos) if tipos is not None else None
+    parser = ET.XMLPullParser(events=("start", "end"))
+    parser.feed(mm[:prologo])
+    yield from parser.read_events()
+    for pos in range(inicio, fim, BLOCO_LEITURA):
+        pedaco = mm[pos:min(pos + BLOCO_LEITURA, fim)]
+        parser.feed(pedaco if filtro is None else filtro.filtrar(pedaco))
+        yield from parser.read_events()
+    if filtro is not None:
+        parser.feed(filtro.final())
+    parser.feed(b"</HealthData>")
+    parser.close()
+    yield from parser.read_events()
+
+
+def _extrair_bloco(xml_path, prologo, inicio, fim, pasta_bloco, pasta_parquet,
+                   prefixo_parquet, manifesto_path, com_tabela=False, tipos=None):
+    """Processo trabalhador: extrai uma faixa do export.xml para pasta_bloco."""
+    manifesto = _ManifestoIncremental(manifesto_path) if manifesto_path else None
+    parquet = (_GravadorParquet(pasta_parquet, prefixo=prefixo_parquet, avisar=False)
+               if pasta_parquet else None)
+    extrator = _ExtratorRecords(pasta_bloco, avisar=False, parquet=parquet, manifesto=manifesto,
+                                tabela=TabelaRegistros() if com_tabela else None, tipos=tipos)
+    with open(xml_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        try:
+            eventos = _eventos_do_bloco(mm, prologo, inicio, fim, tipos)
+            extrator.consumir(_filhos_da_raiz(eventos, tags=TAGS_EXPORT))
+        finally:
+            extrator.fechar()
+    return {
+        "campos_extras": extrator.campos_extras,
+        "auditoria": extrator.auditoria,
+        "manifesto": manifesto.estado() if manifesto is not None else None,
+        "tabela": extrator.tabela,
+    }
+
+
+def _juntar_partes(destino, partes, anexar):
+    """
+    Concatena, na ordem dos blocos, os CSVs parciais em destino (cabeçalho
+    uma única vez). O resultado é idêntico, byte a byte, ao do passe serial.
+    """
+    existentes = [p for p in partes if p.exists()]
+    if not existentes:
+        return False
+    novo = not (anexar and destino.exists() and destino.stat().st_size > 0)
+    with destino.open("wb" if novo else "ab") as out:
+        for i, parte in enumerate(existentes):
+            with parte.open("rb") as f:
+                cabecalho = f.readline()
+                if novo and i == 0:
+                    out.write(cabecalho)
+                shutil.copyfileobj(f, out, BLOCO_LEITURA)
+    return True
+
+
+def _extrair_paralelo(export_xml, outdir, processos, prologo, faixas, anexar,
+                      pasta_parquet, prefixo_parquet, manifesto, tabela=None, progresso=None,
+                      tipos=None):
+    """
+    Extrai as faixas em um pool de processos e junta as saídas em ordem. O
+    progresso avança a cada bloco concluído (bytes da faixa e registros).
+    """
+    pasta_blocos = outdir / ".blocos_paralelo"
+    if pasta_blocos.exists():
+        shutil.rmtree(pasta_blocos)
+    pastas = [pasta_blocos / f"b{i:04d}" for i in range(len(faixas))]
+    for pasta in pastas:
+        pasta.mkdir(parents=True)
+
+    manifesto_path = str(manifesto.path) if manifesto is not None else None
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        futuros = [
+            pool.submit(_extrair_bloco, str(export_xml), prologo, inicio, fim, str(pasta),
+                        str(pasta_parquet) if pasta_parquet else None,
+                        f"{prefixo_parquet}-b{i:04d}", manifesto_path, tabela is not None, tipos)
+            for i, ((inicio, fim), pasta) in enumerate(zip(faixas, pastas))
+        ]
+        if progresso is not None:
+            def bloco_concluido(futuro, n_bytes):
+                if futuro.exception() is None:
+                    progresso.avancar(n_bytes, futuro.result()["auditoria"].total)
+
+            for futuro, (inicio, fim) in zip(futuros, faixas):
+                futuro.add_done_callback(lambda f, n=fim - inicio: bloco_concluido(f, n))
+        resultados = [f.result() for f in futuros]
+
+    campos_extras = set()
+    auditoria = AuditoriaOnline()
+    for res in resultados:
+        campos_extras.update(res["campos_extras"])
+        auditoria.mesclar(res["auditoria"])
+        if manifesto is not None:
+            manifesto.mesclar(res["manifesto"])
+        if tabela is not None:
+            # blocos em ordem: a tabela fica igual à do passe serial
+            tabela.estender(res["tabela"])
+
+    saidas = [(nome, anexar) for nome in ["export_master.csv"] + [f"export_{n}.csv" for n in DOMINIOS]]
+    saidas += [(nome, anexar and incremental) for nome, (_, incremental) in SAIDAS_ELEMENTOS.items()]
+    for nome, anexar_saida in saidas:
+        if _juntar_partes(outdir / nome, [p / nome for p in pastas], anexar_saida):
+            print(f"[OK] Gerado: {outdir / nome}")
+    if GravadorBatimentos is not None and juntar_batimentos(outdir / PASTA_HRV,
+                                                            [p / PASTA_HRV for p in pastas], anexar):
+        print(f"[OK] Gerado: {outdir / PASTA_HRV}")
+    shutil.rmtree(pasta_blocos)
+    return campos_extras, auditoria
+
+
+def processar_exportacao(indir, outdir, gerar_excel=False, gerar_parquet=False,
+                         incremental=False, processos=1, tabela=None, progresso=None,
+                         tipos=None):
+    """
+    Converte os <Record> do export.xml em export_master.csv e nos CSVs por
+    domínio. Com gerar_parquet=True grava também o dataset colunar em
+    <outdir>/parquet (requer pyarrow).
+
+    Com incremental=True usa o manifesto_incremental.json do outdir para
+    pular os registros já ingeridos de exports anteriores do mesmo
+    participante e acrescenta apenas os novos às saídas existentes.
+
+    Com processos > 1 (e export.xml grande o bastante) o arquivo é dividido em
+    faixas de bytes alinhadas em <Record>, analisadas em um pool de processos
+    sobre o arquivo mapeado em memória; os CSVs resultantes são idênticos aos
+    do passe serial.
+
+    indir pode ser a pasta extraída ou o próprio export.zip; no ZIP o
+    export.xml é lido em streaming (passe serial), sem extrair nada.
+
+    Com tabela (TabelaRegistros), os registros extraídos ficam também nela,
+    em colunas compactas, para as etapas seguintes (cubo) usarem sem reler
+    os CSVs.
+
+    progresso (instrumentacao.Etapa) recebe o tamanho do export.xml, os
+    bytes já lidos e os registros processados.
+
+    tipos (por exemplo catalogo_metricas.tipos_das_metricas(["Passos", "Sono"]))
+    restringe a extração a esses tipos HK: os demais <Record> são cortados dos
+    bytes antes do parser XML, e um estudo com poucos tipos não paga pelos
+    outros. None extrai todos.
+
+    Devolve a AuditoriaOnline acumulada no passe, para gerar_auditoria_simplificada.
+    """
     indir = Path(indir)
     outdir = Path(outdir)
     outdir.mkdir(exist_ok=True)
 
-    export_xml = list(indir.glob("export*.xml"))[0]
-    print(f"[INFO] Lendo: {export_xml.name}")
-    root = ET.parse(export_xml).getroot()
-    records = [r.attrib for r in root.findall("Record")]
+    export_xml = localizar_xml(indir, "export*.xml", principal=True)
+    if export_xml is None:
+        raise FileNotFoundError(f"export.xml não encontrado em {indir}")
+    print(f"[INFO] Lendo: {export_xml}" if isinstance(export_xml, MembroZip)
+          else f"[INFO] Lendo: {export_xml.name}")
+    if tipos is not None:
+        tipos = frozenset(tipos)
+        print(f"[INFO] Extraindo só {len(tipos)} tipo(s) HK: {', '.join(sorted(tipos))}")
+    if progresso is not None:
+        progresso.total_bytes = tamanho_entrada(export_xml)
 
-    # Descobre todos os campos de forma dinâmica
-    all_fields = set()
-    for r in records:
-        all_fields.update(r.keys())
-    fieldnames = sorted(all_fields)
+    manifesto_path = outdir / "manifesto_incremental.json"
+    manifesto = None
+    if incremental:
+        manifesto = _ManifestoIncremental(manifesto_path)
+        if manifesto.existia:
+            print(f"[INFO] Modo incremental: {len(manifesto.marcas)} pares tipo/fonte já ingeridos.")
+        else:
+            print("[INFO] Modo incremental: sem manifesto anterior, extração completa.")
+    elif manifesto_path.exists():
+        # extração completa reescreve as saídas; o manifesto antigo não vale mais
+        manifesto_path.unlink()
+    anexar = manifesto is not None and manifesto.existia
 
-    # Grava CSV principal
     master_csv = outdir / "export_master.csv"
-    with master_csv.open("w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
-        writer.writeheader()
-        writer.writerows(records)
-    print(f"[OK] Gerado: {master_csv}")
 
-    # Domínios principais e suas chaves
-    dominios = {
-        "cardiaco": "HeartRate",
-        "passos": "StepCount",
-        "sono": "SleepAnalysis",
-        "respiracao": "RespiratoryRate",
-        "energia": "ActiveEnergyBurned"
-    }
+    pasta_parquet = None
+    prefixo_parquet = "part"
+    if gerar_parquet:
+        if pa is None:
+            print("[AVISO] pyarrow não instalado; saída Parquet ignorada.")
+        else:
+            pasta_parquet = outdir / "parquet"
+            if anexar:
+                # novas partes com prefixo próprio, ao lado das já existentes
+                prefixo_parquet = f"inc{int(time.time())}"
+            elif pasta_parquet.exists():
+                shutil.rmtree(pasta_parquet)
+    if not anexar and GravadorBatimentos is not None and (outdir / PASTA_HRV).exists():
+        # extração completa: os batimentos são regravados do zero
+        shutil.rmtree(outdir / PASTA_HRV)
+
+    xlsx_path = outdir / "export_master.xlsx"
+    if gerar_excel and xlsxwriter is None:
+        print("[AVISO] xlsxwriter não instalado; export_master.xlsx não será gerado.")
+        gerar_excel = False
+
+    excel = None
+    faixas = []
+    if processos > 1 and isinstance(export_xml, MembroZip):
+        # membro comprimido não pode ser mapeado em memória nem lido por faixas
+        print("[INFO] Lendo direto do ZIP: passe serial.")
+    elif processos > 1 and export_xml.stat().st_size >= MIN_BYTES_PARALELO:
+        prologo, faixas = dividir_em_blocos(export_xml, processos * 2)
+        if not faixas:
+            print("[AVISO] Layout do export.xml não permite divisão em blocos; usando passe serial.")
+
+    if len(faixas) > 1:
+        print(f"[INFO] Modo paralelo: {len(faixas)} blocos em {processos} processos.")
+        campos_extras, auditoria = _extrair_paralelo(export_xml, outdir, processos, prologo, faixas,
+                                                     anexar, pasta_parquet, prefixo_parquet, manifesto,
+                                                     tabela, progresso, tipos)
+        if pasta_parquet is not None:
+            print(f"[OK] Gerado: {pasta_parquet}")
+    else:
+        # Grava CSV principal e domínios no mesmo passe, linha a linha
+        parquet = _GravadorParquet(pasta_parquet, prefixo=prefixo_parquet) if pasta_parquet else None
+        # na extração completa a planilha é gravada no mesmo passe dos CSVs
+        excel = _GravadorExcel(xlsx_path, CAMPOS_RECORD) if gerar_excel and not anexar else None
+        extrator = _ExtratorRecords(outdir, anexar=anexar, parquet=parquet, manifesto=manifesto,
+                                    excel=excel, tabela=tabela, progresso=progresso, tipos=tipos)
+        try:
+            extrator.consumir(iterar_elementos(export_xml, tags=TAGS_EXPORT, progresso=progresso,
+                                               tipos=tipos))
+        finally:
+            extrator.fechar()
+        campos_extras = extrator.campos_extras
+        auditoria = extrator.auditoria
+
+    # no modo incremental a auditoria soma os acumuladores das execuções
+    # anteriores; sem eles, fica para gerar_auditoria_simplificada refazer do CSV
+    audit_json = outdir / "audit_simplificado.json"
+    if anexar:
+        if audit_json.exists():
+            anterior = AuditoriaOnline.carregar(audit_json)
+            anterior.mesclar(auditoria)
+            auditoria = anterior
+        else:
+            auditoria = None
+
+    if campos_extras:
+        print(f"[AVISO] Atributos ignorados em <Record>: {', '.join(sorted(campos_extras))}")
+
+    if manifesto is not None:
+        manifesto.salvar()
+        print(f"[OK] Incremental: {manifesto.novos:,} registros novos; "
+              f"{manifesto.ignorados:,} já ingeridos".replace(",", "."))
+        atrasados = manifesto.atrasados()
+        if atrasados:
+            print(f"[AVISO] Incremental: {sum(atrasados.values()):,} registro(s) anteriores à janela de "
+                  f"{manifesto.JANELA_S // 86400} dias da última ingestão não foram ingeridos (chegaram "
+                  f"atrasados ou foram editados); rode sem --incremental para incluí-los.".replace(",", "."))
+            for chave, n in atrasados.items():
+                print(f"  {chave.replace('|', ' / ')}: {n:,}".replace(",", "."))
+
+    # Excel opcional (quando não foi gravado durante o passe serial)
+    if gerar_excel and excel is None and master_csv.exists():
+        exportar_excel_do_csv(master_csv, xlsx_path)
 
-    for nome, chave in dominios.items():
-        subset = [r for r in records if chave.lower() in (r.get("type") or "").lower()]
-        if subset:
-            csv_path = outdir / f"export_{nome}.csv"
-            with csv_path.open("w", newline="", encoding="utf-8") as f:
-                writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
-                writer.writeheader()
-                writer.writerows(subset)
-            print(f"[OK] Gerado: {csv_path}")
-
-    # Excel opcional
-    if gerar_excel and pd:
-        df = pd.read_csv(master_csv)
-        xlsx_path = outdir / "export_master.xlsx"
-        df.to_excel(xlsx_path, index=False)
-        print(f"[OK] Gerado: {xlsx_path}")
+    return auditoria
 
 # -------------------------------------------------------------
 # ========== BLOCO D - PROCESSAMENTO DO CDA (export_cda.xml) ==
 # -------------------------------------------------------------
-def processar_cda(indir: Path, outdir: Path):
-    """Extrai observações do export_cda.xml em cda_master/cardiaco/outros."""
-    cda_files = list(indir.glob("*export_cda*.xml"))
-    if not cda_files:
+# Esquema fixo do cda_master.csv / cda_cardiaco.csv / cda_outros.csv
+CAMPOS_CDA = ["code", "codeSystem", "displayName", "domain", "endDate",
+              "startDate", "tag", "unit", "value"]
+
+
+_NOMES_LOCAIS = {}
+
+
+def _local(tag):
+    """Nome da tag sem o namespace ('{urn:hl7-org:v3}code' -> 'code'), memorizado."""
+    nome = _NOMES_LOCAIS.get(tag)
+    if nome is None:
+        nome = _NOMES_LOCAIS[tag] = tag.rsplit("}", 1)[-1]
+    return nome
+
+
+def _filho(elem, nome):
+    """Primeiro filho direto com o nome local dado (find com curinga {*}, sem ElementPath)."""
+    for filho in elem:
+        if _local(filho.tag) == nome:
+            return filho
+    return None
+
+
+def _linha_observacao(obs):
+    """Monta a linha (na ordem de CAMPOS_CDA) de um <observation> do CDA."""
+    # CDA costuma vir com namespaces HL7; os nomes são comparados sem o prefixo
+    r = {}
+    code = val = et = None
+    for filho in obs:
+        nome = _local(filho.tag)
+        if nome == "code" and code is None:
+            code = filho
+        elif nome == "value" and val is None:
+            val = filho
+        elif nome == "effectiveTime" and et is None:
+            et = filho
+
+    # atributos comuns
+    if code is not None:
+        r["code"] = code.attrib.get("code")
+        r["codeSystem"] = code.attrib.get("codeSystem")
+        r["displayName"] = code.attrib.get("displayName")
+
+    # valor pode vir como atributo @value ou texto
+    if val is not None:
+        r["value"] = val.attrib.get("value") or (val.text or "").strip()
+        r["unit"]  = val.attrib.get("unit")
+
+    # datas (HL7 pode ter low/high ou value)
+    if et is not None:
+        low = _filho(et, "low")
+        high = _filho(et, "high")
+        if low is not None:
+            r["startDate"] = low.attrib.get("value")
+        if high is not None:
+            r["endDate"] = high.attrib.get("value")
+        if not r.get("startDate"):
+            r["startDate"] = et.attrib.get("value")
+        if not r.get("endDate"):
+            r["endDate"] = r.get("startDate")
+
+    # tenta identificar um tipo amigável
+    # heurística: se displayName ou code sugerem frequência cardíaca
+    tag = (r.get("displayName") or r.get("code") or "").lower()
+    if "heart" in tag or "card" in tag or (r.get("unit") or "").lower() in ("bpm",):
+        r["domain"] = "cardiaco"
+    else:
+        r["domain"] = "outros"
+
+    # guarda tag bruta do elemento (útil para auditoria)
+    r["tag"] = _local(obs.tag)
+    return [r.get(c) for c in CAMPOS_CDA]
+
+
+def iterar_observacoes(cda_xml, progresso=None):
+    """
+    Percorre os <observation> do CDA em ordem de documento, com iterparse.
+    Cada elemento já tratado é retirado do pai, então a memória fica
+    constante qualquer que seja o tamanho do arquivo.
+    """
+    pilha = []
+    dentro = 0  # profundidade de <observation> aninhados
+    with cda_xml.open("rb") as f:
+        fonte = f if progresso is None else LeituraContada(f, progresso)
+        for evento, elem in ET.iterparse(fonte, events=("start", "end")):
+            if evento == "start":
+                pilha.append(elem)
+                if _local(elem.tag) == "observation":
+                    dentro += 1
+                continue
+            pilha.pop()
+            if _local(elem.tag) == "observation":
+                dentro -= 1
+                if dentro == 0:
+                    # observações aninhadas (entryRelationship) saem junto, em pré-ordem
+                    for obs in elem.iter():
+                        if _local(obs.tag) == "observation":
+                            yield obs
+            if dentro == 0 and pilha:
+                # elem é sempre o último filho do pai neste ponto
+                del pilha[-1][-1]
+
+
+def processar_cda(indir: Path, outdir: Path, progresso=None):
+    """
+    Extrai observações do export_cda.xml em cda_master/cardiaco/outros, em
+    um único passe incremental (esquema fixo CAMPOS_CDA, memória constante).
+    indir pode ser a pasta extraída ou o export.zip.
+    """
+    cda_xml = localizar_xml(indir, "*export_cda*.xml")
+    if cda_xml is None:
         print("[INFO] CDA não encontrado (pulando).")
         return
-    cda_xml = cda_files[0]
     print(f"[INFO] Lendo CDA: {cda_xml.name}")
 
-    # CDA costuma vir com namespaces HL7; usamos curinga {*} para ignorar o prefixo
-    ns_any = "{*}"
-    tree = ET.parse(cda_xml)
-    root = tree.getroot()
-
-    rows = []
-    # Observações ficam tipicamente em .../structuredBody/component/section/entry/observation
-    for obs in root.findall(".//" + ns_any + "observation"):
-        r = {}
-        code = obs.find(ns_any + "code")
-        val  = obs.find(ns_any + "value")
-        et   = obs.find(ns_any + "effectiveTime")
-
-        # atributos comuns
-        if code is not None:
-            r["code"] = code.attrib.get("code")
-            r["codeSystem"] = code.attrib.get("codeSystem")
-            r["displayName"] = code.attrib.get("displayName")
-
-        # valor pode vir como atributo @value ou texto
-        if val is not None:
-            r["value"] = val.attrib.get("value") or (val.text or "").strip()
-            r["unit"]  = val.attrib.get("unit")
-
-        # datas (HL7 pode ter low/high ou value)
-        if et is not None:
-            low = et.find(ns_any + "low")
-            high = et.find(ns_any + "high")
-            if low is not None:
-                r["startDate"] = low.attrib.get("value")
-            if high is not None:
-                r["endDate"] = high.attrib.get("value")
-            if not r.get("startDate"):
-                r["startDate"] = et.attrib.get("value")
-            if not r.get("endDate"):
-                r["endDate"] = r.get("startDate")
-
-        # tenta identificar um tipo amigável
-        # heurística: se displayName ou code sugerem frequência cardíaca
-        tag = (r.get("displayName") or r.get("code") or "").lower()
-        if "heart" in tag or "card" in tag or r.get("unit", "").lower() in ("bpm",):
-            r["domain"] = "cardiaco"
-        else:
-            r["domain"] = "outros"
-
-        # guarda tag bruta do elemento (útil para auditoria)
-        r["tag"] = obs.tag.split("}")[-1]
-        rows.append(r)
+    outdir = Path(outdir)
+    outdir.mkdir(exist_ok=True)
+    master = _GravadorCSV(outdir / "cda_master.csv", CAMPOS_CDA)
+    dominios = {
+        "cardiaco": _GravadorCSV(outdir / "cda_cardiaco.csv", CAMPOS_CDA),
+        "outros": _GravadorCSV(outdir / "cda_outros.csv", CAMPOS_CDA),
+    }
+    i_dominio = CAMPOS_CDA.index("domain")
+    if progresso is not None:
+        progresso.total_bytes = tamanho_entrada(cda_xml)
+    try:
+        for obs in iterar_observacoes(cda_xml, progresso):
+            if progresso is not None:
+                progresso.itens += 1
+            linha = _linha_observacao(obs)
+            master.gravar(linha)
+            dominios[linha[i_dominio]].gravar(linha)
+    finally:
+        # gravadores só criam o arquivo se houver linhas
+        master.fechar()
+        for gravador in dominios.values():
+            gravador.fechar()
 
-    if not rows:
+    if not master.linhas:
         print("[INFO] CDA sem observações úteis (pulando).")
-        return
-
-    # campos dinâmicos
-    fieldnames = sorted({k for row in rows for k in row.keys()})
-
-    # master
-    cda_master = outdir / "cda_master.csv"
-    with cda_master.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
-        w.writeheader()
-        w.writerows(rows)
-    print(f"[OK] Gerado: {cda_master}")
-
-    # divisões simples
-    cardiaco = [r for r in rows if r.get("domain") == "cardiaco"]
-    outros   = [r for r in rows if r.get("domain") == "outros"]
-
-    if cardiaco:
-        p = outdir / "cda_cardiaco.csv"
-        with p.open("w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
-            w.writeheader()
-            w.writerows(cardiaco)
-        print(f"[OK] Gerado: {p}")
-
-    if outros:
-        p = outdir / "cda_outros.csv"
-        with p.open("w", newline="", encoding="utf-8") as f:
-            w = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
-            w.writeheader()
-            w.writerows(outros)
-        print(f"[OK] Gerado: {p}")
 
 
 # -------------------------------------------------------------
 # ========== BLOCO E - ROTAS GPX (workout-routes/*.gpx) =======
 # -------------------------------------------------------------
-def processar_rotas(indir: Path, outdir: Path):
-    """Lê todos os GPX (workout-routes) e gera routes_all.csv."""
-    gpx_dirs = list(indir.glob("workout-*")) + list(indir.glob("workout*")) + list(indir.glob("routes*"))
+CAMPOS_ROTAS = ["workout_id", "idx", "lat", "lon", "ele", "time", "file"]
+
+
+def encontrar_gpx(indir: Path):
+    """
+    Lista os GPX das pastas de rotas (workout-routes, workout*, routes*),
+    cada arquivo uma única vez e em ordem estável. Em um export.zip devolve
+    os membros GPX correspondentes (MembroZip).
+    """
+    indir = Path(indir)
+    if eh_zip(indir):
+        gpx_files = []
+        for m in membros_zip(indir):
+            pasta = m.relativo.split("/", 1)[0] if "/" in m.relativo else ""
+            if m.name.endswith(".gpx") and pasta.startswith(("workout", "routes")):
+                gpx_files.append(m)
+        return gpx_files
+
+    vistos = set()
     gpx_files = []
-    for d in gpx_dirs:
-        gpx_files.extend(d.rglob("*.gpx"))
-    if not gpx_files:
-        # alguns exports usam 'workout-routes'
-        gpx_files = list((indir / "workout-routes").rglob("*.gpx"))
+    for padrao in ("workout*", "routes*"):
+        for d in sorted(indir.glob(padrao)):
+            if not d.is_dir():
+                continue
+            for gpx_path in sorted(d.rglob("*.gpx")):
+                chave = gpx_path.resolve()
+                if chave not in vistos:
+                    vistos.add(chave)
+                    gpx_files.append(gpx_path)
+    return gpx_files
+
+
+def ler_pontos_gpx(gpx_path):
+    """
+    Lê os trkpt de um GPX de forma incremental e devolve uma lista de tuplas
+    (lat, lon, ele, time). Arquivo inválido devolve lista vazia.
+    """
+    pontos = []
+    try:
+        with gpx_path.open("rb") as f:
+            for _, el in ET.iterparse(f, events=("end",)):
+                if el.tag.rsplit("}", 1)[-1] != "trkpt":
+                    continue
+                ele = None
+                time_iso = None
+                for filho in el:
+                    nome = filho.tag.rsplit("}", 1)[-1]
+                    if nome == "ele" and filho.text:
+                        ele = filho.text.strip()
+                    elif nome == "time" and filho.text:
+                        time_iso = filho.text.strip()
+                pontos.append((el.attrib.get("lat"), el.attrib.get("lon"), ele, time_iso))
+                el.clear()
+    except Exception:
+        return []
+    return pontos
+
+
+def processar_rotas(indir: Path, outdir: Path, processos=1, progresso=None):
+    """
+    Lê todos os GPX (workout-routes) e gera routes_all.csv. Os arquivos são
+    lidos em paralelo (processos > 1) e os pontos gravados à medida que cada
+    arquivo termina, na ordem da listagem. indir pode ser a pasta extraída
+    ou o export.zip.
+    """
+    indir = Path(indir)
+    outdir = Path(outdir)
+    gpx_files = encontrar_gpx(indir)
 
     if not gpx_files:
         print("[INFO] GPX não encontrados (pulando).")
         return
 
     print(f"[INFO] Lendo {len(gpx_files)} arquivo(s) GPX...")
-    ns_any = "{*}"
-    out_rows = []
+    routes_csv = outdir / "routes_all.csv"
+    total = 0
 
-    for gpx_path in gpx_files:
-        try:
-            root = ET.parse(gpx_path).getroot()
-        except Exception:
-            continue
+    with routes_csv.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(CAMPOS_ROTAS)
 
-        # tenta obter um id pelo nome do arquivo/pasta
-        workout_id = gpx_path.stem
-
-        # pontos: trk > trkseg > trkpt
-        for i, pt in enumerate(root.findall(".//" + ns_any + "trkpt")):
-            lat = pt.attrib.get("lat")
-            lon = pt.attrib.get("lon")
-            ele = None
-            time_iso = None
-            ele_el = pt.find(ns_any + "ele")
-            if ele_el is not None and ele_el.text:
-                ele = ele_el.text.strip()
-            t_el = pt.find(ns_any + "time")
-            if t_el is not None and t_el.text:
-                time_iso = t_el.text.strip()
-
-            out_rows.append({
-                "workout_id": workout_id,
-                "idx": i,
-                "lat": lat,
-                "lon": lon,
-                "ele": ele,
-                "time": time_iso,
-                "file": str(gpx_path.relative_to(indir))
-            })
-
-    if not out_rows:
+        def gravar(gpx_path, pontos):
+            # tenta obter um id pelo nome do arquivo/pasta
+            workout_id = gpx_path.stem
+            rel = (gpx_path.relativo if isinstance(gpx_path, MembroZip)
+                   else str(gpx_path.relative_to(indir)))
+            w.writerows((workout_id, i, lat, lon, ele, t, rel)
+                        for i, (lat, lon, ele, t) in enumerate(pontos))
+            if progresso is not None:
+                progresso.avancar(itens=len(pontos))
+            return len(pontos)
+
+        if processos > 1 and len(gpx_files) > 1:
+            # janela limitada de arquivos em andamento: memória não cresce com o total
+            janela = processos * 4
+            with ProcessPoolExecutor(max_workers=processos) as pool:
+                for k in range(0, len(gpx_files), janela):
+                    lote = gpx_files[k:k + janela]
+                    for gpx_path, pontos in zip(lote, pool.map(ler_pontos_gpx, lote)):
+                        total += gravar(gpx_path, pontos)
+        else:
+            for gpx_path in gpx_files:
+                total += gravar(gpx_path, ler_pontos_gpx(gpx_path))
+
+    if not total:
+        routes_csv.unlink()
         print("[INFO] Nenhum ponto GPX válido (pulando).")
         return
 
-    fields = ["workout_id", "idx", "lat", "lon", "ele", "time", "file"]
-    routes_csv = outdir / "routes_all.csv"
-    with routes_csv.open("w", newline="", encoding="utf-8") as f:
-        w = csv.DictWriter(f, fieldnames=fields, extrasaction="ignore")
-        w.writeheader()
-        w.writerows(out_rows)
     print(f"[OK] Gerado: {routes_csv}")
 
 # -------------------------------------------------------------
@@ -373,20 +1557,28 @@ def processar_rotas(indir: Path, outdir: Path):
 
 if __name__ == "__main__":
     base = Path(".")
-    pasta_entrada = base / "apple_health_export 30-10-2025"
+    # entrada opcional na linha de comando: pasta extraída ou export.zip
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    pasta_entrada = Path(argumentos[0]) if argumentos else base / "apple_health_export 30-10-2025"
     pasta_saida = base / "Saida"
+    incremental = "--incremental" in sys.argv[1:]
+    # --metricas=Passos,Sono: extrai só os tipos HK dessas métricas (catalogo_metricas)
+    metricas = ler_lista_metricas(next((a.split("=", 1)[1] for a in sys.argv[1:]
+                                        if a.startswith("--metricas=")), None))
 
     print("[INFO] Iniciando extração local ampliada...")
     print(f"  Entrada: {pasta_entrada}")
     print(f"  Saída:   {pasta_saida}")
     print("")
 
-    sp = Spinner("Processando dados Apple Health")
-    sp.start()
-    try:
-        processar_exportacao(pasta_entrada, pasta_saida, gerar_excel=True)
-    finally:
-        sp.stop()
+    # as etapas (e a ordem entre elas) ficam em pipeline.ETAPAS; aqui rodam
+    # as de extração e tabelas derivadas, sem as planilhas de resumo e séries
+    from pipeline import NOMES_ETAPAS, executar_pipeline
 
-    gerar_auditoria_simplificada(pasta_saida)
+    inst = Instrumentacao()
+    ctx = executar_pipeline(pasta_entrada, pasta_saida, metricas=metricas, incremental=incremental,
+                            gerar_excel=True, processos=os.cpu_count() or 1, inst=inst,
+                            etapas=[e for e in NOMES_ETAPAS if e not in ("resumo", "series")])
+    inst.gravar(pasta_saida, entrada=str(pasta_entrada), incremental=incremental,
+                etapas_puladas=ctx["puladas"], script=Path(__file__).name)
     print("[OK] Processo finalizado com sucesso.")
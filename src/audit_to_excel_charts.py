@@ -2,113 +2,174 @@ import pandas as pd
 from pathlib import Path
 import warnings
 
+from catalogo_metricas import TIPOS_ADITIVOS, metricas_grafico
+from cubo_agregacoes import caminho_cubo, ler_cubo
+from datas_apple import data_local, data_local_epoch, epoch_series
+from deduplicacao_fontes import ARQUIVO_DIARIO, PASTA_DEDUP, ler_deduplicado_diario
+from intervalos import dividir_por_dia, somar_por_dia, unir_intervalos
+
 # ---------------------------------------------------------
 # Configuração básica: usa apenas a pasta local e "Saida"
 # ---------------------------------------------------------
 
 BASE_DIR = Path(__file__).resolve().parent
 SAIDA_DIR = BASE_DIR / "Saida"
-SAIDA_DIR.mkdir(exist_ok=True)
 
 OUTPUT_XLSX = SAIDA_DIR / "timeseries_resumo.xlsx"
 
-# Silenciar avisos chatos de parsing
-warnings.filterwarnings(
-    "ignore",
-    message="Could not infer format, so each element will be parsed individually, falling back to `dateutil`."
-)
+# Dataset colunar gerado por processar_exportacao(..., gerar_parquet=True),
+# dentro da pasta de saída. Quando existe, as métricas são lidas dele (só as
+# colunas e a partição do tipo necessários) em vez dos CSVs.
+PARQUET_SUBDIR = "parquet"
+
+# Silenciar avisos chatos de parsing (datas: formato explícito em datas_apple.py)
 warnings.filterwarnings("ignore", category=pd.errors.DtypeWarning)
 
 # ---------------------------------------------------------
-# Métricas quantitativas (1 linha por dia após agregação)
+# Métricas (catalogo_metricas.METRICAS): as que têm y_label viram uma aba
+# com a série diária; o sono (duração em horas por dia) vem por último
 # ---------------------------------------------------------
-QUANTITY_METRICS = [
-    {
-        "name": "Passos",
-        "csv": "export_passos.csv",
-        "type_filter": "HKQuantityTypeIdentifierStepCount",
-        "agg": "sum",  # soma de passos por dia
-        "y_label": "Passos (contagem por dia)",
-    },
-    {
-        "name": "Respiração",
-        "csv": "export_respiracao.csv",
-        "type_filter": "HKQuantityTypeIdentifierRespiratoryRate",
-        "agg": "mean",  # média da taxa respiratória
-        "y_label": "Respirações/min (média diária)",
-    },
-    {
-        "name": "Energia ativa",
-        "csv": "export_energia.csv",
-        "type_filter": "HKQuantityTypeIdentifierActiveEnergyBurned",
-        "agg": "sum",  # kcal por dia
-        "y_label": "Energia ativa (Cal/dia)",
-    },
-    {
-        "name": "FC média",
-        "csv": "export_cardiaco.csv",
-        "type_filter": "HKQuantityTypeIdentifierHeartRate",
-        "agg": "mean",
-        "y_label": "Frequência cardíaca (bpm – média diária)",
-    },
-    {
-        "name": "FC repouso",
-        "csv": "export_cardiaco.csv",
-        "type_filter": "HKQuantityTypeIdentifierRestingHeartRate",
-        "agg": "mean",
-        "y_label": "FC de repouso (bpm – média diária)",
-    },
-    {
-        "name": "FC caminhada",
-        "csv": "export_cardiaco.csv",
-        "type_filter": "HKQuantityTypeIdentifierWalkingHeartRateAverage",
-        "agg": "mean",
-        "y_label": "FC caminhando (bpm – média diária)",
-    },
-    {
-        "name": "HRV SDNN",
-        "csv": "export_cardiaco.csv",
-        "type_filter": "HKQuantityTypeIdentifierHeartRateVariabilitySDNN",
-        "agg": "mean",
-        "y_label": "Variabilidade FC SDNN (ms – média diária)",
-    },
-]
+QUANTITY_METRICS = [cfg for cfg in metricas_grafico() if cfg["agg"] != "sleep"]
+SLEEP_METRIC = metricas_grafico(agg="sleep")[0]
 
-# ---------------------------------------------------------
-# Métrica de sono (duração em horas por dia)
-# ---------------------------------------------------------
-SLEEP_METRIC = {
-    "name": "Sono",
-    "csv": "export_sono.csv",
-    "y_label": "Horas de sono (h/dia, episódios marcados como 'Asleep')",
-}
 
+def dedup_available(cfg: dict, saida_dir: Path = SAIDA_DIR) -> bool:
+    """True se a métrica é uma soma de tipo aditivo já deduplicado entre fontes."""
+    return (cfg.get("agg") == "sum" and cfg.get("type_filter") in TIPOS_ADITIVOS
+            and (saida_dir / PASTA_DEDUP / ARQUIVO_DIARIO).exists())
 
-def load_quantity_metric(cfg: dict) -> pd.DataFrame:
-    """
-    Lê o CSV da métrica, filtra pelo tipo (coluna 'type'),
-    agrega por dia (soma ou média) e devolve DF: ['data', name]
-    """
-    csv_path = SAIDA_DIR / cfg["csv"]
-    if not csv_path.exists():
-        print(f"[AVISO] Arquivo não encontrado para '{cfg['name']}': {csv_path}")
+
+def load_dedup_metric(cfg: dict, saida_dir: Path = SAIDA_DIR) -> pd.DataFrame:
+    """Série diária da métrica sem contar em dobro as fontes sobrepostas (deduplicacao_fontes.py)."""
+    print(f"[INFO] Lendo totais deduplicados entre fontes para métrica '{cfg['name']}'")
+    daily = ler_deduplicado_diario(saida_dir, cfg["type_filter"])
+    if daily.empty:
+        print(f"[AVISO] Nenhum dado após filtro de tipo para '{cfg['name']}'.")
         return pd.DataFrame(columns=["data", cfg["name"]])
 
-    print(f"[INFO] Lendo {csv_path.name} para métrica '{cfg['name']}'")
-    df = pd.read_csv(csv_path, low_memory=False)
+    serie = daily.groupby("data")["deduplicado"].sum()
+    return pd.DataFrame({"data": pd.to_datetime(serie.index).date, cfg["name"]: serie.to_numpy()})
 
-    # filtra pelo tipo, se houver
-    type_filter = cfg.get("type_filter")
-    if type_filter and "type" in df.columns:
-        df = df[df["type"] == type_filter]
 
-    if df.empty:
+def rollup_available(cfg: dict, saida_dir: Path = SAIDA_DIR) -> bool:
+    """True se a métrica pode sair do cubo diário pré-agregado (cubo_agregacoes.py)."""
+    return bool(cfg.get("type_filter")) and caminho_cubo(saida_dir, "dia").exists()
+
+
+def load_rollup_metric(cfg: dict, saida_dir: Path = SAIDA_DIR) -> pd.DataFrame:
+    """Série diária da métrica a partir do cubo (somando as fontes)."""
+    print(f"[INFO] Lendo cubo diário para métrica '{cfg['name']}'")
+    cube = ler_cubo(saida_dir, "dia", tipo=cfg["type_filter"])
+    if cube.empty:
         print(f"[AVISO] Nenhum dado após filtro de tipo para '{cfg['name']}'.")
         return pd.DataFrame(columns=["data", cfg["name"]])
 
-    # converte datas e valores
-    df["data"] = pd.to_datetime(df["startDate"], errors="coerce").dt.date
-    df["valor"] = pd.to_numeric(df["value"], errors="coerce")
+    daily = cube.groupby("periodo")[["sum", "n_valores"]].sum()
+    daily = daily[daily["n_valores"] > 0]
+    if cfg["agg"] == "sum":
+        serie = daily["sum"]
+    else:
+        serie = daily["sum"] / daily["n_valores"]
+
+    out = pd.DataFrame({"data": serie.index.date, cfg["name"]: serie.to_numpy()})
+    return out
+
+
+def parquet_available(cfg: dict, saida_dir: Path = SAIDA_DIR) -> bool:
+    """True se a métrica pode ser lida do dataset Parquet."""
+    return bool(cfg.get("type_filter")) and (saida_dir / PARQUET_SUBDIR).exists()
+
+
+def read_parquet_type(type_filter: str, columns: list, saida_dir: Path = SAIDA_DIR) -> pd.DataFrame:
+    """
+    Lê apenas as colunas pedidas da partição type=<type_filter> do dataset
+    Parquet (todas as partições de ano). Devolve DF vazio se o tipo não existir.
+    """
+    part_dir = saida_dir / PARQUET_SUBDIR / f"type={type_filter}"
+    if not part_dir.exists():
+        return pd.DataFrame(columns=columns)
+    return pd.read_parquet(part_dir, columns=columns)
+
+
+# Colunas lidas dos CSVs (o resto do arquivo é ignorado na leitura)
+QUANTITY_COLUMNS = {"type": "category", "startDate": "string", "value": "string"}
+SLEEP_COLUMNS = {"startDate": "string", "endDate": "string", "value": "string"}
+
+
+def read_csv_sources(configs: list, saida_dir: Path = SAIDA_DIR) -> dict:
+    """
+    Lê cada CSV de origem uma única vez (só as colunas de QUANTITY_COLUMNS,
+    com dtypes explícitos), agrupa por 'type' em um passe e devolve
+    {(csv, type_filter): DataFrame} para todas as métricas pedidas.
+    Métricas sem type_filter recebem o arquivo inteiro (chave (csv, None)).
+    """
+    wanted = {}
+    for cfg in configs:
+        wanted.setdefault(cfg["csv"], set()).add(cfg.get("type_filter"))
+
+    sources = {}
+    for csv_name, types in wanted.items():
+        csv_path = saida_dir / csv_name
+        if not csv_path.exists():
+            continue
+        print(f"[INFO] Lendo {csv_name} (uma vez para {len(types)} métrica(s))")
+        df = pd.read_csv(csv_path, usecols=list(QUANTITY_COLUMNS), dtype=QUANTITY_COLUMNS)
+        if None in types:
+            sources[(csv_name, None)] = df
+        for type_name, group in df.groupby("type", observed=True, sort=False):
+            if type_name in types:
+                sources[(csv_name, type_name)] = group
+    return sources
+
+
+def load_quantity_metric(cfg: dict, sources: dict = None,
+                         saida_dir: Path = SAIDA_DIR) -> pd.DataFrame:
+    """
+    Lê o cubo diário, a partição Parquet do tipo ou o CSV da métrica (nessa
+    ordem de preferência, conforme o que existir em Saida/), filtra
+    pelo tipo (coluna 'type'), agrega por dia (soma ou média) e devolve
+    DF: ['data', name]. 'sources' é o resultado de read_csv_sources, para
+    não reler o mesmo CSV a cada métrica. Somas de tipos aditivos (passos,
+    energia) vêm antes de tudo de Saida/deduplicado/, quando existe: as
+    outras leituras somam todas as fontes, contando em dobro o que o iPhone
+    e o Watch registraram ao mesmo tempo.
+    """
+    type_filter = cfg.get("type_filter")
+
+    if dedup_available(cfg, saida_dir):
+        return load_dedup_metric(cfg, saida_dir)
+
+    if rollup_available(cfg, saida_dir):
+        return load_rollup_metric(cfg, saida_dir)
+
+    if parquet_available(cfg, saida_dir):
+        print(f"[INFO] Lendo Parquet type={type_filter} para métrica '{cfg['name']}'")
+        df = read_parquet_type(type_filter, ["startDate", "tzOffsetMin", "value"], saida_dir)
+        if df.empty:
+            print(f"[AVISO] Nenhum dado após filtro de tipo para '{cfg['name']}'.")
+            return pd.DataFrame(columns=["data", cfg["name"]])
+        df = df.dropna(subset=["startDate"])
+        df["data"] = data_local_epoch(df["startDate"], df["tzOffsetMin"])
+        df["valor"] = df["value"]
+    else:
+        csv_path = saida_dir / cfg["csv"]
+        if not csv_path.exists():
+            print(f"[AVISO] Arquivo não encontrado para '{cfg['name']}': {csv_path}")
+            return pd.DataFrame(columns=["data", cfg["name"]])
+
+        if sources is None:
+            sources = read_csv_sources([cfg], saida_dir)
+        df = sources.get((cfg["csv"], type_filter))
+
+        if df is None or df.empty:
+            print(f"[AVISO] Nenhum dado após filtro de tipo para '{cfg['name']}'.")
+            return pd.DataFrame(columns=["data", cfg["name"]])
+
+        # converte datas e valores
+        df = pd.DataFrame({
+            "data": data_local(df["startDate"]),
+            "valor": pd.to_numeric(df["value"], errors="coerce"),
+        })
 
     df = df.dropna(subset=["data", "valor"])
     if df.empty:
@@ -126,28 +187,47 @@ def load_quantity_metric(cfg: dict) -> pd.DataFrame:
     return out
 
 
-def load_sleep_metric(cfg: dict) -> pd.DataFrame:
+def load_sleep_metric(cfg: dict, saida_dir: Path = SAIDA_DIR) -> pd.DataFrame:
     """
     Calcula horas de sono por dia:
     - usa startDate e endDate
-    - considera apenas linhas em que "value" contém "Asleep"
-    - soma a duração em horas por dia
+    - considera apenas linhas em que "value" contém "Asleep" (inclui os
+      estágios AsleepCore/AsleepDeep/AsleepREM)
+    - une os episódios sobrepostos (Watch + iPhone na mesma noite)
+    - divide cada episódio nas fronteiras de dia (cfg["day_start_hour"])
+      e soma a duração em horas por dia
     """
-    csv_path = SAIDA_DIR / cfg["csv"]
-    if not csv_path.exists():
-        print(f"[AVISO] Arquivo não encontrado para '{cfg['name']}': {csv_path}")
-        return pd.DataFrame(columns=["data", cfg["name"]])
+    if parquet_available(cfg, saida_dir):
+        type_filter = cfg["type_filter"]
+        print(f"[INFO] Lendo Parquet type={type_filter} para métrica de sono '{cfg['name']}'")
+        df = read_parquet_type(type_filter, ["startDate", "endDate", "tzOffsetMin", "valueText"],
+                               saida_dir)
+        if df.empty:
+            print(f"[AVISO] Partição Parquet de sono vazia.")
+            return pd.DataFrame(columns=["data", cfg["name"]])
+        df = df.dropna(subset=["startDate", "endDate"])
+        df = pd.DataFrame({
+            "start": df["startDate"], "end": df["endDate"],
+            "offset": df["tzOffsetMin"], "value": df["valueText"].astype(str),
+        })
+    else:
+        csv_path = saida_dir / cfg["csv"]
+        if not csv_path.exists():
+            print(f"[AVISO] Arquivo não encontrado para '{cfg['name']}': {csv_path}")
+            return pd.DataFrame(columns=["data", cfg["name"]])
 
-    print(f"[INFO] Lendo {csv_path.name} para métrica de sono '{cfg['name']}'")
-    df = pd.read_csv(csv_path, low_memory=False)
+        print(f"[INFO] Lendo {csv_path.name} para métrica de sono '{cfg['name']}'")
+        df = pd.read_csv(csv_path, usecols=list(SLEEP_COLUMNS), dtype=SLEEP_COLUMNS)
 
-    if df.empty:
-        print(f"[AVISO] CSV de sono vazio.")
-        return pd.DataFrame(columns=["data", cfg["name"]])
+        if df.empty:
+            print(f"[AVISO] CSV de sono vazio.")
+            return pd.DataFrame(columns=["data", cfg["name"]])
 
-    df["start"] = pd.to_datetime(df["startDate"], errors="coerce")
-    df["end"] = pd.to_datetime(df["endDate"], errors="coerce")
-    df = df.dropna(subset=["start", "end"])
+        start, offset = epoch_series(df["startDate"])
+        df = pd.DataFrame({
+            "start": start, "end": epoch_series(df["endDate"])[0],
+            "offset": offset, "value": df["value"],
+        }).dropna(subset=["start", "end"])
 
     # mantém apenas episódios "Asleep" (dormindo)
     df = df[df["value"].astype(str).str.contains("Asleep")]
@@ -155,36 +235,54 @@ def load_sleep_metric(cfg: dict) -> pd.DataFrame:
         print(f"[AVISO] Nenhum episódio 'Asleep' encontrado em sono.")
         return pd.DataFrame(columns=["data", cfg["name"]])
 
-    df["dur_h"] = (df["end"] - df["start"]).dt.total_seconds() / 3600.0
-    df["data"] = df["start"].dt.date
+    # união das sobreposições em UTC, depois divisão por dia no horário local
+    start, end, offset = unir_intervalos(df["start"].to_numpy("int64"),
+                                         df["end"].to_numpy("int64"),
+                                         df["offset"].to_numpy("int64"))
+    local = start + offset * 60
+    day, seconds = dividir_por_dia(local, local + (end - start), cfg.get("day_start_hour", 0))
+    days, total = somar_por_dia(day, seconds)
 
-    serie = df.groupby("data")["dur_h"].sum()
-    out = serie.reset_index()
-    out.columns = ["data", cfg["name"]]
-    return out
+    return pd.DataFrame({
+        "data": pd.to_datetime(days * 86400, unit="s").date,
+        cfg["name"]: total / 3600.0,
+    })
 
 
-def main():
-    # carrega todas as séries
+def build_series(saida_dir: Path = SAIDA_DIR, metricas: list = None):
+    """
+    Carrega as séries diárias da pasta de saída: (series_dict, ylabels).
+    metricas: nomes do catálogo a incluir (None = todas as de QUANTITY_METRICS
+    e SLEEP_METRIC).
+    """
     series_dict = {}
     ylabels = {}
+    configs = metricas_grafico(metricas)
+    quantity = [cfg for cfg in configs if cfg["agg"] != "sleep"]
+
+    # cada CSV é lido uma única vez e serve todas as métricas que apontam para ele
+    if (saida_dir / PARQUET_SUBDIR).exists() or caminho_cubo(saida_dir, "dia").exists():
+        sources = {}
+    else:
+        sources = read_csv_sources(quantity, saida_dir)
 
-    for cfg in QUANTITY_METRICS:
-        df_metric = load_quantity_metric(cfg)
+    for cfg in quantity:
+        df_metric = load_quantity_metric(cfg, sources, saida_dir)
         series_dict[cfg["name"]] = df_metric
         ylabels[cfg["name"]] = cfg["y_label"]
 
-    df_sono = load_sleep_metric(SLEEP_METRIC)
-    series_dict[SLEEP_METRIC["name"]] = df_sono
-    ylabels[SLEEP_METRIC["name"]] = SLEEP_METRIC["y_label"]
+    for cfg in configs:
+        if cfg["agg"] == "sleep":
+            series_dict[cfg["name"]] = load_sleep_metric(cfg, saida_dir)
+            ylabels[cfg["name"]] = cfg["y_label"]
+    return series_dict, ylabels
 
-    if not any(not df.empty for df in series_dict.values()):
-        print("[ERRO] Nenhuma série com dados válidos. Verifique os CSVs em 'Saida/'.")
-        return
 
-    print(f"[INFO] Gerando Excel em: {OUTPUT_XLSX}")
+def write_timeseries_xlsx(series_dict: dict, ylabels: dict, output_xlsx: Path):
+    """Uma aba por métrica (dados diários + gráfico de linha)."""
+    print(f"[INFO] Gerando Excel em: {output_xlsx}")
 
-    with pd.ExcelWriter(OUTPUT_XLSX, engine="xlsxwriter") as writer:
+    with pd.ExcelWriter(output_xlsx, engine="xlsxwriter") as writer:
         workbook = writer.book
 
         for name, df in series_dict.items():
@@ -214,7 +312,23 @@ def main():
 
             ws.insert_chart("D2", chart)
 
-    print(f"[OK] Arquivo criado com sucesso: {OUTPUT_XLSX}")
+    print(f"[OK] Arquivo criado com sucesso: {output_xlsx}")
+
+
+def main(saida_dir: Path = SAIDA_DIR, metricas: list = None):
+    # carrega as séries (todas, ou só as métricas pedidas do catálogo)
+    saida_dir = Path(saida_dir)
+    if saida_dir == SAIDA_DIR:
+        # só a pasta padrão: importar o módulo não cria nada em src/
+        SAIDA_DIR.mkdir(exist_ok=True)
+    series_dict, ylabels = build_series(saida_dir, metricas)
+
+    if not any(not df.empty for df in series_dict.values()):
+        print(f"[ERRO] Nenhuma série com dados válidos. Verifique os CSVs em '{saida_dir}'.")
+        return series_dict
+
+    write_timeseries_xlsx(series_dict, ylabels, saida_dir / OUTPUT_XLSX.name)
+    return series_dict
 
 
 if __name__ == "__main__":
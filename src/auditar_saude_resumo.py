@@ -1,7 +1,10 @@
 import re
+import json
 from pathlib import Path
 import pandas as pd
 
+from catalogo_metricas import NOMES_EXIBICAO
+
 # ---------------------------------------------------------
 # Configurações de caminho
 # ---------------------------------------------------------
@@ -12,25 +15,20 @@ BASE_DIR = Path(__file__).resolve().parent
 # Arquivo de entrada (gerado pelo auditar_saude_resumo.py)
 AUDIT_FILE = BASE_DIR / "Saida" / "audit_simplificado.txt"
 
+# Versão estruturada da mesma auditoria (acumuladores por tipo HK); quando
+# existe, é usada no lugar do texto
+AUDIT_JSON = BASE_DIR / "Saida" / "audit_simplificado.json"
+
 # Arquivo de saída (Excel com tabela + gráfico)
 OUTPUT_XLSX = BASE_DIR / "Saida" / "audit_resumo_graficos.xlsx"
 
 
 # ---------------------------------------------------------
-# Mapeamento de nomes HK -> nomes amigáveis para o gráfico
+# Mapeamento de nomes HK -> nomes amigáveis para o gráfico (os nomes de
+# exibição do catalogo_metricas)
 # ---------------------------------------------------------
 
-MAPEAMENTO_NOMES = {
-    "HKQuantityTypeIdentifierStepCount": "Passos",
-    "HKQuantityTypeIdentifierRespiratoryRate": "Respiração",
-    "HKQuantityTypeIdentifierActiveEnergyBurned": "Energia ativa",
-    "HKQuantityTypeIdentifierDistanceWalkingRunning": "Distância percorrida",
-    "HKQuantityTypeIdentifierBasalEnergyBurned": "Energia basal",
-    "HKQuantityTypeIdentifierRunningSpeed": "Corrida – Velocidade",
-    "HKQuantityTypeIdentifierPhysicalEffort": "Esforço físico",
-    "HKCategoryTypeIdentifierSleepAnalysis": "Sono",
-    "HKQuantityTypeIdentifierRunningPower": "Corrida – Potência",
-}
+MAPEAMENTO_NOMES = NOMES_EXIBICAO
 
 
 def normalizar_nome(metrica: str) -> str:
@@ -106,6 +104,37 @@ def parse_audit_file(path: Path):
     return df_numeric, df_text
 
 
+def parse_audit_json(path: Path):
+    """
+    Lê o audit_simplificado.json e monta as mesmas duas tabelas de
+    parse_audit_file:
+    - métricas numéricas: total de registros por tipo HK
+    - informações textuais: período e estatísticas de cada domínio
+    """
+    if not path.exists():
+        raise FileNotFoundError(f"Arquivo não encontrado: {path}")
+
+    dados = json.loads(path.read_text(encoding="utf-8"))
+
+    numeric_rows = [{"metrica": tipo, "valor": float(acc["registros"])}
+                    for tipo, acc in dados.get("tipos", {}).items()]
+
+    text_rows = [{"chave": "Total de registros (master)",
+                  "descricao": str(dados.get("total_registros", 0))}]
+    for dominio, acc in dados.get("dominios", {}).items():
+        if not acc["registros"]:
+            continue
+        partes = [f"Registros: {acc['registros']}"]
+        if acc["inicio"] and acc["fim"]:
+            partes.append(f"Período: {acc['inicio']} → {acc['fim']}")
+        if acc["media"] is not None:
+            partes.append(f"Média/mín/máx: {acc['media']:.2f} / {acc['min']:.2f} / {acc['max']:.2f}")
+            partes.append(f"Soma: {acc['soma']:.2f}")
+        text_rows.append({"chave": dominio, "descricao": "; ".join(partes)})
+
+    return pd.DataFrame(numeric_rows), pd.DataFrame(text_rows)
+
+
 # ---------------------------------------------------------
 # Geração do Excel + gráfico
 # ---------------------------------------------------------
@@ -159,9 +188,22 @@ def build_excel_with_charts(df_numeric: pd.DataFrame,
 # Função principal
 # ---------------------------------------------------------
 
-def main():
-    print(f"Lendo arquivo de auditoria: {AUDIT_FILE}")
-    df_numeric, df_text = parse_audit_file(AUDIT_FILE)
+def main(saida_dir: Path = None):
+    # por padrão usa a pasta Saida ao lado do script; no modo coorte,
+    # a pasta de saída de cada participante
+    audit_json, audit_file, output_xlsx = AUDIT_JSON, AUDIT_FILE, OUTPUT_XLSX
+    if saida_dir is not None:
+        saida_dir = Path(saida_dir)
+        audit_json = saida_dir / AUDIT_JSON.name
+        audit_file = saida_dir / AUDIT_FILE.name
+        output_xlsx = saida_dir / OUTPUT_XLSX.name
+
+    if audit_json.exists():
+        print(f"Lendo arquivo de auditoria: {audit_json}")
+        df_numeric, df_text = parse_audit_json(audit_json)
+    else:
+        print(f"Lendo arquivo de auditoria: {audit_file}")
+        df_numeric, df_text = parse_audit_file(audit_file)
 
     # Aplica nomes amigáveis nas métricas
     if not df_numeric.empty:
@@ -177,8 +219,8 @@ def main():
     print("\nResumo textual:")
     print(df_text if not df_text.empty else "  (nenhuma linha textual identificada)")
 
-    print(f"\nGerando Excel com gráficos em: {OUTPUT_XLSX}")
-    build_excel_with_charts(df_numeric, df_text, OUTPUT_XLSX)
+    print(f"\nGerando Excel com gráficos em: {output_xlsx}")
+    build_excel_with_charts(df_numeric, df_text, output_xlsx)
     print("Concluído.")
 
 
@@ -0,0 +1,299 @@
+# =============================================================
+# Módulo: batimentos_hrv.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Batimentos instantâneos (InstantaneousBeatsPerMinute) das medições de
+# HRV (HKQuantityTypeIdentifierHeartRateVariabilitySDNN), guardados em
+# arrays contíguos para análises autonômicas (RMSSD, pNN50).
+# =============================================================
+#
+# Layout em <saida>/hrv_batimentos/ (binários crus, ordem de bytes nativa):
+#   bpm.f32            float32, bpm de cada batimento, de todas as medições
+#   tempo_ms.i64       int64, instante de cada batimento (epoch UTC em ms)
+#   n_batimentos.i32   int32, batimentos de cada medição (posições = cumsum)
+#   startDate.i64      int64, início de cada medição (epoch UTC em s)
+#   tzOffsetMin.i16    int16, offset local do início (min)
+#   value.f64          float64, SDNN informado pela Apple (ms)
+#   sourceName.i32     int32, código da fonte em hrv.json
+#   hrv.json           fontes, contagens e tipos das colunas
+#
+# Durante a extração os batimentos vão para buffers array.array e são
+# descarregados no disco em blocos (memória constante). Como cada medição
+# guarda só a sua contagem, blocos do modo paralelo e execuções
+# incrementais se juntam concatenando os arquivos. A leitura
+# (BatimentosHRV) usa np.memmap: nenhuma cópia nem objeto por batimento.
+#
+# Uso:
+#   from batimentos_hrv import BatimentosHRV
+#   hrv = BatimentosHRV("Saida")
+#   tempo_ms, bpm = hrv.medicao(0)
+#   metricas = hrv.metricas()      # RMSSD, pNN50... por medição
+
+import json
+from array import array
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from datas_apple import epoch_apple
+
+PASTA_HRV = "hrv_batimentos"
+ARQUIVO_HRV = "hrv.json"
+TIPO_HRV = "HKQuantityTypeIdentifierHeartRateVariabilitySDNN"
+
+# arquivo -> typecode do array.array / dtype numpy
+BATIMENTOS = {"bpm.f32": "f", "tempo_ms.i64": "q"}
+MEDICOES = {"n_batimentos.i32": "i", "startDate.i64": "q", "tzOffsetMin.i16": "h",
+            "value.f64": "d", "sourceName.i32": "i"}
+DTYPES = {"f": np.float32, "q": np.int64, "i": np.int32, "h": np.int16, "d": np.float64}
+
+DIA_MS = 86_400_000
+LIMITE_BUFFER = 1_000_000
+
+
+def ms_do_dia(texto):
+    """
+    Milissegundos desde a meia-noite local de um horário de batimento
+    ("8:45:12.34 PM", ou "20:45:12.34" em exports com relógio de 24 h).
+    Devolve None se o texto não for reconhecido.
+    """
+    try:
+        hms, _, periodo = texto.strip().partition(" ")
+        h, m, s = hms.split(":")
+        h = int(h)
+        if periodo:
+            h = h % 12 + (12 if periodo[:1] in "Pp" else 0)
+        return (h * 3600 + int(m) * 60) * 1000 + round(float(s.replace(",", ".")) * 1000)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _numero(valor):
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class GravadorBatimentos:
+    """
+    Recebe, durante o passe de extração, os <Record> de HRV com a sua
+    HeartRateVariabilityMetadataList e grava o armazenamento em pasta.
+    Com anexar=True acrescenta a um armazenamento existente (modo incremental).
+    """
+
+    def __init__(self, pasta, anexar=False, avisar=True):
+        self.pasta = Path(pasta)
+        self.anexar = anexar
+        self.avisar = avisar
+        self.fontes = []
+        self._codigos = {}
+        self.batimentos = 0
+        self.medicoes = 0
+        self._buf = {nome: array(tc) for nome, tc in {**BATIMENTOS, **MEDICOES}.items()}
+        self._aberto = False
+
+    def _abrir(self):
+        self.pasta.mkdir(parents=True, exist_ok=True)
+        info = self.pasta / ARQUIVO_HRV
+        if self.anexar and info.exists():
+            anterior = json.loads(info.read_text(encoding="utf-8"))
+            self.fontes = anterior["fontes"]
+            self._codigos = {f: i for i, f in enumerate(self.fontes)}
+            self.batimentos = anterior["batimentos"]
+            self.medicoes = anterior["medicoes"]
+            modo = "ab"
+        else:
+            modo = "wb"
+        self._arquivos = {nome: (self.pasta / nome).open(modo) for nome in self._buf}
+        self._aberto = True
+
+    def adicionar(self, r, lista):
+        """Uma medição: atributos do <Record> e o elemento HeartRateVariabilityMetadataList."""
+        inicio, offset = epoch_apple(r.get("startDate"))
+        if inicio is None:
+            return
+        if not self._aberto:
+            self._abrir()
+        # os horários dos batimentos só têm a hora local: a data vem do início
+        # da medição (e avança um dia se o horário "voltar" pela meia-noite)
+        inicio_local_ms = (inicio + offset * 60) * 1000
+        base_dia = inicio_local_ms - inicio_local_ms % DIA_MS
+        ajuste = offset * 60_000
+        bpm, tempo = self._buf["bpm.f32"], self._buf["tempo_ms.i64"]
+        n = 0
+        for b in lista:
+            ms = ms_do_dia(b.get("time"))
+            if ms is None:
+                continue
+            t = base_dia + ms
+            if t < inicio_local_ms - 3_600_000:
+                t += DIA_MS
+            bpm.append(_numero(b.get("bpm")))
+            tempo.append(t - ajuste)
+            n += 1
+
+        fonte = r.get("sourceName")
+        codigo = self._codigos.get(fonte)
+        if codigo is None:
+            codigo = self._codigos[fonte] = len(self.fontes)
+            self.fontes.append(fonte)
+        self._buf["n_batimentos.i32"].append(n)
+        self._buf["startDate.i64"].append(inicio)
+        self._buf["tzOffsetMin.i16"].append(offset)
+        self._buf["value.f64"].append(_numero(r.get("value")))
+        self._buf["sourceName.i32"].append(codigo)
+        self.batimentos += n
+        self.medicoes += 1
+        if len(bpm) >= LIMITE_BUFFER:
+            self.descarregar()
+
+    def descarregar(self):
+        for nome, buf in self._buf.items():
+            buf.tofile(self._arquivos[nome])
+            del buf[:]
+
+    def fechar(self):
+        if not self._aberto:
+            return
+        self.descarregar()
+        for f in self._arquivos.values():
+            f.close()
+        self._aberto = False
+        (self.pasta / ARQUIVO_HRV).write_text(json.dumps({
+            "tipo": TIPO_HRV,
+            "medicoes": self.medicoes,
+            "batimentos": self.batimentos,
+            "fontes": self.fontes,
+            "colunas": {**BATIMENTOS, **MEDICOES},
+        }, ensure_ascii=False, indent=1), encoding="utf-8")
+        if self.avisar:
+            print(f"[OK] Gerado: {self.pasta} ({self.medicoes:,} medições HRV; "
+                  f"{self.batimentos:,} batimentos)".replace(",", "."))
+
+
+def juntar_batimentos(destino, pastas, anexar=False):
+    """
+    Junta, na ordem dada, os armazenamentos parciais (blocos do modo
+    paralelo) em destino: os arquivos são concatenados e só os códigos de
+    fonte são remapeados. Devolve False se nenhum bloco tinha medições.
+    """
+    partes = [Path(p) for p in pastas if (Path(p) / ARQUIVO_HRV).exists()]
+    if not partes:
+        return False
+    gravador = GravadorBatimentos(destino, anexar=anexar, avisar=False)
+    gravador._abrir()
+    for parte in partes:
+        info = json.loads((parte / ARQUIVO_HRV).read_text(encoding="utf-8"))
+        mapa = []
+        for fonte in info["fontes"]:
+            if fonte not in gravador._codigos:
+                gravador._codigos[fonte] = len(gravador.fontes)
+                gravador.fontes.append(fonte)
+            mapa.append(gravador._codigos[fonte])
+        for nome, f in gravador._arquivos.items():
+            dados = (parte / nome).read_bytes()
+            if nome == "sourceName.i32":
+                codigos = array("i")
+                codigos.frombytes(dados)
+                dados = array("i", (mapa[c] for c in codigos)).tobytes()
+            f.write(dados)
+        gravador.medicoes += info["medicoes"]
+        gravador.batimentos += info["batimentos"]
+    gravador.fechar()
+    return True
+
+
+class BatimentosHRV:
+    """Leitura do armazenamento com memória mapeada (sem cópia)."""
+
+    def __init__(self, outdir):
+        self.pasta = Path(outdir) / PASTA_HRV
+        self.info = json.loads((self.pasta / ARQUIVO_HRV).read_text(encoding="utf-8"))
+        self.fontes = self.info["fontes"]
+        col = {nome.split(".")[0]: self._mapear(nome, tc) for nome, tc in {**BATIMENTOS, **MEDICOES}.items()}
+        self.bpm = col["bpm"]
+        self.tempo_ms = col["tempo_ms"]
+        self.n_batimentos = col["n_batimentos"]
+        self.inicio = col["startDate"]
+        self.tz_offset_min = col["tzOffsetMin"]
+        self.sdnn_apple = col["value"]
+        self.fonte = col["sourceName"]
+        # posições[i]:posições[i+1] são os batimentos da medição i
+        self.posicoes = np.zeros(len(self.n_batimentos) + 1, dtype=np.int64)
+        np.cumsum(self.n_batimentos, out=self.posicoes[1:])
+
+    def _mapear(self, nome, typecode):
+        path = self.pasta / nome
+        if path.stat().st_size == 0:
+            return np.empty(0, dtype=DTYPES[typecode])
+        return np.memmap(path, dtype=DTYPES[typecode], mode="r")
+
+    def __len__(self):
+        return len(self.n_batimentos)
+
+    def medicao(self, i):
+        """(tempo_ms, bpm) dos batimentos da medição i (visões do arquivo)."""
+        a, b = self.posicoes[i], self.posicoes[i + 1]
+        return self.tempo_ms[a:b], self.bpm[a:b]
+
+    def metricas(self, batimentos_por_bloco=LIMITE_BUFFER):
+        """
+        DataFrame com uma linha por medição: início, fonte, SDNN da Apple e,
+        a partir dos intervalos RR (60000 / bpm), RR médio, SDNN, RMSSD e
+        pNN50 (% das diferenças sucessivas acima de 50 ms). Processa as
+        medições em blocos de ~batimentos_por_bloco, sem laço por medição.
+        """
+        n = len(self)
+        campos = ("batimentos", "rr_medio_ms", "sdnn_ms", "rmssd_ms", "pnn50")
+        saida = {c: np.full(n, np.nan) for c in campos}
+        saida["batimentos"] = np.asarray(self.n_batimentos, dtype=np.int64)
+
+        k = 0
+        while k < n:
+            # bloco de medições inteiras com até ~batimentos_por_bloco batimentos
+            fim = int(np.searchsorted(self.posicoes, self.posicoes[k] + batimentos_por_bloco, side="right")) - 1
+            fim = min(max(fim, k + 1), n)
+            a, b = self.posicoes[k], self.posicoes[fim]
+            rr = 60000.0 / np.asarray(self.bpm[a:b], dtype=np.float64)
+            medicao = np.repeat(np.arange(fim - k), saida["batimentos"][k:fim])
+            cont = np.bincount(medicao, minlength=fim - k)
+            soma = np.bincount(medicao, weights=rr, minlength=fim - k)
+            soma2 = np.bincount(medicao, weights=rr * rr, minlength=fim - k)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                media = soma / cont
+                saida["rr_medio_ms"][k:fim] = media
+                saida["sdnn_ms"][k:fim] = np.sqrt(np.maximum(soma2 / cont - media * media, 0))
+
+                # diferenças sucessivas só dentro da mesma medição
+                dif = np.diff(rr)
+                mesma = medicao[1:] == medicao[:-1]
+                dif, grupo = dif[mesma], medicao[1:][mesma]
+                n_dif = np.bincount(grupo, minlength=fim - k)
+                saida["rmssd_ms"][k:fim] = np.sqrt(np.bincount(grupo, weights=dif * dif, minlength=fim - k) / n_dif)
+                saida["pnn50"][k:fim] = 100.0 * np.bincount(
+                    grupo, weights=(np.abs(dif) > 50).astype(np.float64), minlength=fim - k) / n_dif
+            k = fim
+
+        fontes = np.array(self.fontes + [None], dtype=object)
+        df = pd.DataFrame({
+            "startDate": np.asarray(self.inicio),
+            "tzOffsetMin": np.asarray(self.tz_offset_min),
+            "sourceName": fontes[np.asarray(self.fonte)],
+            "sdnn_apple_ms": np.asarray(self.sdnn_apple),
+            **saida,
+        })
+        return df.round({"rr_medio_ms": 2, "sdnn_ms": 2, "rmssd_ms": 2, "pnn50": 2})
+
+
+def gerar_metricas_hrv(outdir):
+    """Grava <outdir>/hrv_metricas.csv a partir do armazenamento de batimentos."""
+    outdir = Path(outdir)
+    if not (outdir / PASTA_HRV / ARQUIVO_HRV).exists():
+        print("[INFO] Sem batimentos de HRV (pulando).")
+        return None
+    df = BatimentosHRV(outdir).metricas()
+    destino = outdir / "hrv_metricas.csv"
+    df.to_csv(destino, index=False)
+    print(f"[OK] Gerado: {destino} ({len(df):,} medições)".replace(",", "."))
+    return destino
@@ -0,0 +1,141 @@
+# =============================================================
+# Módulo: catalogo_metricas.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Registro único das métricas do projeto: tipo HK, unidade, agregação
+# diária, nome de exibição e CSV de domínio de cada uma. Extração,
+# auditoria, deduplicação e planilhas de séries leem daqui.
+# =============================================================
+#
+# Campos de cada métrica em METRICAS:
+#   name            nome de exibição (abas, gráficos, auditoria)
+#   type            identificador HK
+#   unit            unidade do export
+#   agg             agregação por dia: "sum" (tipos aditivos), "mean",
+#                   "sleep" (horas dormindo, união dos intervalos) ou
+#                   "count" (eventos)
+#   domain          CSV de domínio (export_<domain>.csv) ou None (só master)
+#   y_label         rótulo do eixo; só as métricas com y_label viram série
+#                   diária na timeseries_resumo.xlsx
+#   day_start_hour  (sono) hora local em que começa o "dia de sono"
+#
+# Para um estudo que só precisa de algumas métricas, tipos_das_metricas()
+# dá o conjunto de tipos HK a extrair: processar_exportacao(tipos=...)
+# descarta os demais <Record> antes do parser XML.
+
+METRICAS = [
+    {"name": "Passos", "type": "HKQuantityTypeIdentifierStepCount", "unit": "count",
+     "agg": "sum", "domain": "passos", "y_label": "Passos (contagem por dia)"},
+    {"name": "Respiração", "type": "HKQuantityTypeIdentifierRespiratoryRate", "unit": "count/min",
+     "agg": "mean", "domain": "respiracao", "y_label": "Respirações/min (média diária)"},
+    {"name": "Energia ativa", "type": "HKQuantityTypeIdentifierActiveEnergyBurned", "unit": "kcal",
+     "agg": "sum", "domain": "energia", "y_label": "Energia ativa (Cal/dia)"},
+    {"name": "FC média", "type": "HKQuantityTypeIdentifierHeartRate", "unit": "count/min",
+     "agg": "mean", "domain": "cardiaco", "y_label": "Frequência cardíaca (bpm – média diária)"},
+    {"name": "FC repouso", "type": "HKQuantityTypeIdentifierRestingHeartRate", "unit": "count/min",
+     "agg": "mean", "domain": "cardiaco", "y_label": "FC de repouso (bpm – média diária)"},
+    {"name": "FC caminhada", "type": "HKQuantityTypeIdentifierWalkingHeartRateAverage", "unit": "count/min",
+     "agg": "mean", "domain": "cardiaco", "y_label": "FC caminhando (bpm – média diária)"},
+    {"name": "HRV SDNN", "type": "HKQuantityTypeIdentifierHeartRateVariabilitySDNN", "unit": "ms",
+     "agg": "mean", "domain": "cardiaco", "y_label": "Variabilidade FC SDNN (ms – média diária)"},
+    {"name": "Sono", "type": "HKCategoryTypeIdentifierSleepAnalysis", "unit": "h",
+     "agg": "sleep", "domain": "sono",
+     "y_label": "Horas de sono (h/dia, episódios marcados como 'Asleep')",
+     # 0 = dia do calendário; 18 credita a noite inteira à data em que ela termina
+     "day_start_hour": 0},
+
+    # só auditoria / tabelas (sem série na planilha)
+    {"name": "FC recuperação 1 min", "type": "HKQuantityTypeIdentifierHeartRateRecoveryOneMinute",
+     "unit": "count/min", "agg": "mean", "domain": "cardiaco"},
+    {"name": "Evento de FC alta", "type": "HKCategoryTypeIdentifierHighHeartRateEvent", "unit": None,
+     "agg": "count", "domain": "cardiaco"},
+    {"name": "Evento de FC baixa", "type": "HKCategoryTypeIdentifierLowHeartRateEvent", "unit": None,
+     "agg": "count", "domain": "cardiaco"},
+    {"name": "Distância percorrida", "type": "HKQuantityTypeIdentifierDistanceWalkingRunning", "unit": "km",
+     "agg": "sum", "domain": None},
+    {"name": "Distância pedalada", "type": "HKQuantityTypeIdentifierDistanceCycling", "unit": "km",
+     "agg": "sum", "domain": None},
+    {"name": "Energia basal", "type": "HKQuantityTypeIdentifierBasalEnergyBurned", "unit": "kcal",
+     "agg": "sum", "domain": None},
+    {"name": "Andares subidos", "type": "HKQuantityTypeIdentifierFlightsClimbed", "unit": "count",
+     "agg": "sum", "domain": None},
+    {"name": "Minutos de exercício", "type": "HKQuantityTypeIdentifierAppleExerciseTime", "unit": "min",
+     "agg": "sum", "domain": None},
+    {"name": "Corrida – Velocidade", "type": "HKQuantityTypeIdentifierRunningSpeed", "unit": "km/hr",
+     "agg": "mean", "domain": None},
+    {"name": "Corrida – Potência", "type": "HKQuantityTypeIdentifierRunningPower", "unit": "W",
+     "agg": "mean", "domain": None},
+    {"name": "Esforço físico", "type": "HKQuantityTypeIdentifierPhysicalEffort", "unit": "kcal/hr·kg",
+     "agg": "mean", "domain": None},
+]
+
+# CSVs de domínio, na ordem em que são gravados
+ORDEM_DOMINIOS = ("cardiaco", "passos", "sono", "respiracao", "energia")
+
+# domínio -> tipos HK gravados em export_<domínio>.csv
+DOMINIOS = {d: tuple(m["type"] for m in METRICAS if m["domain"] == d) for d in ORDEM_DOMINIOS}
+
+# tipo HK -> nome de exibição
+NOMES_EXIBICAO = {m["type"]: m["name"] for m in METRICAS}
+
+# tipos cujo valor é uma quantidade acumulada no intervalo (somáveis por dia)
+TIPOS_ADITIVOS = tuple(m["type"] for m in METRICAS if m["agg"] == "sum")
+
+_DOMINIO_DO_TIPO = {m["type"]: m["domain"] for m in METRICAS if m["domain"]}
+
+
+def dominio_do_tipo(tipo):
+    """Domínio (CSV export_<domínio>.csv) do tipo HK, ou None."""
+    return _DOMINIO_DO_TIPO.get(tipo)
+
+
+def metrica(nome):
+    """Entrada de METRICAS pelo nome de exibição (KeyError se não existir)."""
+    for m in METRICAS:
+        if m["name"] == nome:
+            return m
+    raise KeyError(f"Métrica desconhecida: {nome!r} (ver catalogo_metricas.METRICAS)")
+
+
+def selecionar(nomes=None):
+    """Métricas com os nomes dados, na ordem de METRICAS (todas se nomes for None)."""
+    if nomes is None:
+        return list(METRICAS)
+    pedidas = {metrica(n)["name"] for n in nomes}
+    return [m for m in METRICAS if m["name"] in pedidas]
+
+
+def tipos_das_metricas(nomes):
+    """Conjunto de tipos HK das métricas (None = sem filtro)."""
+    if nomes is None:
+        return None
+    return frozenset(m["type"] for m in selecionar(nomes))
+
+
+def config_grafico(m):
+    """Configuração de série diária usada por audit_to_excel_charts."""
+    cfg = {
+        "name": m["name"],
+        "csv": f"export_{m['domain']}.csv" if m["domain"] else "export_master.csv",
+        "type_filter": m["type"],
+        "agg": m["agg"],
+        "y_label": m["y_label"],
+    }
+    if "day_start_hour" in m:
+        cfg["day_start_hour"] = m["day_start_hour"]
+    return cfg
+
+
+def metricas_grafico(nomes=None, agg=None):
+    """Configurações das métricas com série na planilha (opcionalmente de uma agregação)."""
+    return [config_grafico(m) for m in selecionar(nomes)
+            if m.get("y_label") and (agg is None or m["agg"] == agg)]
+
+
+def ler_lista_metricas(texto):
+    """'Passos,FC média' (argumento de linha de comando) -> lista de nomes, ou None."""
+    if not texto:
+        return None
+    nomes = [n.strip() for n in texto.split(",") if n.strip()]
+    for n in nomes:
+        metrica(n)
+    return nomes
@@ -0,0 +1,180 @@
+# =============================================================
+# Módulo: cubo_agregacoes.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Cubo de agregações por tipo HK e fonte (sourceName) nas resoluções
+# hora / dia / semana / mês, calculado em um passe sobre os registros
+# extraídos e gravado em Saida/cubo/.
+# =============================================================
+#
+# Cada célula guarda count (registros), n_valores (registros com valor
+# numérico), sum, min, max e mean. As resoluções maiores são derivadas da
+# horária (as estatísticas se compõem), então os registros brutos são lidos
+# uma única vez. Os períodos usam o horário local do início do registro.
+# Pelo mesmo motivo, na extração incremental só os registros novos são
+# agregados e somados ao cubo horário já gravado (gerar_cubo(anexar=True)).
+#
+# Uso direto (consultas ad hoc):
+#   from cubo_agregacoes import ler_cubo
+#   df = ler_cubo("Saida", "semana", tipo="HKQuantityTypeIdentifierStepCount")
+
+from pathlib import Path
+
+import pandas as pd
+
+from datas_apple import epoch_series
+
+try:
+    import pyarrow  # noqa: F401  (só para decidir o formato de gravação)
+    FORMATO = "parquet"
+except ImportError:
+    FORMATO = "csv"
+
+RESOLUCOES = ("hora", "dia", "semana", "mes")
+CHAVES = ["type", "sourceName", "periodo"]
+LINHAS_POR_BLOCO = 1_000_000
+
+
+def _parcial_horario(tipo, fonte, epoch, offset, valor):
+    """Agrega um bloco de registros brutos por tipo/fonte/hora local."""
+    local = epoch.astype("int64") + offset.astype("int64") * 60
+    df = pd.DataFrame({
+        "type": tipo.to_numpy(),
+        "sourceName": fonte.fillna("").to_numpy(),
+        "periodo": pd.to_datetime((local // 3600) * 3600, unit="s").to_numpy(),
+        "valor": valor.to_numpy(),
+    })
+    return df.groupby(CHAVES, sort=False).agg(
+        count=("valor", "size"), n_valores=("valor", "count"),
+        sum=("valor", "sum"), min=("valor", "min"), max=("valor", "max"),
+    ).reset_index()
+
+
+def _recompor(df):
+    """Combina células com a mesma chave (partes de blocos ou resolução maior)."""
+    out = df.groupby(CHAVES, sort=True).agg(
+        count=("count", "sum"), n_valores=("n_valores", "sum"),
+        sum=("sum", "sum"), min=("min", "min"), max=("max", "max"),
+    ).reset_index()
+    out["mean"] = out["sum"] / out["n_valores"].where(out["n_valores"] > 0)
+    return out
+
+
+def _blocos_parquet(pasta):
+    """Blocos (tipo, fonte, epoch, offset, valor) lidos do dataset Parquet."""
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(pasta, format="parquet", partitioning="hive")
+    colunas = ["type", "sourceName", "startDate", "tzOffsetMin", "value"]
+    for lote in dataset.to_batches(columns=colunas, batch_size=LINHAS_POR_BLOCO):
+        df = lote.to_pandas().dropna(subset=["startDate"])
+        yield (df["type"].astype(str), df["sourceName"].astype(object),
+               df["startDate"], df["tzOffsetMin"], df["value"])
+
+
+def _blocos_csv(master_csv):
+    """Blocos (tipo, fonte, epoch, offset, valor) lidos do export_master.csv."""
+    colunas = {"type": "string", "sourceName": "string", "startDate": "string", "value": "string"}
+    for df in pd.read_csv(master_csv, usecols=list(colunas), dtype=colunas,
+                          chunksize=LINHAS_POR_BLOCO):
+        epoch, offset = epoch_series(df["startDate"])
+        ok = epoch.notna()
+        yield (df["type"][ok], df["sourceName"][ok].astype(object), epoch[ok], offset[ok],
+               pd.to_numeric(df["value"][ok], errors="coerce"))
+
+
+def _blocos_tabela(tabela):
+    """Blocos (tipo, fonte, epoch, offset, valor) de uma TabelaRegistros em memória."""
+    from tabela_registros import SEM_DATA
+
+    for i in range(0, len(tabela), LINHAS_POR_BLOCO):
+        linhas = slice(i, i + LINHAS_POR_BLOCO)
+        epoch = tabela.coluna("startDate")[linhas]
+        ok = epoch != SEM_DATA
+        yield (pd.Series(tabela.strings("type", linhas)[ok]),
+               pd.Series(tabela.strings("sourceName", linhas)[ok]),
+               pd.Series(epoch[ok]), pd.Series(tabela.coluna("tzOffsetMin")[linhas][ok]),
+               pd.Series(tabela.coluna("value")[linhas][ok]))
+
+
+def _derivar(horario, resolucao):
+    """Deriva a resolução pedida a partir do cubo horário."""
+    if resolucao == "hora":
+        return horario
+    df = horario.drop(columns="mean")
+    if resolucao == "dia":
+        df["periodo"] = df["periodo"].dt.floor("D")
+    elif resolucao == "semana":
+        # semana começando na segunda-feira
+        dia = df["periodo"].dt.floor("D")
+        df["periodo"] = dia - pd.to_timedelta(dia.dt.dayofweek, unit="D")
+    elif resolucao == "mes":
+        df["periodo"] = df["periodo"].dt.to_period("M").dt.to_timestamp()
+    return _recompor(df)
+
+
+def caminho_cubo(outdir, resolucao):
+    return Path(outdir) / "cubo" / f"cubo_{resolucao}.{FORMATO}"
+
+
+def gerar_cubo(outdir, tabela=None, anexar=False):
+    """
+    Monta o cubo a partir da TabelaRegistros já em memória (se dada), de
+    <outdir>/parquet (se existir) ou do export_master.csv, em um passe, e
+    grava cubo_<resolução> em <outdir>/cubo. Com anexar=True a tabela tem só
+    os registros novos de uma extração incremental, e as células deles são
+    combinadas com o cubo horário existente.
+    """
+    outdir = Path(outdir)
+    pasta_parquet = outdir / "parquet"
+    master_csv = outdir / "export_master.csv"
+    anterior = []
+    if anexar and tabela is not None and caminho_cubo(outdir, "hora").exists():
+        horario = ler_cubo(outdir, "hora").drop(columns="mean")
+        horario["sourceName"] = horario["sourceName"].fillna("")
+        anterior = [horario]
+        blocos = _blocos_tabela(tabela)
+        print(f"[INFO] Cubo: somando {len(tabela):,} registros novos ao cubo existente.".replace(",", "."))
+    elif tabela is not None and len(tabela):
+        blocos = _blocos_tabela(tabela)
+    elif pasta_parquet.exists() and FORMATO == "parquet":
+        blocos = _blocos_parquet(pasta_parquet)
+    elif master_csv.exists():
+        blocos = _blocos_csv(master_csv)
+    else:
+        print("[AVISO] Sem registros extraídos para montar o cubo (pulando).")
+        return None
+
+    parciais = anterior + [_parcial_horario(*bloco) for bloco in blocos]
+    if not parciais:
+        print("[AVISO] Nenhum registro com data válida para o cubo (pulando).")
+        return None
+    horario = _recompor(pd.concat(parciais, ignore_index=True))
+
+    (outdir / "cubo").mkdir(exist_ok=True)
+    for resolucao in RESOLUCOES:
+        df = _derivar(horario, resolucao)
+        destino = caminho_cubo(outdir, resolucao)
+        if FORMATO == "parquet":
+            df.to_parquet(destino, index=False)
+        else:
+            df.to_csv(destino, index=False)
+        print(f"[OK] Gerado: {destino} ({len(df):,} células)".replace(",", "."))
+    return outdir / "cubo"
+
+
+def ler_cubo(outdir, resolucao, tipo=None, fonte=None):
+    """Lê uma resolução do cubo, opcionalmente filtrando tipo e/ou fonte."""
+    destino = caminho_cubo(outdir, resolucao)
+    if not destino.exists():
+        return pd.DataFrame(columns=CHAVES + ["count", "n_valores", "sum", "min", "max", "mean"])
+    filtros = []
+    if tipo is not None:
+        filtros.append(("type", "==", tipo))
+    if fonte is not None:
+        filtros.append(("sourceName", "==", fonte))
+    if FORMATO == "parquet":
+        return pd.read_parquet(destino, filters=filtros or None)
+    df = pd.read_csv(destino, parse_dates=["periodo"])
+    for coluna, _, valor in filtros:
+        df = df[df[coluna] == valor]
+    return df
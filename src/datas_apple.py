@@ -0,0 +1,130 @@
+# =============================================================
+# Módulo: datas_apple.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Conversão de datas do Apple Saúde, compartilhada pelos scripts
+# (extração, auditoria e séries temporais).
+# =============================================================
+#
+# O export.xml usa sempre o layout 'AAAA-MM-DD HH:MM:SS ±HHMM'. As funções
+# abaixo tratam esse formato diretamente (sem tentativa e erro) e memorizam
+# strings repetidas; outros formatos ainda são aceitos como alternativa.
+
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+FORMATO_APPLE = "%Y-%m-%d %H:%M:%S %z"
+FORMATOS_ALTERNATIVOS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d")
+
+_ORDINAL_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def _campos_apple(s):
+    """(epoch UTC em segundos, offset em minutos) ou None se fora do layout Apple."""
+    if len(s) != 25 or s[19] != " " or s[20] not in "+-":
+        return None
+    try:
+        dias = date(int(s[0:4]), int(s[5:7]), int(s[8:10])).toordinal() - _ORDINAL_EPOCH
+        local = dias * 86400 + int(s[11:13]) * 3600 + int(s[14:16]) * 60 + int(s[17:19])
+        offset = int(s[21:23]) * 60 + int(s[23:25])
+    except ValueError:
+        return None
+    if s[20] == "-":
+        offset = -offset
+    return local - offset * 60, offset
+
+
+@lru_cache(maxsize=1 << 16)
+def parse_date(s):
+    """Converte a string em datetime (com fuso, no layout Apple) ou None."""
+    if not s:
+        return None
+    campos = _campos_apple(s)
+    if campos is not None:
+        epoch, offset = campos
+        fuso = timezone(timedelta(minutes=offset))
+        return datetime.fromtimestamp(epoch, fuso)
+    for fmt in FORMATOS_ALTERNATIVOS:
+        try:
+            return datetime.strptime(s, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+@lru_cache(maxsize=1 << 16)
+def epoch_apple(s):
+    """
+    Converte 'AAAA-MM-DD HH:MM:SS ±HHMM' em (segundos epoch UTC, offset em
+    minutos). Devolve (None, None) se a data não puder ser interpretada;
+    datas sem fuso são tratadas como UTC.
+    """
+    if not s:
+        return None, None
+    campos = _campos_apple(s)
+    if campos is not None:
+        return campos
+    d = parse_date(s)
+    if d is None:
+        return None, None
+    if d.tzinfo is None:
+        d = d.replace(tzinfo=timezone.utc)
+    return int(d.timestamp()), int(d.utcoffset().total_seconds() // 60)
+
+
+def texto_apple(epoch, offset_min):
+    """Inverso de epoch_apple: 'AAAA-MM-DD HH:MM:SS ±HHMM' no horário local."""
+    local = datetime(1970, 1, 1) + timedelta(seconds=int(epoch) + int(offset_min) * 60)
+    sinal = "-" if offset_min < 0 else "+"
+    h, m = divmod(abs(int(offset_min)), 60)
+    return f"{local:%Y-%m-%d %H:%M:%S} {sinal}{h:02d}{m:02d}"
+
+
+# ---------------------------------------------------------
+# Versões vetorizadas (pandas)
+# ---------------------------------------------------------
+
+def _unicos(serie):
+    """Códigos + valores únicos: cada string distinta é convertida uma vez."""
+    codigos, unicos = pd.factorize(serie.astype("string"), use_na_sentinel=True)
+    return codigos, pd.Series(unicos, dtype="string")
+
+
+def _expandir(codigos, valores, index, dtype):
+    out = pd.Series(valores.to_numpy()[codigos], index=index, dtype=dtype)
+    out[codigos < 0] = pd.NA
+    return out
+
+
+def epoch_series(serie):
+    """
+    Converte uma Series de datas Apple em (epoch, offset_min), ambas Series
+    Int64 (nulas onde a data é inválida). Cada string distinta é interpretada
+    uma única vez, com formato explícito.
+    """
+    codigos, unicos = _unicos(serie)
+    local = pd.to_datetime(unicos.str.slice(0, 19), format="%Y-%m-%d %H:%M:%S", errors="coerce")
+    seg_local = (local - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+    sinal = unicos.str.slice(20, 21).map({"+": 1, "-": -1})
+    horas = pd.to_numeric(unicos.str.slice(21, 23), errors="coerce")
+    minutos = pd.to_numeric(unicos.str.slice(23, 25), errors="coerce")
+    offset = (sinal * (horas * 60 + minutos)).fillna(0)
+    epoch = seg_local - offset * 60
+    return (_expandir(codigos, epoch.astype("Int64"), serie.index, "Int64"),
+            _expandir(codigos, offset.astype("Int64"), serie.index, "Int64"))
+
+
+def data_local(serie):
+    """Dia do calendário (horário local do registro) de cada data Apple."""
+    codigos, unicos = _unicos(serie)
+    dias = pd.to_datetime(unicos.str.slice(0, 10), format="%Y-%m-%d", errors="coerce")
+    return _expandir(codigos, pd.Series(dias.dt.date, dtype="object"), serie.index, "object")
+
+
+def data_local_epoch(epoch, offset_min):
+    """Dia do calendário local a partir de epoch UTC (s) + offset em minutos."""
+    return pd.to_datetime(epoch + offset_min.astype("int64") * 60, unit="s").dt.date
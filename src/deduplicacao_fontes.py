@@ -0,0 +1,188 @@
+# =============================================================
+# Módulo: deduplicacao_fontes.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Resolve a sobreposição entre fontes (sourceName) nos tipos aditivos
+# (agg "sum" no catalogo_metricas: passos, energia, distância...): a mesma
+# caminhada registrada pelo iPhone e pelo Watch não pode ser somada duas vezes.
+# =============================================================
+#
+# Como no app Saúde, cada instante é creditado à fonte de maior prioridade
+# que tem amostra nele. Uma amostra de fonte menos prioritária coberta só em
+# parte por fontes acima dela fica com a fração não coberta do seu valor
+# (proporcional ao tempo); amostras da mesma fonte não se anulam entre si.
+#
+# A prioridade vem de PRIORIDADE_FONTES (padrões fnmatch, sem diferenciar
+# maiúsculas, do mais para o menos prioritário); fontes que não casam com
+# nenhum padrão vêm depois, em ordem alfabética.
+#
+# Lê os tipos do índice temporal (já ordenados pelo início) e, por tipo,
+# percorre as fontes em ordem de prioridade mantendo a união dos intervalos
+# já creditados (intervalos.unir_intervalos / cobertura): ordenação +
+# varredura em arrays, O(F · n log n) com F fontes, sem laço por amostra.
+#
+# Saídas em <saida>/deduplicado/:
+#   <tipo>.npy                 valor deduplicado de cada amostra, float64,
+#                              na mesma ordem do indice_temporal/<tipo>/
+#   deduplicado_diario.csv     type, data, sourceName, bruto, deduplicado
+#                              (dia local do início da amostra)
+#   deduplicado.json           prioridade usada e totais por tipo
+#
+# Uso:
+#   from deduplicacao_fontes import ler_deduplicado_diario
+#   passos = ler_deduplicado_diario("Saida", "HKQuantityTypeIdentifierStepCount")
+
+import fnmatch
+import json
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from catalogo_metricas import TIPOS_ADITIVOS
+from indice_temporal import ARQUIVO_INDICE, PASTA_INDICE, IndiceTemporal, gerar_indice
+from intervalos import DIA_S, cobertura, unir_intervalos
+
+PASTA_DEDUP = "deduplicado"
+ARQUIVO_DIARIO = "deduplicado_diario.csv"
+ARQUIVO_INFO = "deduplicado.json"
+
+# do mais para o menos prioritário (o Watch mede no pulso o tempo todo em
+# que é usado; o iPhone só quando está no bolso)
+PRIORIDADE_FONTES = ["*Apple Watch*", "*Watch*", "*iPhone*"]
+
+
+def ordem_fontes(fontes, prioridade=None):
+    """
+    Posição de prioridade (0 = maior) de cada fonte da lista, pelos padrões
+    de prioridade e, entre fontes do mesmo padrão ou sem padrão, pelo nome.
+    """
+    padroes = [p.lower() for p in (PRIORIDADE_FONTES if prioridade is None else prioridade)]
+
+    def chave(k):
+        nome = fontes[k].lower()
+        nivel = next((i for i, p in enumerate(padroes) if fnmatch.fnmatchcase(nome, p)), len(padroes))
+        return nivel, fontes[k]
+
+    posicao = np.empty(len(fontes), dtype=np.int64)
+    posicao[sorted(range(len(fontes)), key=chave)] = np.arange(len(fontes))
+    return posicao
+
+
+def deduplicar(inicio, fim, valor, fonte, posicao):
+    """
+    Valor deduplicado de cada amostra. fonte: código da fonte (-1 = sem
+    fonte, por último); posicao: prioridade de cada código (ordem_fontes).
+    Amostras instantâneas (fim == início) valem inteiras ou nada, conforme o
+    instante esteja livre ou já coberto por uma fonte acima.
+    """
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fim = np.asarray(fim, dtype=np.int64)
+    valor = np.asarray(valor, dtype=np.float64)
+    nivel = np.append(np.asarray(posicao, dtype=np.int64), len(posicao))[np.asarray(fonte)]
+
+    saida = np.empty(len(valor), dtype=np.float64)
+    uniao_ini = uniao_fim = np.empty(0, dtype=np.int64)
+    for n in np.unique(nivel):
+        sel = np.flatnonzero(nivel == n)
+        ini, fi = inicio[sel], fim[sel]
+        duracao = fi - ini
+        coberto = cobertura(uniao_ini, uniao_fim, fi) - cobertura(uniao_ini, uniao_fim, ini)
+        livre = 1.0 - coberto / np.maximum(duracao, 1)
+        # instantâneas: livre se nenhum intervalo unido contém o instante
+        k = np.searchsorted(uniao_ini, ini, side="right") - 1
+        dentro = (k >= 0) & (ini < uniao_fim[np.maximum(k, 0)]) if len(uniao_ini) else np.zeros(len(sel), bool)
+        livre = np.where(duracao > 0, livre, np.where(dentro, 0.0, 1.0))
+        saida[sel] = valor[sel] * livre
+        uniao_ini, uniao_fim, _ = unir_intervalos(np.concatenate((uniao_ini, ini)),
+                                                  np.concatenate((uniao_fim, fi)))
+    return saida
+
+
+def _diario(tipo, colunas, fontes, bruto, dedup):
+    """Somas por dia local do início e fonte (bruto e deduplicado)."""
+    inicio = np.asarray(colunas["startDate"])
+    offset = np.asarray(colunas["tzOffsetMin"]).astype(np.int64)
+    df = pd.DataFrame({
+        "dia": (inicio + offset * 60) // DIA_S,
+        "fonte": np.asarray(colunas["sourceName"]),
+        "bruto": bruto, "deduplicado": dedup,
+    })
+    soma = df.groupby(["dia", "fonte"], sort=True)[["bruto", "deduplicado"]].sum().reset_index()
+    nomes = np.array(fontes + [None], dtype=object)
+    return pd.DataFrame({
+        "type": tipo,
+        "data": pd.to_datetime(soma["dia"].to_numpy(), unit="D").strftime("%Y-%m-%d"),
+        "sourceName": nomes[soma["fonte"].to_numpy()],
+        "bruto": soma["bruto"].round(4).to_numpy(),
+        "deduplicado": soma["deduplicado"].round(4).to_numpy(),
+    })
+
+
+def gerar_deduplicacao(outdir, prioridade=None, tipos=TIPOS_ADITIVOS):
+    """
+    Deduplica os tipos aditivos presentes no índice temporal de <outdir>
+    (montando o índice se ainda não existir) e grava <outdir>/deduplicado.
+    """
+    outdir = Path(outdir)
+    if not (outdir / PASTA_INDICE / ARQUIVO_INDICE).exists() and gerar_indice(outdir) is None:
+        print("[AVISO] Sem índice temporal para a deduplicação de fontes (pulando).")
+        return None
+    indice = IndiceTemporal(outdir)
+    presentes = [t for t in tipos if t in indice.info]
+    if not presentes:
+        print("[INFO] Nenhum tipo aditivo para deduplicar (pulando).")
+        return None
+
+    pasta = outdir / PASTA_DEDUP
+    pasta.mkdir(exist_ok=True)
+    diarios, resumo = [], {}
+    for tipo in presentes:
+        info, colunas = indice.info[tipo], indice.colunas(tipo)
+        posicao = ordem_fontes(info["fontes"], prioridade)
+        bruto = np.asarray(colunas["value"])
+        dedup = deduplicar(colunas["startDate"], colunas["endDate"], bruto,
+                           colunas["sourceName"], posicao)
+        np.save(pasta / f"{tipo}.npy", dedup)
+        diarios.append(_diario(tipo, colunas, info["fontes"], bruto, dedup))
+        resumo[tipo] = {
+            "fontes": [info["fontes"][k] for k in np.argsort(posicao)],
+            "registros": int(len(bruto)),
+            "bruto": round(float(np.nansum(bruto)), 4),
+            "deduplicado": round(float(np.nansum(dedup)), 4),
+        }
+        reducao = 1 - resumo[tipo]["deduplicado"] / resumo[tipo]["bruto"] if resumo[tipo]["bruto"] else 0.0
+        print(f"[INFO] {tipo}: {resumo[tipo]['bruto']:,.0f} -> {resumo[tipo]['deduplicado']:,.0f} "
+              f"({reducao:.1%} sobreposto)".replace(",", "."))
+
+    # tipos de uma execução anterior que não existem mais
+    for antigo in pasta.glob("*.npy"):
+        if antigo.stem not in resumo:
+            antigo.unlink()
+
+    pd.concat(diarios, ignore_index=True).to_csv(pasta / ARQUIVO_DIARIO, index=False)
+    (pasta / ARQUIVO_INFO).write_text(json.dumps({
+        "gerado_em": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+        "prioridade": list(PRIORIDADE_FONTES if prioridade is None else prioridade),
+        "tipos": resumo,
+    }, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"[OK] Gerado: {pasta / ARQUIVO_DIARIO} ({len(resumo)} tipos)")
+    return pasta
+
+
+def valores_deduplicados(outdir, tipo):
+    """Valores deduplicados do tipo (memória mapeada, na ordem do IndiceTemporal)."""
+    return np.load(Path(outdir) / PASTA_DEDUP / f"{tipo}.npy", mmap_mode="r")
+
+
+def ler_deduplicado_diario(outdir, tipo=None, fonte=None):
+    """deduplicado_diario.csv, opcionalmente filtrado por tipo e/ou fonte."""
+    path = Path(outdir) / PASTA_DEDUP / ARQUIVO_DIARIO
+    if not path.exists():
+        return pd.DataFrame(columns=["type", "data", "sourceName", "bruto", "deduplicado"])
+    df = pd.read_csv(path, dtype={"type": "string", "data": "string", "sourceName": "string"})
+    if tipo is not None:
+        df = df[df["type"] == tipo]
+    if fonte is not None:
+        df = df[df["sourceName"] == fonte]
+    return df.reset_index(drop=True)
@@ -0,0 +1,317 @@
+# =============================================================
+# Módulo: indice_temporal.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Índice por tipo HK, ordenado pelo início do registro, para consultas
+# por janela de tempo ("tipo X entre t0 e t1, opcionalmente da fonte Y")
+# sem recarregar os CSVs.
+# =============================================================
+#
+# Layout em <saida>/indice_temporal/:
+#   indice.json                  tipos, contagens, período, maior duração e
+#                                dicionários de fontes / valores textuais
+#   <tipo>/startDate.npy         int64, epoch UTC em s, em ordem crescente
+#   <tipo>/endDate.npy           int64
+#   <tipo>/tzOffsetMin.npy       int16, offset local (min) do início
+#   <tipo>/value.npy             float64 (NaN se não numérico)
+#   <tipo>/sourceName.npy        int32, código em "fontes"
+#   <tipo>/valueText.npy         int32, código em "textos" (-1 se numérico)
+#
+# As colunas são abertas com memória mapeada: a busca binária em startDate
+# toca poucas páginas e só o bloco [i0, i1) da janela é lido do disco.
+#
+# Na extração incremental, gerar_indice(anexar=True) junta os registros novos
+# só aos tipos que os têm (as colunas do tipo são regravadas, sem reler o
+# export_master.csv nem o Parquet).
+#
+# Uso:
+#   from indice_temporal import IndiceTemporal
+#   idx = IndiceTemporal("Saida")
+#   fc = idx.consultar("HKQuantityTypeIdentifierHeartRate",
+#                      "2024-05-10 07:00:00 -0300", "2024-05-10 09:00:00 -0300",
+#                      fonte="Apple Watch de Ana")
+
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from datas_apple import epoch_apple, epoch_series
+
+PASTA_INDICE = "indice_temporal"
+ARQUIVO_INDICE = "indice.json"
+COLUNAS = ("sourceName", "startDate", "endDate", "tzOffsetMin", "value", "valueText")
+LINHAS_POR_BLOCO = 1_000_000
+
+
+def _fatorar(strings):
+    """(códigos int32, categorias) de um array de strings (ausentes viram -1)."""
+    codigos, categorias = pd.factorize(pd.Series(strings, dtype=object), use_na_sentinel=True)
+    return codigos.astype(np.int32), [str(c) for c in categorias]
+
+
+def _gravar_tipo(pasta, inicio, fim, offset, valor, fontes, textos):
+    """
+    Ordena um tipo pelo início e grava as colunas. fontes / textos são pares
+    (códigos, categorias). Devolve a entrada do tipo para o indice.json.
+    """
+    ordem = np.argsort(inicio, kind="stable")
+    fim = np.where(fim == np.iinfo(np.int64).min, inicio, fim)
+    pasta.mkdir(parents=True, exist_ok=True)
+    colunas = {
+        "startDate": inicio.astype(np.int64), "endDate": fim.astype(np.int64),
+        "tzOffsetMin": offset.astype(np.int16), "value": valor.astype(np.float64),
+        "sourceName": fontes[0].astype(np.int32), "valueText": textos[0].astype(np.int32),
+    }
+    for nome, dados in colunas.items():
+        np.save(pasta / f"{nome}.npy", dados[ordem])
+    return {
+        "registros": int(len(inicio)),
+        "inicio": int(inicio.min()), "fim": int(fim.max()),
+        "max_duracao": int((fim - inicio).max()),
+        "fontes": fontes[1], "textos": textos[1],
+    }
+
+
+# ---------- leitura das saídas da extração ----------
+
+def _tipos_tabela(tabela):
+    """(tipo, colunas) por tipo de uma TabelaRegistros, sem strings por registro."""
+    from tabela_registros import SEM_DATA
+
+    tipos = tabela.coluna("type")
+    inicio = tabela.coluna("startDate")
+    validos = np.flatnonzero((tipos >= 0) & (inicio != SEM_DATA))
+    ordem = validos[np.argsort(tipos[validos], kind="stable")]
+    cortes = np.flatnonzero(np.diff(tipos[ordem])) + 1
+    for grupo in np.split(ordem, cortes):
+        if not len(grupo):
+            continue
+        fontes = tabela.coluna("sourceName")[grupo]
+        textos = tabela.coluna("valueText")[grupo]
+        yield tabela.categorias("type")[tipos[grupo[0]]], (
+            inicio[grupo], tabela.coluna("endDate")[grupo], tabela.coluna("tzOffsetMin")[grupo],
+            tabela.coluna("value")[grupo],
+            # recodifica para o dicionário só deste tipo
+            _fatorar(np.array(tabela.categorias("sourceName") + [None], dtype=object)[fontes]),
+            _fatorar(np.array(tabela.categorias("valueText") + [None], dtype=object)[textos]),
+        )
+
+
+def _tipos_parquet(pasta_parquet):
+    """(tipo, colunas) lendo uma partição type=<tipo> do dataset Parquet por vez."""
+    for pasta_tipo in sorted(pasta_parquet.glob("type=*")):
+        df = pd.read_parquet(pasta_tipo, columns=["sourceName", "startDate", "endDate",
+                                                  "tzOffsetMin", "value", "valueText"])
+        df = df.dropna(subset=["startDate"])
+        if df.empty:
+            continue
+        yield pasta_tipo.name.split("=", 1)[1], (
+            df["startDate"].to_numpy(np.int64),
+            df["endDate"].fillna(df["startDate"]).to_numpy(np.int64),
+            df["tzOffsetMin"].fillna(0).to_numpy(np.int16),
+            df["value"].to_numpy(np.float64),
+            _fatorar(df["sourceName"].astype(object).to_numpy()),
+            _fatorar(df["valueText"].astype(object).to_numpy()),
+        )
+
+
+def _tipos_csv(master_csv):
+    """(tipo, colunas) a partir do export_master.csv, lido em blocos."""
+    campos = ["type", "sourceName", "startDate", "endDate", "value"]
+    partes = {}
+    for df in pd.read_csv(master_csv, usecols=campos, dtype="string", chunksize=LINHAS_POR_BLOCO):
+        inicio, offset = epoch_series(df["startDate"])
+        fim, _ = epoch_series(df["endDate"])
+        ok = inicio.notna() & df["type"].notna()
+        df = df[ok]
+        valor = pd.to_numeric(df["value"].str.replace(",", ".", regex=False), errors="coerce")
+        bloco = pd.DataFrame({
+            "type": df["type"], "sourceName": df["sourceName"],
+            "startDate": inicio[ok].astype("int64"),
+            "endDate": fim[ok].fillna(inicio[ok]).astype("int64"),
+            "tzOffsetMin": offset[ok].astype("int64"),
+            "value": valor.astype("float64"),
+            "valueText": df["value"].where(valor.isna()),
+        })
+        for tipo, grupo in bloco.groupby("type", sort=False):
+            partes.setdefault(tipo, []).append(grupo)
+    for tipo in sorted(partes):
+        df = pd.concat(partes.pop(tipo), ignore_index=True)
+        yield tipo, (
+            df["startDate"].to_numpy(np.int64), df["endDate"].to_numpy(np.int64),
+            df["tzOffsetMin"].to_numpy(np.int16), df["value"].to_numpy(np.float64),
+            _fatorar(df["sourceName"].astype(object).to_numpy()),
+            _fatorar(df["valueText"].astype(object).to_numpy()),
+        )
+
+
+def _juntar_codigos(categorias, codigos, novos):
+    """Códigos anteriores + novos (pares de _fatorar) em um só dicionário de categorias."""
+    posicao = {c: i for i, c in enumerate(categorias)}
+    mapa = np.array([posicao.setdefault(c, len(posicao)) for c in novos[1]] + [-1], dtype=np.int32)
+    return np.concatenate((codigos, mapa[novos[0]])), list(posicao)
+
+
+def _anexar_indice(pasta, tabela):
+    """Junta os registros novos da TabelaRegistros ao índice gravado, tipo a tipo."""
+    tipos = json.loads((pasta / ARQUIVO_INDICE).read_text(encoding="utf-8"))["tipos"]
+    novos = 0
+    for tipo, (inicio, fim, offset, valor, fontes, textos) in _tipos_tabela(tabela):
+        novos += len(inicio)
+        info = tipos.get(tipo)
+        if info is not None:
+            # lidas inteiras (sem mmap): os mesmos arquivos são regravados
+            cols = {c: np.load(pasta / tipo / f"{c}.npy") for c in COLUNAS}
+            fim = np.where(fim == np.iinfo(np.int64).min, inicio, fim)
+            inicio = np.concatenate((cols["startDate"], inicio))
+            fim = np.concatenate((cols["endDate"], fim))
+            offset = np.concatenate((cols["tzOffsetMin"], offset.astype(np.int16)))
+            valor = np.concatenate((cols["value"], valor))
+            fontes = _juntar_codigos(info["fontes"], cols["sourceName"], fontes)
+            textos = _juntar_codigos(info["textos"], cols["valueText"], textos)
+        tipos[tipo] = _gravar_tipo(pasta / tipo, inicio, fim, offset, valor, fontes, textos)
+    return tipos, novos
+
+
+def gerar_indice(outdir, tabela=None, anexar=False):
+    """
+    Monta <outdir>/indice_temporal a partir da TabelaRegistros (se dada), de
+    <outdir>/parquet (se existir) ou do export_master.csv. Cada tipo é
+    ordenado e gravado separadamente. Com anexar=True a tabela tem só os
+    registros novos de uma extração incremental, juntados ao índice gravado.
+    """
+    outdir = Path(outdir)
+    pasta = outdir / PASTA_INDICE
+    pasta_parquet = outdir / "parquet"
+    master_csv = outdir / "export_master.csv"
+    if anexar and tabela is not None and (pasta / ARQUIVO_INDICE).exists():
+        tipos, novos = _anexar_indice(pasta, tabela)
+        _gravar_info(pasta, tipos)
+        print(f"[OK] Atualizado: {pasta} ({novos:,} registros novos; "
+              f"{sum(t['registros'] for t in tipos.values()):,} no total)".replace(",", "."))
+        return pasta
+    if tabela is not None and len(tabela):
+        fonte = _tipos_tabela(tabela)
+    elif pasta_parquet.exists():
+        fonte = _tipos_parquet(pasta_parquet)
+    elif master_csv.exists():
+        fonte = _tipos_csv(master_csv)
+    else:
+        print("[AVISO] Sem registros extraídos para o índice temporal (pulando).")
+        return None
+
+    tipos = {}
+    for tipo, colunas in fonte:
+        tipos[tipo] = _gravar_tipo(pasta / tipo, *colunas)
+    if not tipos:
+        print("[AVISO] Nenhum registro com data válida para o índice temporal (pulando).")
+        return None
+
+    # tipos de um índice anterior que não existem mais
+    for antiga in pasta.iterdir():
+        if antiga.is_dir() and antiga.name not in tipos:
+            for arq in antiga.glob("*.npy"):
+                arq.unlink()
+            antiga.rmdir()
+
+    _gravar_info(pasta, tipos)
+    total = sum(t["registros"] for t in tipos.values())
+    print(f"[OK] Gerado: {pasta} ({len(tipos)} tipos; {total:,} registros)".replace(",", "."))
+    return pasta
+
+
+def _gravar_info(pasta, tipos):
+    (pasta / ARQUIVO_INDICE).write_text(json.dumps({
+        "gerado_em": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+        "tipos": tipos,
+    }, ensure_ascii=False, indent=1), encoding="utf-8")
+
+
+# ---------- consultas ----------
+
+def _epoch(t):
+    """Epoch UTC (s) de str Apple, datetime/Timestamp (sem fuso = UTC) ou número."""
+    if isinstance(t, str):
+        epoch = epoch_apple(t)[0]
+        if epoch is None:
+            raise ValueError(f"Data inválida: {t!r}")
+        return epoch
+    if isinstance(t, datetime):
+        if t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        return int(t.timestamp())
+    return int(t)
+
+
+class IndiceTemporal:
+    """Consultas por janela de tempo sobre o índice gravado por gerar_indice."""
+
+    def __init__(self, outdir):
+        self.pasta = Path(outdir) / PASTA_INDICE
+        dados = json.loads((self.pasta / ARQUIVO_INDICE).read_text(encoding="utf-8"))
+        self.info = dados["tipos"]
+        self._abertos = {}
+
+    def tipos(self):
+        return sorted(self.info)
+
+    def colunas(self, tipo):
+        """Colunas do tipo (memória mapeada, em ordem de início)."""
+        colunas = self._abertos.get(tipo)
+        if colunas is None:
+            colunas = self._abertos[tipo] = {
+                nome: np.load(self.pasta / tipo / f"{nome}.npy", mmap_mode="r") for nome in COLUNAS
+            }
+        return colunas
+
+    def faixa(self, tipo, inicio, fim, sobrepondo=False):
+        """
+        Posições [i0, i1) dos registros do tipo com início em [inicio, fim).
+        Com sobrepondo=True a faixa cobre também os que começaram antes e
+        ainda estavam em curso em inicio (limitada pela maior duração do tipo).
+        """
+        t0, t1 = _epoch(inicio), _epoch(fim)
+        if sobrepondo:
+            t0 -= self.info[tipo]["max_duracao"]
+        starts = self.colunas(tipo)["startDate"]
+        return int(np.searchsorted(starts, t0, side="left")), int(np.searchsorted(starts, t1, side="left"))
+
+    def linhas(self, tipo, posicoes):
+        """
+        DataFrame com sourceName, startDate, endDate (epoch UTC), tzOffsetMin,
+        value e valueText das posições dadas (slice ou array de índices);
+        só as páginas dessas posições são lidas do disco.
+        """
+        info = self.info[tipo]
+        col = self.colunas(tipo)
+        fontes = np.array(info["fontes"] + [None], dtype=object)
+        textos = np.array(info["textos"] + [None], dtype=object)
+        return pd.DataFrame({
+            "sourceName": fontes[np.asarray(col["sourceName"][posicoes])],
+            "startDate": np.asarray(col["startDate"][posicoes]),
+            "endDate": np.asarray(col["endDate"][posicoes]),
+            "tzOffsetMin": np.asarray(col["tzOffsetMin"][posicoes]),
+            "value": np.asarray(col["value"][posicoes]),
+            "valueText": textos[np.asarray(col["valueText"][posicoes])],
+        })
+
+    def consultar(self, tipo, inicio, fim, fonte=None, sobrepondo=False):
+        """
+        Registros do tipo com início em [inicio, fim) (ou, com sobrepondo=True,
+        que se sobrepõem à janela), opcionalmente só da fonte dada. Devolve o
+        DataFrame de linhas(), em ordem de início.
+        """
+        if tipo not in self.info or (fonte is not None and fonte not in self.info[tipo]["fontes"]):
+            return pd.DataFrame(columns=list(COLUNAS))
+        i0, i1 = self.faixa(tipo, inicio, fim, sobrepondo)
+        if not sobrepondo and fonte is None:
+            return self.linhas(tipo, slice(i0, i1))
+        col = self.colunas(tipo)
+        manter = np.ones(i1 - i0, dtype=bool)
+        if sobrepondo:
+            manter &= np.asarray(col["endDate"][i0:i1]) > _epoch(inicio)
+        if fonte is not None:
+            manter &= np.asarray(col["sourceName"][i0:i1]) == self.info[tipo]["fontes"].index(fonte)
+        return self.linhas(tipo, i0 + np.flatnonzero(manter))
@@ -0,0 +1,303 @@
+# =============================================================
+# Módulo: instrumentacao.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Progresso e métricas das etapas do pipeline: percentual pelos bytes já
+# lidos da entrada, registros por segundo, tempo e pico de memória por
+# etapa, gravados em <saida>/metricas_execucao.json ao final.
+# =============================================================
+#
+# Uso:
+#   inst = Instrumentacao()
+#   with inst.etapa("extracao", unidade="registros") as etapa:
+#       processar_exportacao(..., progresso=etapa)
+#   inst.gravar(pasta_saida)
+#
+# O código da etapa só atualiza etapa.bytes / etapa.itens (e etapa.total_bytes,
+# quando conhece o tamanho da entrada); uma thread mostra o progresso e
+# amostra a memória a cada meio segundo. Enquanto a linha de progresso está
+# na tela, o sys.stdout passa por _SaidaComProgresso, que a apaga antes de
+# cada print da etapa ([OK], [INFO]...), sem misturar as duas.
+#
+# Memória: o pico de cada etapa (pico_mb) soma o RSS do processo e dos
+# processos filhos vivos (workers da extração paralela e das rotas) em cada
+# amostra. No nível de cima, pico_memoria_mb é o do processo principal e
+# pico_memoria_filho_mb o do maior processo filho já encerrado (getrusage);
+# os filhos que rodaram ao mesmo tempo não são somados nesses dois.
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ARQUIVO_METRICAS = "metricas_execucao.json"
+
+
+def _rss_proc(pid="self"):
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def _filhos_proc():
+    """PIDs dos processos filhos (pelo ppid em /proc/<pid>/stat)."""
+    meu = str(os.getpid())
+    filhos = []
+    for pasta in Path("/proc").iterdir():
+        if not pasta.name.isdigit():
+            continue
+        try:
+            # o nome do processo (entre parênteses) pode ter espaços
+            campos = (pasta / "stat").read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if campos[1] == meu:
+            filhos.append(pasta.name)
+    return filhos
+
+
+def memoria_atual_mb(filhos=False):
+    """
+    RSS atual do processo em MB (com filhos=True, somado ao dos processos
+    filhos vivos), ou None se não houver como medir.
+    """
+    if psutil is not None:
+        processo = psutil.Process()
+        total = processo.memory_info().rss
+        if filhos:
+            for filho in processo.children(recursive=True):
+                try:
+                    total += filho.memory_info().rss
+                except psutil.Error:  # terminou entre a listagem e a leitura
+                    pass
+        return total / 2**20
+    try:
+        total = _rss_proc()
+    except (OSError, ValueError, AttributeError):
+        return None
+    if filhos:
+        for pid in _filhos_proc():
+            try:
+                total += _rss_proc(pid)
+            except (OSError, ValueError):
+                pass
+    return total / 2**20
+
+
+def pico_memoria_mb():
+    """Maior RSS do processo desde o início, em MB (None se não houver como medir)."""
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux informa em KB; macOS, em bytes
+        return pico / 2**20 if sys.platform == "darwin" else pico / 2**10
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2**20
+    return None
+
+
+def pico_memoria_filho_mb():
+    """Maior pico de RSS entre os processos filhos já encerrados, em MB (None se não houver como medir)."""
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return pico / 2**20 if sys.platform == "darwin" else pico / 2**10
+
+
+def _duracao(segundos):
+    segundos = int(segundos)
+    return f"{segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+
+
+def _tamanho(n):
+    for unidade in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.1f} {unidade}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+class Etapa:
+    """Medidas de uma etapa; bytes e itens são atualizados pelo código medido."""
+
+    def __init__(self, nome, unidade="registros", total_bytes=None):
+        self.nome = nome
+        self.unidade = unidade
+        self.total_bytes = total_bytes
+        self.bytes = 0
+        self.itens = 0
+        self.inicio = time.perf_counter()
+        self.segundos = None
+        self.pico_mb = None
+
+    def avancar(self, n_bytes=0, itens=0):
+        self.bytes += n_bytes
+        self.itens += itens
+
+    def decorrido(self):
+        return (self.segundos if self.segundos is not None
+                else time.perf_counter() - self.inicio)
+
+    def linha(self):
+        """Texto de progresso: percentual, vazão, tempo decorrido e estimado."""
+        t = self.decorrido()
+        partes = [f"[{self.nome}]"]
+        if self.total_bytes:
+            fracao = min(self.bytes / self.total_bytes, 1.0)
+            partes.append(f"{fracao:6.1%} ({_tamanho(self.bytes)} de {_tamanho(self.total_bytes)})")
+            if 0 < fracao < 1:
+                partes.append(f"restante ~{_duracao(t * (1 - fracao) / fracao)}")
+        if self.itens:
+            partes.append(f"{self.itens:,} {self.unidade} ({self.itens / max(t, 1e-9):,.0f}/s)".replace(",", "."))
+        partes.append(f"decorrido {_duracao(t)}")
+        return "  ".join(partes)
+
+    def como_dict(self):
+        t = self.decorrido()
+        return {
+            "etapa": self.nome,
+            "segundos": round(t, 3),
+            "itens": self.itens,
+            "unidade": self.unidade,
+            "itens_por_s": round(self.itens / t, 1) if t > 0 and self.itens else None,
+            "bytes": self.bytes,
+            "mb_por_s": round(self.bytes / 2**20 / t, 2) if t > 0 and self.bytes else None,
+            "pico_mb": round(self.pico_mb, 1) if self.pico_mb is not None else None,
+        }
+
+
+class LeituraContada:
+    """Arquivo binário que soma em etapa.bytes o que já foi lido (para o iterparse)."""
+
+    def __init__(self, f, etapa):
+        self._f = f
+        self._etapa = etapa
+
+    def read(self, n=-1):
+        dados = self._f.read(n)
+        self._etapa.bytes += len(dados)
+        return dados
+
+
+class _SaidaComProgresso:
+    """
+    sys.stdout durante uma etapa mostrada no terminal: cada texto escrito
+    apaga antes a linha de progresso ("\r" sem quebra), que a thread de
+    monitoramento redesenha na amostra seguinte.
+    """
+
+    def __init__(self, saida):
+        self._saida = saida
+        self._trava = threading.Lock()
+        self._largura = 0
+
+    def write(self, texto):
+        with self._trava:
+            self._apagar()
+            return self._saida.write(texto)
+
+    def progresso(self, texto):
+        with self._trava:
+            self._largura = max(self._largura, len(texto))
+            self._saida.write("\r" + texto.ljust(self._largura))
+            self._saida.flush()
+
+    def _apagar(self):
+        if self._largura:
+            self._saida.write("\r" + " " * self._largura + "\r")
+            self._largura = 0
+
+    def fechar(self):
+        with self._trava:
+            self._apagar()
+            self._saida.flush()
+
+    def flush(self):
+        self._saida.flush()
+
+    def __getattr__(self, nome):
+        return getattr(self._saida, nome)
+
+
+class Instrumentacao:
+    """Etapas medidas de uma execução e o progresso mostrado no terminal."""
+
+    def __init__(self, mostrar=True, intervalo=0.5):
+        self.mostrar = mostrar
+        self.intervalo = intervalo
+        self.etapas = []
+        self.inicio = datetime.now()
+        self._t0 = time.perf_counter()
+
+    def _monitorar(self, etapa, parar, saida):
+        while not parar.wait(self.intervalo):
+            mem = memoria_atual_mb(filhos=True)
+            if mem is not None and (etapa.pico_mb is None or mem > etapa.pico_mb):
+                etapa.pico_mb = mem
+            if saida is not None:
+                saida.progresso(etapa.linha() + (f"  mem {mem:,.0f} MB".replace(",", ".") if mem else ""))
+
+    @contextmanager
+    def etapa(self, nome, unidade="registros", total_bytes=None):
+        etapa = Etapa(nome, unidade, total_bytes)
+        self.etapas.append(etapa)
+        parar = threading.Event()
+        saida = original = None
+        if self.mostrar:
+            original = sys.stdout
+            saida = sys.stdout = _SaidaComProgresso(original)
+        monitor = threading.Thread(target=self._monitorar, args=(etapa, parar, saida), daemon=True)
+        monitor.start()
+        try:
+            yield etapa
+        finally:
+            parar.set()
+            monitor.join()
+            if saida is not None:
+                saida.fechar()
+                sys.stdout = original
+            etapa.segundos = time.perf_counter() - etapa.inicio
+            mem = memoria_atual_mb()
+            if mem is not None and (etapa.pico_mb is None or mem > etapa.pico_mb):
+                etapa.pico_mb = mem
+            if self.mostrar:
+                print(f"[TEMPO] {etapa.linha()}")
+
+    def como_dict(self, **extra):
+        pico = pico_memoria_mb()
+        pico_filho = pico_memoria_filho_mb()
+        return {
+            "inicio": f"{self.inicio:%Y-%m-%d %H:%M:%S}",
+            "fim": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+            "segundos": round(time.perf_counter() - self._t0, 3),
+            "pico_memoria_mb": round(pico, 1) if pico is not None else None,
+            # maior processo filho encerrado (workers); não soma filhos simultâneos
+            "pico_memoria_filho_mb": round(pico_filho, 1) if pico_filho else None,
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            **extra,
+            "etapas": [e.como_dict() for e in self.etapas],
+        }
+
+    def gravar(self, outdir, **extra):
+        """Grava <outdir>/metricas_execucao.json; extra entra no nível de cima (entrada, versão...)."""
+        destino = Path(outdir) / ARQUIVO_METRICAS
+        destino.write_text(json.dumps(self.como_dict(**extra), ensure_ascii=False, indent=1),
+                           encoding="utf-8")
+        if self.mostrar:
+            print(f"[OK] Gerado: {destino}")
+        return destino
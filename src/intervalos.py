@@ -0,0 +1,117 @@
+# =============================================================
+# Módulo: intervalos.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Operações vetorizadas (numpy) sobre intervalos de tempo em
+# segundos epoch: união de sobreposições, divisão por dia, junção de
+# instantes aos intervalos que os contêm e tempo coberto até um instante.
+# =============================================================
+#
+# Tudo é feito com ordenação + varredura em arrays, sem laços Python por
+# intervalo: O(n log n) para qualquer volume (anos de estágios de sono por
+# minuto, por exemplo).
+
+import numpy as np
+
+DIA_S = 86400
+
+
+def unir_intervalos(inicio, fim, offset=None):
+    """
+    Une intervalos [inicio, fim) que se sobrepõem ou se tocam (por exemplo o
+    mesmo sono registrado pelo Watch e pelo iPhone). Devolve os arrays
+    (inicio, fim, offset) dos intervalos unidos, em ordem; o offset (minutos)
+    de cada intervalo unido é o do primeiro intervalo que o compõe.
+    """
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fim = np.asarray(fim, dtype=np.int64)
+    offset = np.zeros(len(inicio), dtype=np.int64) if offset is None else np.asarray(offset, dtype=np.int64)
+
+    validos = fim > inicio
+    inicio, fim, offset = inicio[validos], fim[validos], offset[validos]
+    if len(inicio) == 0:
+        return inicio, fim, offset
+
+    ordem = np.lexsort((fim, inicio))
+    inicio, fim, offset = inicio[ordem], fim[ordem], offset[ordem]
+
+    # maior fim visto até cada posição; um novo grupo começa quando o início
+    # passa do maior fim anterior
+    fim_acum = np.maximum.accumulate(fim)
+    novo = np.empty(len(inicio), dtype=bool)
+    novo[0] = True
+    novo[1:] = inicio[1:] > fim_acum[:-1]
+
+    primeiros = np.flatnonzero(novo)
+    ultimos = np.append(primeiros[1:] - 1, len(inicio) - 1)
+    return inicio[primeiros], fim_acum[ultimos], offset[primeiros]
+
+
+def dividir_por_dia(inicio, fim, inicio_dia_h=0):
+    """
+    Divide intervalos [inicio, fim) (segundos no horário local) nas
+    fronteiras de dia. O "dia" começa às inicio_dia_h horas: com 0 é o dia
+    do calendário; com 18, por exemplo, o dia D vai de D-1 18:00 a D 18:00,
+    e uma noite inteira de sono é creditada à data em que termina.
+
+    Devolve (dia, segundos): índice do dia (dias desde 1970-01-01) e a
+    duração de cada pedaço.
+    """
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fim = np.asarray(fim, dtype=np.int64)
+    desloc = ((24 - inicio_dia_h) % 24) * 3600
+
+    d0 = (inicio + desloc) // DIA_S
+    d1 = (fim - 1 + desloc) // DIA_S
+    n = np.maximum(d1 - d0 + 1, 0)
+
+    # um pedaço por dia coberto: repete cada intervalo n vezes e numera 0..n-1
+    idx = np.repeat(np.arange(len(inicio)), n)
+    k = np.arange(len(idx)) - np.repeat(np.cumsum(n) - n, n)
+    dia = d0[idx] + k
+    ini_pedaco = np.maximum(inicio[idx], dia * DIA_S - desloc)
+    fim_pedaco = np.minimum(fim[idx], (dia + 1) * DIA_S - desloc)
+    return dia, fim_pedaco - ini_pedaco
+
+
+def somar_por_dia(dia, valores):
+    """Soma valores por índice de dia; devolve (dias únicos ordenados, somas)."""
+    dias, inverso = np.unique(dia, return_inverse=True)
+    return dias, np.bincount(inverso, weights=valores, minlength=len(dias))
+
+
+def juntar_intervalos(inicio, fim, tempos):
+    """
+    Junção por intervalo: pares (i, j) com inicio[i] <= tempos[j] <= fim[i].
+    tempos deve estar em ordem crescente; cada intervalo vira uma faixa
+    contígua de tempos localizada por busca binária (merge dos dois lados
+    ordenados), sem comparar todos os pares. Intervalos sobrepostos recebem
+    os mesmos instantes. Os pares saem agrupados por intervalo, em ordem de
+    tempo dentro de cada um.
+    """
+    tempos = np.asarray(tempos)
+    a = np.searchsorted(tempos, np.asarray(inicio), side="left")
+    b = np.searchsorted(tempos, np.asarray(fim), side="right")
+    n = np.maximum(b - a, 0)
+    i = np.repeat(np.arange(len(a)), n)
+    j = np.repeat(a, n) + np.arange(len(i)) - np.repeat(np.cumsum(n) - n, n)
+    return i, j
+
+
+def cobertura(inicio, fim, tempos):
+    """
+    Segundos cobertos até cada instante de tempos (em (-inf, t]) por
+    intervalos [inicio, fim) disjuntos e em ordem, como os devolvidos por
+    unir_intervalos. A cobertura de [a, b) é cobertura(.., b) - cobertura(.., a).
+    """
+    inicio = np.asarray(inicio, dtype=np.int64)
+    fim = np.asarray(fim, dtype=np.int64)
+    tempos = np.asarray(tempos, dtype=np.int64)
+    if len(inicio) == 0:
+        return np.zeros(len(tempos), dtype=np.int64)
+    duracao = fim - inicio
+    acum = np.concatenate(([0], np.cumsum(duracao)))
+    # k = intervalos que começam até t; o último deles pode estar em curso
+    k = np.searchsorted(inicio, tempos, side="right")
+    ultimo = np.maximum(k - 1, 0)
+    parcial = np.clip(tempos - inicio[ultimo], 0, duracao[ultimo])
+    return np.where(k > 0, acum[ultimo] + parcial, 0)
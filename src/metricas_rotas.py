@@ -0,0 +1,241 @@
+# =============================================================
+# Módulo: metricas_rotas.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Métricas por rota GPX (distância, desnível, tempo em movimento, ritmo e
+# velocidade) calculadas em arrays numpy sobre o routes_all.csv, e
+# trajeto simplificado opcional (Douglas–Peucker).
+# =============================================================
+#
+# Saídas em <saida>/rotas/:
+#   rotas_resumo.csv        uma linha por rota (arquivo GPX) com o workout_id
+#   rotas_parciais_km.csv   tempo, ritmo e velocidade de cada km de cada rota
+#   rotas_simplificadas.csv pontos mantidos pela simplificação (se pedida)
+#
+# "rota" é o nome do GPX sem extensão (coluna workout_id do routes_all.csv).
+#
+# O routes_all.csv é lido em blocos; como os pontos de um arquivo são
+# contíguos, só a rota que atravessa o fim de um bloco passa para o
+# seguinte. Dentro do bloco, todos os segmentos (ponto i -> i+1 da mesma
+# rota) são calculados de uma vez e somados por rota com bincount.
+#
+# Uso:
+#   from metricas_rotas import gerar_metricas_rotas
+#   gerar_metricas_rotas("Saida", tolerancia_m=5)
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from treinos import ler_treinos, treino_das_rotas
+
+PASTA_ROTAS = "rotas"
+RAIO_TERRA_M = 6_371_008.8
+# segmento em movimento: velocidade mínima e maior intervalo sem pausa
+VELOCIDADE_MIN_MS = 0.5
+PAUSA_MAX_S = 30.0
+# tolerância usada pelo pipeline para o trajeto simplificado
+TOLERANCIA_PADRAO_M = 5.0
+LINHAS_POR_BLOCO = 1_000_000
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distância em metros entre pares de pontos (graus), vetorizada."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * RAIO_TERRA_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def douglas_peucker(x, y, tolerancia, grupo=None):
+    """
+    Máscara dos pontos mantidos pela simplificação de Douglas–Peucker das
+    linhas (x, y em metros); grupo separa linhas contíguas (uma por rota).
+    Em vez da recursão ponto a ponto, cada rodada trata de uma vez todos os
+    trechos pendentes de todas as linhas: distância ao segmento, ponto mais
+    distante por trecho (reduceat) e divisão dos trechos acima da tolerância.
+    O número de rodadas é a profundidade da recursão, não o de pontos.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    manter = np.zeros(n, dtype=bool)
+    if n == 0:
+        return manter
+    if grupo is None:
+        inicios = np.array([0])
+    else:
+        inicios = np.flatnonzero(np.r_[True, grupo[1:] != grupo[:-1]])
+    fins = np.r_[inicios[1:] - 1, n - 1]
+    manter[inicios] = manter[fins] = True
+
+    a, b = inicios, fins
+    while len(a):
+        internos = b - a - 1
+        ok = internos > 0
+        a, b, internos = a[ok], b[ok], internos[ok]
+        if not len(a):
+            break
+        trecho = np.repeat(np.arange(len(a)), internos)
+        pos = np.repeat(a + 1, internos) + np.arange(len(trecho)) - np.repeat(np.cumsum(internos) - internos, internos)
+        dx, dy = (x[b] - x[a])[trecho], (y[b] - y[a])[trecho]
+        px, py = x[pos] - x[a][trecho], y[pos] - y[a][trecho]
+        comprimento = np.hypot(dx, dy)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            dist = np.where(comprimento > 0, np.abs(dx * py - dy * px) / comprimento, np.hypot(px, py))
+        inicio_trecho = np.cumsum(internos) - internos
+        maior = np.maximum.reduceat(dist, inicio_trecho)
+        # primeiro ponto de cada trecho com a distância máxima
+        candidatos = np.flatnonzero(dist == maior[trecho])
+        _, primeiro = np.unique(trecho[candidatos], return_index=True)
+        meio = pos[candidatos[primeiro]]
+        dividir = maior > tolerancia
+        meio = meio[dividir]
+        manter[meio] = True
+        a, b = np.r_[a[dividir], meio], np.r_[meio, b[dividir]]
+    return manter
+
+
+def _simplificar(bloco, grupo, tolerancia):
+    """Máscara dos pontos mantidos, rota a rota (projeção local em metros)."""
+    lat, lon = bloco["lat"].to_numpy(np.float64), bloco["lon"].to_numpy(np.float64)
+    validos = ~(np.isnan(lat) | np.isnan(lon))
+    g = grupo[validos]
+    # projeção equirretangular em torno da latitude média de cada rota
+    lat_media = np.bincount(g, weights=lat[validos]) / np.maximum(np.bincount(g), 1)
+    x = np.radians(lon[validos]) * np.cos(np.radians(lat_media[g])) * RAIO_TERRA_M
+    y = np.radians(lat[validos]) * RAIO_TERRA_M
+    manter = np.zeros(len(bloco), dtype=bool)
+    manter[validos] = douglas_peucker(x, y, tolerancia, g)
+    return manter
+
+
+def _metricas_bloco(bloco, tolerancia):
+    """(resumo, parciais, simplificados) das rotas completas de um bloco."""
+    arquivos = bloco["file"].to_numpy()
+    novo = np.r_[True, arquivos[1:] != arquivos[:-1]]
+    grupo = np.cumsum(novo) - 1
+    n_grupos = int(grupo[-1]) + 1
+    primeiros = np.flatnonzero(novo)
+    ultimos = np.r_[primeiros[1:] - 1, len(bloco) - 1]
+
+    tempo = pd.to_datetime(bloco["time"], utc=True, format="ISO8601", errors="coerce")
+    t = ((tempo - pd.Timestamp(0, tz="UTC")) / pd.Timedelta(seconds=1)).to_numpy(np.float64)
+    lat, lon = bloco["lat"].to_numpy(np.float64), bloco["lon"].to_numpy(np.float64)
+    ele = bloco["ele"].to_numpy(np.float64)
+
+    # segmentos i -> i+1 dentro da mesma rota
+    mesma = ~novo[1:]
+    g = grupo[1:][mesma]
+    d = np.nan_to_num(haversine_m(lat[:-1], lon[:-1], lat[1:], lon[1:]))[mesma]
+    dt = np.diff(t)[mesma]
+    dele = np.nan_to_num(np.diff(ele))[mesma]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        velocidade = d / dt
+    movendo = (dt > 0) & (dt <= PAUSA_MAX_S) & (velocidade >= VELOCIDADE_MIN_MS)
+    dt_mov = np.where(movendo, dt, 0.0)
+
+    def somar(pesos):
+        return np.bincount(g, weights=pesos, minlength=n_grupos)
+
+    distancia = somar(d)
+    tempo_mov = somar(dt_mov)
+    vel_max = np.zeros(n_grupos)
+    np.maximum.at(vel_max, g[movendo], velocidade[movendo])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        resumo = pd.DataFrame({
+            "rota": bloco["workout_id"].to_numpy()[primeiros],
+            "file": arquivos[primeiros],
+            "pontos": ultimos - primeiros + 1,
+            "inicio": bloco["time"].to_numpy()[primeiros],
+            "fim": bloco["time"].to_numpy()[ultimos],
+            "inicio_epoch": t[primeiros],
+            "duracao_s": t[ultimos] - t[primeiros],
+            "distancia_m": distancia,
+            "tempo_movimento_s": tempo_mov,
+            "ganho_elevacao_m": somar(np.maximum(dele, 0)),
+            "perda_elevacao_m": somar(np.maximum(-dele, 0)),
+            "velocidade_media_kmh": distancia / tempo_mov * 3.6,
+            "velocidade_max_kmh": vel_max * 3.6,
+            "ritmo_medio_min_km": (tempo_mov / 60) / (distancia / 1000),
+        })
+
+    # parciais por km: distância acumulada na rota ao fim de cada segmento
+    acum = np.cumsum(d)
+    base = np.r_[0.0, acum][np.searchsorted(g, np.arange(n_grupos))]
+    km = ((acum - base[g]) // 1000).astype(np.int64)
+    parciais = pd.DataFrame({"grupo": g, "km": km + 1, "distancia_m": d, "tempo_movimento_s": dt_mov})
+    parciais = parciais.groupby(["grupo", "km"], sort=True).sum().reset_index()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        parciais["ritmo_min_km"] = (parciais["tempo_movimento_s"] / 60) / (parciais["distancia_m"] / 1000)
+        parciais["velocidade_kmh"] = parciais["distancia_m"] / parciais["tempo_movimento_s"] * 3.6
+    parciais.insert(0, "rota", resumo["rota"].to_numpy()[parciais.pop("grupo").to_numpy()])
+
+    simplificados = None
+    if tolerancia is not None:
+        manter = _simplificar(bloco, grupo, tolerancia)
+        simplificados = bloco.loc[manter, ["workout_id", "idx", "lat", "lon", "ele", "time"]]
+        simplificados = simplificados.rename(columns={"workout_id": "rota"})
+    return resumo, parciais, simplificados
+
+
+def gerar_metricas_rotas(outdir, tolerancia_m=None):
+    """
+    Gera <outdir>/rotas a partir do routes_all.csv. Com tolerancia_m grava
+    também o trajeto simplificado (Douglas–Peucker com essa tolerância em
+    metros); as métricas usam sempre todos os pontos.
+    """
+    outdir = Path(outdir)
+    routes_csv = outdir / "routes_all.csv"
+    if not routes_csv.exists():
+        print("[INFO] routes_all.csv não encontrado; métricas de rotas puladas.")
+        return None
+
+    pasta = outdir / PASTA_ROTAS
+    pasta.mkdir(exist_ok=True)
+    tipos = {"workout_id": "string", "idx": "int64", "lat": "float64", "lon": "float64",
+             "ele": "float64", "time": "string", "file": "string"}
+    resumos, parciais = [], []
+    simplificado_csv = pasta / "rotas_simplificadas.csv"
+    if simplificado_csv.exists():
+        simplificado_csv.unlink()
+    pontos_mantidos = 0
+
+    def processar(bloco):
+        nonlocal pontos_mantidos
+        resumo, parcial, simplificados = _metricas_bloco(bloco.reset_index(drop=True), tolerancia_m)
+        resumos.append(resumo)
+        parciais.append(parcial)
+        if simplificados is not None:
+            simplificados.to_csv(simplificado_csv, mode="a", index=False,
+                                 header=not simplificado_csv.exists())
+            pontos_mantidos += len(simplificados)
+
+    resto = None
+    for bloco in pd.read_csv(routes_csv, dtype=tipos, chunksize=LINHAS_POR_BLOCO):
+        if resto is not None:
+            bloco = pd.concat([resto, bloco], ignore_index=True)
+        # a última rota do bloco pode continuar no próximo
+        outras = np.flatnonzero((bloco["file"] != bloco["file"].iloc[-1]).to_numpy(bool))
+        fim = int(outras[-1]) + 1 if len(outras) else 0
+        resto = bloco.iloc[fim:]
+        if fim:
+            processar(bloco.iloc[:fim])
+    if resto is not None and len(resto):
+        processar(resto)
+    if not resumos:
+        print("[INFO] routes_all.csv sem pontos; métricas de rotas puladas.")
+        return None
+
+    resumo = pd.concat(resumos, ignore_index=True)
+    treinos = ler_treinos(outdir)
+    if treinos is not None and not treinos.empty:
+        resumo.insert(0, "workout_id", treino_das_rotas(treinos, resumo["file"], resumo["inicio_epoch"]))
+    resumo = resumo.drop(columns="inicio_epoch").round(2)
+    resumo.to_csv(pasta / "rotas_resumo.csv", index=False)
+    pd.concat(parciais, ignore_index=True).round(2).to_csv(pasta / "rotas_parciais_km.csv", index=False)
+
+    total = int(resumo["pontos"].sum())
+    print(f"[OK] Gerado: {pasta} ({len(resumo)} rotas; {total:,} pontos".replace(",", ".")
+          + (f"; {pontos_mantidos:,} mantidos na simplificação)".replace(",", ".")
+             if tolerancia_m is not None else ")"))
+    return pasta
@@ -0,0 +1,412 @@
+# =============================================================
+# Script: pipeline.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Ponto de entrada único do processamento de um participante: extração,
+# auditoria, tabelas derivadas e planilhas, como etapas com entradas e
+# saídas declaradas. Uma etapa cujas entradas, parâmetros e código não
+# mudaram desde a última execução (e cujas saídas continuam lá) é pulada.
+# =============================================================
+#
+# Uso:
+#   python src\pipeline.py <export.zip | pasta do export> [--saida Saida]
+#          [--metricas "Passos,FC repouso,Sono"] [--incremental] [--excel]
+#          [--processos N] [--forcar series,resumo | --forcar todas] [--sem-cache]
+#
+# <saida>/cache_etapas.json guarda, por etapa, a impressão digital (blake2b)
+# do conteúdo das entradas, dos parâmetros e do código-fonte dos módulos
+# usados, e a das saídas gravadas. Mudou o rótulo de um gráfico no
+# catalogo_metricas: só a etapa "series" roda de novo, sem reler o export.xml.
+# Se uma etapa roda e regrava as suas saídas com outro conteúdo, as etapas
+# que as leem mudam de entrada e rodam também.
+#
+# O código de uma etapa são os módulos de src/ que ela importa, direta ou
+# indiretamente (lidos das instruções import, fora do bloco __main__).
+# Ficam de fora instrumentacao (só mede) e, nas etapas que já registram nos
+# parâmetros a parte do catalogo_metricas que usam, o próprio catálogo.
+#
+# O hash de cada arquivo fica guardado com tamanho e mtime; enquanto eles não
+# mudam, o arquivo não é relido (o export.xml de vários GB só é lido por
+# inteiro quando muda). Membros de um export.zip usam o CRC do próprio ZIP.
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import zipfile
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+
+import apple_health_export_to_tables_v1_3 as extracao
+import audit_to_excel_charts as series
+import auditar_saude_resumo as resumo
+from batimentos_hrv import PASTA_HRV, gerar_metricas_hrv
+from catalogo_metricas import (DOMINIOS, NOMES_EXIBICAO, TIPOS_ADITIVOS, ler_lista_metricas,
+                               metricas_grafico, tipos_das_metricas)
+from cubo_agregacoes import gerar_cubo
+from deduplicacao_fontes import PASTA_DEDUP, PRIORIDADE_FONTES, gerar_deduplicacao
+from indice_temporal import PASTA_INDICE, gerar_indice
+from instrumentacao import Instrumentacao
+from metricas_rotas import TOLERANCIA_PADRAO_M, gerar_metricas_rotas
+from treinos import PASTA_TREINOS, gerar_treinos
+
+ARQUIVO_CACHE = "cache_etapas.json"
+VERSAO_CACHE = 1
+BLOCO_HASH = 1024 * 1024
+SRC = Path(__file__).resolve().parent
+
+# módulos que não mudam o conteúdo das saídas
+SEM_EFEITO_NAS_SAIDAS = ("instrumentacao",)
+
+CSVS_DOMINIO = tuple(f"export_{d}.csv" for d in DOMINIOS)
+
+
+class Etapa:
+    """
+    Etapa do pipeline. entradas/saidas são caminhos relativos à pasta de
+    saída; origem(indir) devolve as entradas lidas do export (XML, GPX);
+    parametros(config) o que, além das entradas, muda o resultado; modulos,
+    os módulos de src/ que a etapa chama (os que eles importam entram
+    sozinhos, ver modulos_da_etapa); sem_codigo, módulos importados cujo
+    efeito já está nos parâmetros. Assim o catalogo_metricas fica de fora da
+    extração, e mudar o rótulo de um gráfico não refaz a extração.
+    """
+
+    def __init__(self, nome, executar, entradas=(), saidas=(), origem=None,
+                 parametros=None, modulos=(), sem_codigo=(), unidade="registros"):
+        self.nome = nome
+        self.executar = executar
+        self.entradas = tuple(entradas)
+        self.saidas = tuple(saidas)
+        self.origem = origem
+        self.parametros = parametros
+        self.modulos = tuple(modulos)
+        self.sem_codigo = tuple(sem_codigo)
+        self.unidade = unidade
+
+
+class _Impressoes:
+    """Hash do conteúdo de arquivos e pastas, reaproveitado enquanto tamanho e mtime não mudam."""
+
+    def __init__(self, memo=None):
+        self.memo = dict(memo or {})
+        self.usados = {}
+
+    def arquivo(self, path):
+        st = path.stat()
+        chave = str(path.resolve())
+        # usados primeiro: um arquivo gravado nesta execução e lido por várias
+        # etapas (export_master.csv, parquet/...) é lido uma vez só
+        anterior = self.usados.get(chave) or self.memo.get(chave)
+        if anterior and anterior[0] == st.st_size and anterior[1] == st.st_mtime_ns:
+            digest = anterior[2]
+        else:
+            h = hashlib.blake2b(digest_size=16)
+            with open(path, "rb") as f:
+                for bloco in iter(lambda: f.read(BLOCO_HASH), b""):
+                    h.update(bloco)
+            digest = h.hexdigest()
+        self.usados[chave] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def caminho(self, path):
+        """Impressão de um arquivo, de uma pasta (todos os arquivos) ou de um membro do ZIP."""
+        if isinstance(path, extracao.MembroZip):
+            with zipfile.ZipFile(path.zip_path) as zf:
+                info = zf.getinfo(path.nome)
+            return f"zip:{info.CRC:08x}:{info.file_size}"
+        path = Path(path)
+        if path.is_file():
+            return self.arquivo(path)
+        if path.is_dir():
+            h = hashlib.blake2b(digest_size=16)
+            for arq in sorted(p for p in path.rglob("*") if p.is_file()):
+                h.update(f"{arq.relative_to(path).as_posix()}\x1f{self.arquivo(arq)}\n".encode("utf-8"))
+            return h.hexdigest()
+        return "ausente"
+
+
+def _eh_main(no):
+    return (isinstance(no, ast.If) and isinstance(no.test, ast.Compare)
+            and isinstance(no.test.left, ast.Name) and no.test.left.id == "__name__")
+
+
+@lru_cache(maxsize=None)
+def _importados(modulo, src):
+    """Módulos de src/ importados pelo módulo (inclusive dentro de funções e try)."""
+    pendentes, nomes = list(ast.parse((src / f"{modulo}.py").read_bytes()).body), set()
+    while pendentes:
+        no = pendentes.pop()
+        if _eh_main(no):
+            continue
+        if isinstance(no, ast.Import):
+            nomes.update(a.name.split(".")[0] for a in no.names)
+        elif isinstance(no, ast.ImportFrom) and no.module and not no.level:
+            nomes.add(no.module.split(".")[0])
+        pendentes.extend(ast.iter_child_nodes(no))
+    return frozenset(n for n in nomes if (src / f"{n}.py").is_file())
+
+
+def modulos_da_etapa(etapa, src=None):
+    """Módulos de src/ cujo código entra na chave da etapa, em ordem alfabética."""
+    src = src or SRC
+    fora = set(SEM_EFEITO_NAS_SAIDAS) | set(etapa.sem_codigo)
+    vistos, pendentes = set(), list(etapa.modulos)
+    while pendentes:
+        modulo = pendentes.pop()
+        if modulo in vistos or modulo in fora:
+            continue
+        vistos.add(modulo)
+        pendentes.extend(_importados(modulo, src))
+    return sorted(vistos)
+
+
+def _impressao(dados):
+    texto = json.dumps(dados, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _ler_cache(path):
+    if path.exists():
+        dados = json.loads(path.read_text(encoding="utf-8"))
+        if dados.get("versao") == VERSAO_CACHE:
+            return dados
+    return {"versao": VERSAO_CACHE, "etapas": {}, "arquivos": {}}
+
+
+def _gravar_cache(path, cache, impressoes):
+    cache["arquivos"] = impressoes.usados
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(cache, ensure_ascii=False, indent=1), encoding="utf-8")
+    tmp.replace(path)
+
+
+# ---------- etapas ----------
+# Cada função recebe o contexto da execução (entrada, saida, config e o que
+# as etapas anteriores deixaram em memória) e a instrumentacao.Etapa.
+
+def _extracao(ctx, progresso):
+    config = ctx["config"]
+    # registros em colunas compactas, reaproveitados pelo cubo e pelo índice
+    # (só se eles fazem parte desta execução)
+    usada = extracao.TabelaRegistros is not None and {"cubo", "indice"} & set(ctx["etapas"])
+    ctx["tabela"] = extracao.TabelaRegistros() if usada else None
+    # incremental sobre uma extração anterior: a tabela terá só os registros novos
+    ctx["anexou"] = config["incremental"] and extracao.incremental_anexa(ctx["saida"])
+    if ctx["anexou"] and ctx["cache_anterior"]:
+        ctx["master_antes"] = ctx["impressoes"].caminho(ctx["saida"] / "export_master.csv")
+    ctx["auditoria"] = extracao.processar_exportacao(
+        ctx["entrada"], ctx["saida"], gerar_excel=config["excel"],
+        gerar_parquet=extracao.pa is not None, incremental=config["incremental"],
+        processos=config["processos"], tabela=ctx["tabela"], progresso=progresso,
+        tipos=tipos_das_metricas(config["metricas"]))
+
+
+def _series(ctx, progresso):
+    ctx["series"] = series.main(ctx["saida"], ctx["config"]["metricas"])
+
+
+def _anexar(ctx, etapa):
+    """
+    Na extração incremental, o cubo e o índice só recebem os registros novos
+    se a versão gravada deles foi montada sobre o export_master.csv de antes
+    desta extração e não mudou desde então; senão (primeira execução, etapa
+    que falhou numa execução anterior, --sem-cache) são refeitos do histórico.
+    """
+    anterior = ctx["cache_anterior"].get(etapa)
+    return bool(ctx.get("anexou") and ctx.get("tabela") is not None and anterior
+                and anterior.get("entradas", {}).get("export_master.csv") == ctx.get("master_antes")
+                and anterior["saidas"] == ctx["saidas_atuais"])
+
+
+def _tabela(ctx, anexar):
+    # com a extração anexando, a tabela só tem os registros novos
+    return None if ctx.get("anexou") and not anexar else ctx.get("tabela")
+
+
+def _cubo(ctx, progresso):
+    anexar = _anexar(ctx, "cubo")
+    gerar_cubo(ctx["saida"], tabela=_tabela(ctx, anexar), anexar=anexar)
+
+
+def _indice(ctx, progresso):
+    anexar = _anexar(ctx, "indice")
+    gerar_indice(ctx["saida"], tabela=_tabela(ctx, anexar), anexar=anexar)
+
+
+ETAPAS = [
+    Etapa("extracao", _extracao,
+          origem=lambda indir: [extracao.localizar_xml(indir, "export*.xml", principal=True)],
+          saidas=("export_master.csv",) + CSVS_DOMINIO + tuple(extracao.SAIDAS_ELEMENTOS)
+          + ("export_master.xlsx", "parquet", PASTA_HRV, "manifesto_incremental.json"),
+          parametros=lambda c: {"tipos": sorted(tipos_das_metricas(c["metricas"]) or []) or None,
+                                "dominios": DOMINIOS, "incremental": c["incremental"],
+                                "excel": c["excel"], "parquet": extracao.pa is not None},
+          modulos=("apple_health_export_to_tables_v1_3",), sem_codigo=("catalogo_metricas",)),
+    Etapa("cda", lambda ctx, p: extracao.processar_cda(ctx["entrada"], ctx["saida"], progresso=p),
+          origem=lambda indir: [extracao.localizar_xml(indir, "export_cda*.xml")],
+          saidas=("cda_master.csv", "cda_cardiaco.csv", "cda_outros.csv"),
+          modulos=("apple_health_export_to_tables_v1_3",), sem_codigo=("catalogo_metricas",),
+          unidade="observações"),
+    Etapa("rotas", lambda ctx, p: extracao.processar_rotas(
+              ctx["entrada"], ctx["saida"], processos=ctx["config"]["processos"], progresso=p),
+          origem=extracao.encontrar_gpx, saidas=("routes_all.csv",),
+          modulos=("apple_health_export_to_tables_v1_3",), sem_codigo=("catalogo_metricas",),
+          unidade="pontos"),
+    Etapa("auditoria", lambda ctx, p: extracao.gerar_auditoria_simplificada(ctx["saida"], ctx.get("auditoria")),
+          entradas=("export_master.csv",),
+          saidas=("audit_simplificado.txt", "audit_simplificado.json"),
+          parametros=lambda c: {"dominios": DOMINIOS},
+          modulos=("apple_health_export_to_tables_v1_3",), sem_codigo=("catalogo_metricas",)),
+    Etapa("cubo", _cubo,
+          entradas=("export_master.csv", "parquet"), saidas=("cubo",),
+          modulos=("cubo_agregacoes",)),
+    Etapa("indice", _indice,
+          entradas=("export_master.csv", "parquet"), saidas=(PASTA_INDICE,),
+          modulos=("indice_temporal",)),
+    Etapa("deduplicacao", lambda ctx, p: gerar_deduplicacao(ctx["saida"]),
+          entradas=(PASTA_INDICE,), saidas=(PASTA_DEDUP,),
+          parametros=lambda c: {"prioridade": PRIORIDADE_FONTES, "tipos": TIPOS_ADITIVOS},
+          modulos=("deduplicacao_fontes",), sem_codigo=("catalogo_metricas",)),
+    Etapa("treinos", lambda ctx, p: gerar_treinos(ctx["saida"]),
+          entradas=("export_workouts.csv", "routes_all.csv", PASTA_INDICE, "export_cardiaco.csv"),
+          saidas=(PASTA_TREINOS,), modulos=("treinos",)),
+    Etapa("metricas_rotas", lambda ctx, p: gerar_metricas_rotas(ctx["saida"], tolerancia_m=TOLERANCIA_PADRAO_M),
+          entradas=("routes_all.csv",), saidas=("rotas",),
+          parametros=lambda c: {"tolerancia_m": TOLERANCIA_PADRAO_M}, modulos=("metricas_rotas",)),
+    Etapa("hrv", lambda ctx, p: gerar_metricas_hrv(ctx["saida"]),
+          entradas=(PASTA_HRV,), saidas=("hrv_metricas.csv",),
+          modulos=("batimentos_hrv",), unidade="medições"),
+    Etapa("resumo", lambda ctx, p: resumo.main(ctx["saida"]),
+          entradas=("audit_simplificado.json", "audit_simplificado.txt"),
+          saidas=("audit_resumo_graficos.xlsx",),
+          parametros=lambda c: {"nomes": NOMES_EXIBICAO}, modulos=("auditar_saude_resumo",)),
+    Etapa("series", _series,
+          entradas=("cubo", "parquet", PASTA_DEDUP, "export_master.csv") + CSVS_DOMINIO,
+          saidas=("timeseries_resumo.xlsx",),
+          parametros=lambda c: {"graficos": metricas_grafico(c["metricas"]), "aditivos": TIPOS_ADITIVOS},
+          modulos=("audit_to_excel_charts",)),
+]
+NOMES_ETAPAS = [e.nome for e in ETAPAS]
+
+
+def _validar_etapas(nomes):
+    desconhecidas = set(nomes) - set(NOMES_ETAPAS)
+    if desconhecidas:
+        raise ValueError(f"Etapas desconhecidas: {', '.join(sorted(desconhecidas))} "
+                         f"(etapas: {', '.join(NOMES_ETAPAS)})")
+
+
+def executar_pipeline(entrada, saida, metricas=None, incremental=False, gerar_excel=False,
+                      processos=1, forcar=(), inst=None, etapas=None, usar_cache=True):
+    """
+    Roda as etapas em ordem sobre o export em entrada (pasta ou export.zip),
+    pulando as que não mudaram. forcar: nomes de etapas a rodar de qualquer
+    jeito ("todas" para todas). etapas: só estas (padrão: todas), na ordem
+    de ETAPAS. Com usar_cache=False todas rodam, sem calcular hashes nem
+    gravar o cache_etapas.json. Com inst (Instrumentacao) as etapas são
+    medidas nela e quem chamou grava as métricas; sem inst, o pipeline grava
+    <saida>/metricas_execucao.json.
+
+    Devolve o contexto da execução: "executadas" e "puladas" (nomes) e, se a
+    etapa series rodou, "series" (séries diárias por métrica).
+    """
+    saida = Path(saida)
+    saida.mkdir(parents=True, exist_ok=True)
+    forcar = set(NOMES_ETAPAS if "todas" in forcar else forcar)
+    _validar_etapas(forcar)
+    if etapas is not None:
+        _validar_etapas(etapas)
+    selecionadas = [e for e in ETAPAS if etapas is None or e.nome in etapas]
+
+    config = {"metricas": metricas, "incremental": incremental, "excel": gerar_excel,
+              "processos": processos}
+    ctx = {"entrada": Path(entrada), "saida": saida, "config": config,
+           "etapas": [e.nome for e in selecionadas], "executadas": [], "puladas": []}
+    gravar_metricas = inst is None
+    inst = inst or Instrumentacao()
+
+    cache_path = saida / ARQUIVO_CACHE
+    cache = _ler_cache(cache_path) if usar_cache else None
+    impressoes = _Impressoes(cache["arquivos"] if usar_cache else None)
+    ctx["impressoes"] = impressoes
+    ctx["cache_anterior"] = dict(cache["etapas"]) if usar_cache else {}
+    codigo = {}
+
+    for etapa in selecionadas:
+        if not usar_cache:
+            with inst.etapa(etapa.nome, unidade=etapa.unidade) as progresso:
+                etapa.executar(ctx, progresso)
+            ctx["executadas"].append(etapa.nome)
+            continue
+
+        entradas = {nome: impressoes.caminho(saida / nome) for nome in etapa.entradas}
+        if etapa.origem is not None:
+            for item in etapa.origem(ctx["entrada"]) or ():
+                if item is not None:
+                    entradas[str(getattr(item, "relativo", item))] = impressoes.caminho(item)
+        modulos = modulos_da_etapa(etapa, SRC)
+        for modulo in modulos:
+            if modulo not in codigo:
+                codigo[modulo] = impressoes.caminho(SRC / f"{modulo}.py")
+        chave = _impressao({
+            "entradas": entradas,
+            "parametros": etapa.parametros(config) if etapa.parametros else None,
+            "codigo": {m: codigo[m] for m in modulos},
+        })
+        saidas = {nome: impressoes.caminho(saida / nome) for nome in etapa.saidas}
+        anterior = cache["etapas"].get(etapa.nome)
+        if (etapa.nome not in forcar and anterior is not None
+                and anterior["chave"] == chave and anterior["saidas"] == saidas):
+            print(f"[CACHE] {etapa.nome}: entradas, parâmetros e código sem mudança (pulando).")
+            ctx["puladas"].append(etapa.nome)
+            continue
+
+        cache["etapas"].pop(etapa.nome, None)
+        ctx["saidas_atuais"] = saidas
+        with inst.etapa(etapa.nome, unidade=etapa.unidade) as progresso:
+            etapa.executar(ctx, progresso)
+        ctx["executadas"].append(etapa.nome)
+        cache["etapas"][etapa.nome] = {
+            "chave": chave,
+            "entradas": entradas,
+            "saidas": {nome: impressoes.caminho(saida / nome) for nome in etapa.saidas},
+            "executada_em": f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+        }
+        # a cada etapa: uma falha adiante não perde o que já foi feito
+        _gravar_cache(cache_path, cache, impressoes)
+
+    for nome in ("tabela", "impressoes", "cache_anterior", "saidas_atuais"):
+        ctx.pop(nome, None)
+    if usar_cache:
+        _gravar_cache(cache_path, cache, impressoes)
+    if gravar_metricas:
+        inst.gravar(saida, entrada=str(entrada), incremental=incremental,
+                    etapas_puladas=ctx["puladas"], script=Path(__file__).name)
+    return ctx
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processa o export do Apple Saúde de um participante.")
+    parser.add_argument("entrada", help="pasta do export (com export.xml) ou export.zip")
+    parser.add_argument("--saida", default="Saida", help="pasta de saída (padrão: Saida)")
+    parser.add_argument("--metricas", default=None,
+                        help="métricas do catalogo_metricas, separadas por vírgula (padrão: todas)")
+    parser.add_argument("--incremental", action="store_true", help="ingere só os registros novos")
+    parser.add_argument("--excel", action="store_true", help="gera também export_master.xlsx")
+    parser.add_argument("--processos", type=int, default=os.cpu_count() or 1,
+                        help="processos da extração e das rotas (padrão: todos os núcleos)")
+    parser.add_argument("--forcar", default="",
+                        help=f"etapas a refazer mesmo sem mudança, separadas por vírgula, ou 'todas' "
+                             f"({', '.join(NOMES_ETAPAS)})")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="roda todas as etapas, sem ler nem gravar o cache_etapas.json")
+    args = parser.parse_args()
+
+    ctx = executar_pipeline(args.entrada, args.saida, metricas=ler_lista_metricas(args.metricas),
+                            incremental=args.incremental, gerar_excel=args.excel,
+                            processos=args.processos, usar_cache=not args.sem_cache,
+                            forcar=[e.strip() for e in args.forcar.split(",") if e.strip()])
+    print(f"[OK] Pipeline concluído: {len(ctx['executadas'])} etapa(s) executada(s), "
+          f"{len(ctx['puladas'])} pulada(s) sem mudança.")
@@ -0,0 +1,181 @@
+# =============================================================
+# Script: processar_coorte.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Processamento em lote de uma coorte: um export do Apple Saúde por
+# participante, processados em paralelo (um processo por participante).
+# =============================================================
+#
+# Estrutura esperada da pasta da coorte (uma subpasta por participante):
+#
+#   coorte/
+#   ├─ P001/apple_health_export/export.xml
+#   ├─ P002/export.xml
+#   ├─ P003/export.zip      (lido direto, sem extrair)
+#   └─ ...
+#
+# Para cada participante roda o pipeline (pipeline.executar_pipeline:
+# extração, auditoria, tabelas derivadas e séries temporais) em
+# <saida>/<participante>/ (pastas isoladas). Ao final
+# grava as tabelas consolidadas da coorte:
+#   - coorte_diario.csv  (participante, data, uma coluna por métrica)
+#   - coorte_status.csv  (situação e tempo de cada participante)
+# e, por participante, processamento.log e metricas_execucao.json (tempo e
+# pico de memória de cada etapa).
+#
+# Uso:
+#   python src\processar_coorte.py <pasta_coorte> [--saida Saida_coorte]
+#                                  [--processos N] [--incremental] [--excel]
+#                                  [--metricas "Passos,FC repouso,Sono"] [--sem-cache]
+#
+# Como no pipeline, um participante cujo export não mudou desde a última
+# execução tem as etapas puladas (cache_etapas.json na pasta dele); com
+# --sem-cache todas as etapas rodam de novo.
+#
+# Com --metricas (nomes do catalogo_metricas) só os tipos HK dessas métricas
+# são extraídos e só as suas séries entram no coorte_diario.csv.
+
+import argparse
+import contextlib
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+import apple_health_export_to_tables_v1_3 as extracao
+import audit_to_excel_charts as series
+from catalogo_metricas import ler_lista_metricas
+from instrumentacao import Instrumentacao
+from pipeline import executar_pipeline
+
+
+def encontrar_participantes(pasta_coorte: Path):
+    """
+    {participante: pasta com o export.xml ou o export.zip}, uma entrada por
+    subpasta. O ZIP é lido direto, sem extrair.
+    """
+    participantes = {}
+    for sub in sorted(p for p in pasta_coorte.iterdir() if p.is_dir()):
+        exports = sorted(sub.rglob("export.xml"))
+        zips = sorted(z for z in sub.rglob("*.zip") if extracao.eh_zip(z))
+        if exports:
+            participantes[sub.name] = exports[0].parent
+        elif zips:
+            participantes[sub.name] = zips[0]
+        else:
+            print(f"[AVISO] {sub.name}: export.xml/export.zip não encontrado (pulando).")
+    return participantes
+
+
+def processar_participante(participante, indir, outdir, incremental=False, gerar_excel=False,
+                           metricas=None, usar_cache=True):
+    """
+    Pipeline completo de um participante, com o log em <outdir>/processamento.log.
+    Devolve um resumo com a situação, o tempo e as séries diárias. metricas
+    (nomes do catalogo_metricas) restringe a extração e as séries.
+    """
+    outdir = Path(outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    inicio = time.perf_counter()
+    resultado = {"participante": participante, "status": "ok", "erro": "", "series": {}}
+
+    with open(outdir / "processamento.log", "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log):
+        inst = Instrumentacao(mostrar=False)
+        puladas = []
+        try:
+            ctx = executar_pipeline(indir, outdir, metricas=metricas, incremental=incremental,
+                                    gerar_excel=gerar_excel, processos=1, inst=inst,
+                                    usar_cache=usar_cache)
+            puladas = ctx["puladas"]
+            # planilha de séries em cache: as séries vêm das tabelas já gravadas
+            resultado["series"] = (ctx["series"] if "series" in ctx
+                                   else series.build_series(outdir, metricas)[0])
+        except Exception as exc:
+            traceback.print_exc(file=log)
+            resultado["status"] = "erro"
+            resultado["erro"] = f"{type(exc).__name__}: {exc}"
+        inst.gravar(outdir, participante=participante, entrada=str(indir),
+                    incremental=incremental, status=resultado["status"], etapas_puladas=puladas)
+
+    resultado["segundos"] = round(time.perf_counter() - inicio, 1)
+    return resultado
+
+
+def consolidar_diario(resultados):
+    """Junta as séries diárias de todos os participantes em uma tabela larga."""
+    tabelas = []
+    for res in resultados:
+        diario = None
+        for df in res["series"].values():
+            if df.empty:
+                continue
+            diario = df if diario is None else diario.merge(df, on="data", how="outer")
+        if diario is not None:
+            diario.insert(0, "participante", res["participante"])
+            tabelas.append(diario)
+    if not tabelas:
+        return pd.DataFrame(columns=["participante", "data"])
+    return pd.concat(tabelas, ignore_index=True).sort_values(["participante", "data"])
+
+
+def processar_coorte(pasta_coorte, pasta_saida, processos=None, incremental=False,
+                     gerar_excel=False, metricas=None, usar_cache=True):
+    pasta_coorte = Path(pasta_coorte)
+    pasta_saida = Path(pasta_saida)
+    pasta_saida.mkdir(parents=True, exist_ok=True)
+
+    participantes = encontrar_participantes(pasta_coorte)
+    if not participantes:
+        print(f"[ERRO] Nenhum participante com export.xml/export.zip em {pasta_coorte}.")
+        return
+    processos = min(processos or os.cpu_count() or 1, len(participantes))
+    print(f"[INFO] {len(participantes)} participante(s), {processos} processo(s).")
+
+    resultados = []
+    with ProcessPoolExecutor(max_workers=processos) as pool:
+        futuros = [
+            pool.submit(processar_participante, nome, indir, pasta_saida / nome,
+                        incremental, gerar_excel, metricas, usar_cache)
+            for nome, indir in participantes.items()
+        ]
+        for futuro in as_completed(futuros):
+            res = futuro.result()
+            resultados.append(res)
+            marca = "[OK]" if res["status"] == "ok" else "[ERRO]"
+            print(f"{marca} {res['participante']} ({res['segundos']} s) {res['erro']}".rstrip())
+
+    resultados.sort(key=lambda r: r["participante"])
+
+    status = pd.DataFrame([{k: r[k] for k in ("participante", "status", "segundos", "erro")}
+                           for r in resultados])
+    status.to_csv(pasta_saida / "coorte_status.csv", index=False)
+    print(f"[OK] Gerado: {pasta_saida / 'coorte_status.csv'}")
+
+    diario = consolidar_diario(resultados)
+    diario.to_csv(pasta_saida / "coorte_diario.csv", index=False)
+    print(f"[OK] Gerado: {pasta_saida / 'coorte_diario.csv'}")
+
+    erros = sum(r["status"] != "ok" for r in resultados)
+    if erros:
+        print(f"[AVISO] {erros} participante(s) com erro; ver processamento.log de cada um.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Processa os exports Apple Saúde de uma coorte.")
+    parser.add_argument("pasta_coorte", help="pasta com uma subpasta por participante")
+    parser.add_argument("--saida", default="Saida_coorte", help="pasta de saída (padrão: Saida_coorte)")
+    parser.add_argument("--processos", type=int, default=None, help="processos em paralelo (padrão: todos os núcleos)")
+    parser.add_argument("--incremental", action="store_true", help="ingere só os registros novos de cada participante")
+    parser.add_argument("--excel", action="store_true", help="gera também export_master.xlsx por participante")
+    parser.add_argument("--metricas", default=None,
+                        help="métricas do catalogo_metricas, separadas por vírgula (padrão: todas)")
+    parser.add_argument("--sem-cache", action="store_true",
+                        help="roda todas as etapas de cada participante, mesmo sem mudança")
+    args = parser.parse_args()
+
+    processar_coorte(args.pasta_coorte, args.saida, processos=args.processos,
+                     incremental=args.incremental, gerar_excel=args.excel,
+                     metricas=ler_lista_metricas(args.metricas), usar_cache=not args.sem_cache)
@@ -0,0 +1,201 @@
+# =============================================================
+# Módulo: tabela_registros.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Tabela compacta, em memória, dos <Record> extraídos do export.xml:
+# colunas tipadas em vez de um dict de strings por registro.
+# =============================================================
+#
+# Strings repetidas (type, sourceName, sourceVersion, unit, device e os
+# valores textuais de categoria) viram códigos int32 de um dicionário por
+# coluna; datas viram int64 (epoch UTC, em segundos) + offset em minutos
+# (int16); valores numéricos viram float64 (NaN quando não numéricos).
+# Cerca de 60 bytes por registro, contra ~1 KB do dict de atributos.
+#
+# As colunas crescem em buffers array.array durante o parse; coluna()
+# devolve uma visão numpy sem cópia (válida até o próximo adicionar).
+
+from array import array
+
+import numpy as np
+
+from datas_apple import epoch_apple
+
+# código das strings ausentes (mesma convenção de pandas.Categorical)
+SEM_CODIGO = -1
+# epoch das datas ausentes ou inválidas
+SEM_DATA = np.iinfo(np.int64).min
+NAN = float("nan")
+
+CATEGORICAS = ("type", "sourceName", "sourceVersion", "unit", "device", "valueText")
+DATAS = ("creationDate", "startDate", "endDate")
+# offset (minutos) de cada data, na ordem de DATAS
+OFFSETS = ("tzCreationMin", "tzOffsetMin", "tzEndMin")
+
+
+def _numero(valor):
+    """float do valor (aceita vírgula decimal) ou NaN, como safe_float."""
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        try:
+            return float(str(valor).replace(",", "."))
+        except ValueError:
+            return NAN
+
+
+class TabelaRegistros:
+    """Registros em colunas tipadas, preenchidas à medida que o XML é lido."""
+
+    def __init__(self):
+        self._codigos = {c: {} for c in CATEGORICAS}
+        self._categorias = {c: [] for c in CATEGORICAS}
+        self._colunas = {c: array("i") for c in CATEGORICAS}
+        self._colunas.update({c: array("q") for c in DATAS})
+        self._colunas.update({c: array("h") for c in OFFSETS})
+        self._colunas["value"] = array("d")
+        self._atalhos()
+
+    def _atalhos(self):
+        """Referências diretas aos buffers usadas em adicionar()."""
+        col = self._colunas
+        self._categoricas_fixas = [(c, col[c], self._codigos[c], self._categorias[c])
+                                   for c in CATEGORICAS[:-1]]
+        self._datas = [(c, col[c], col[c_off]) for c, c_off in zip(DATAS, OFFSETS)]
+        self._valor = col["value"]
+        self._texto = col["valueText"]
+
+    def __len__(self):
+        return len(self._colunas["startDate"])
+
+    def _codigo(self, coluna, s):
+        if s is None:
+            return SEM_CODIGO
+        codigos = self._codigos[coluna]
+        codigo = codigos.get(s)
+        if codigo is None:
+            codigo = codigos[s] = len(codigos)
+            self._categorias[coluna].append(s)
+        return codigo
+
+    def adicionar(self, r):
+        """Acrescenta um registro a partir do attrib do <Record>."""
+        # laço quente: código das categóricas sem passar por _codigo
+        for nome, buf, codigos, categorias in self._categoricas_fixas:
+            s = r.get(nome)
+            if s is None:
+                buf.append(SEM_CODIGO)
+                continue
+            codigo = codigos.get(s)
+            if codigo is None:
+                codigo = codigos[s] = len(categorias)
+                categorias.append(s)
+            buf.append(codigo)
+        for nome, buf, buf_off in self._datas:
+            epoch, offset = epoch_apple(r.get(nome))
+            if epoch is None:
+                buf.append(SEM_DATA)
+                buf_off.append(0)
+            else:
+                buf.append(epoch)
+                buf_off.append(offset)
+        valor = r.get("value")
+        num = _numero(valor) if valor else NAN
+        self._valor.append(num)
+        self._texto.append(self._codigo("valueText", valor) if num != num and valor is not None
+                           else SEM_CODIGO)
+
+    def estender(self, outra):
+        """Acrescenta os registros de outra tabela (por exemplo, de um bloco paralelo)."""
+        for c in CATEGORICAS:
+            mapa = np.array([self._codigo(c, s) for s in outra._categorias[c]] + [SEM_CODIGO],
+                            dtype=np.int32)
+            # o código -1 da outra tabela cai na última posição do mapa
+            self._colunas[c].frombytes(mapa[outra.coluna(c)].tobytes())
+        for c in DATAS + OFFSETS + ("value",):
+            self._colunas[c].extend(outra._colunas[c])
+
+    # ---------- leitura ----------
+
+    def coluna(self, nome):
+        """Visão numpy (sem cópia) de uma coluna; categóricas devolvem os códigos."""
+        return np.frombuffer(self._colunas[nome], dtype=self._colunas[nome].typecode)
+
+    def categorias(self, nome):
+        """Strings de uma coluna categórica, na ordem dos códigos."""
+        return self._categorias[nome]
+
+    def codigo(self, nome, s):
+        """Código de s na coluna categórica (SEM_CODIGO se nunca apareceu)."""
+        return self._codigos[nome].get(s, SEM_CODIGO)
+
+    def strings(self, nome, linhas=slice(None)):
+        """Array object com as strings (None nas ausentes) das linhas pedidas."""
+        tabela = np.array(self._categorias[nome] + [None], dtype=object)
+        return tabela[self.coluna(nome)[linhas]]
+
+    def resumo_por_tipo(self, inicio=0):
+        """
+        Estatísticas por tipo HK das linhas a partir de inicio, vetorizadas:
+        {tipo: {registros, valores, soma, min, max, inicio, fim}}, com inicio
+        e fim como (epoch, offset) ou None. Mesma semântica do acumulador da
+        auditoria: a soma segue a ordem dos registros (cumsum, não pairwise),
+        e um fim inválido vale o início.
+        """
+        tipos = self.coluna("type")[inicio:]
+        valores = self.coluna("value")[inicio:]
+        t_ini = self.coluna("startDate")[inicio:]
+        o_ini = self.coluna("tzOffsetMin")[inicio:]
+        sem_fim = self.coluna("endDate")[inicio:] == SEM_DATA
+        t_fim = np.where(sem_fim, t_ini, self.coluna("endDate")[inicio:])
+        o_fim = np.where(sem_fim, o_ini, self.coluna("tzEndMin")[inicio:])
+
+        resumo = {}
+        if not len(tipos):
+            return resumo
+        ordem = np.argsort(tipos, kind="stable")
+        cortes = np.flatnonzero(np.diff(tipos[ordem])) + 1
+        for grupo in np.split(ordem, cortes):
+            codigo = tipos[grupo[0]]
+            v = valores[grupo]
+            v = v[~np.isnan(v)]
+            d = {
+                "registros": len(grupo), "valores": len(v),
+                "soma": float(np.cumsum(v)[-1]) if len(v) else 0.0,
+                "min": float(v.min()) if len(v) else None,
+                "max": float(v.max()) if len(v) else None,
+                "inicio": None, "fim": None,
+            }
+            g = grupo[t_ini[grupo] != SEM_DATA]
+            if len(g):
+                i = g[np.argmin(t_ini[g])]
+                j = g[np.argmax(t_fim[g])]
+                d["inicio"] = (int(t_ini[i]), int(o_ini[i]))
+                d["fim"] = (int(t_fim[j]), int(o_fim[j]))
+            resumo[self._categorias["type"][codigo] if codigo >= 0 else None] = d
+        return resumo
+
+    @property
+    def nbytes(self):
+        colunas = sum(len(a) * a.itemsize for a in self._colunas.values())
+        return colunas + sum(len(s) for cats in self._categorias.values() for s in cats)
+
+    def como_dataframe(self):
+        """DataFrame pandas com as categóricas como pandas.Categorical."""
+        import pandas as pd
+
+        dados = {c: pd.Categorical.from_codes(self.coluna(c), self._categorias[c])
+                 for c in CATEGORICAS}
+        dados.update({c: self.coluna(c) for c in DATAS + OFFSETS + ("value",)})
+        return pd.DataFrame(dados)
+
+    # ---------- pickle (blocos do modo paralelo) ----------
+
+    def __getstate__(self):
+        return {"categorias": self._categorias, "colunas": self._colunas}
+
+    def __setstate__(self, estado):
+        self._categorias = estado["categorias"]
+        self._colunas = estado["colunas"]
+        self._codigos = {c: {s: i for i, s in enumerate(cats)}
+                         for c, cats in self._categorias.items()}
+        self._atalhos()
@@ -0,0 +1,175 @@
+# =============================================================
+# Módulo: treinos.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Liga a cada treino (<Workout>) os pontos das rotas GPX e os registros de
+# frequência cardíaca do período do treino, gerando tabelas por treino.
+# =============================================================
+#
+# Entradas (na pasta de saída da extração):
+#   export_workouts.csv      um treino por linha (workout_id, início, fim, rota)
+#   routes_all.csv           pontos GPX (processar_rotas), opcional
+#   indice_temporal/         frequência cardíaca em ordem de início; sem ele,
+#                            export_cardiaco.csv
+#
+# Saídas em <saida>/treinos/:
+#   treinos.csv                        treinos + pontos de rota e resumo da FC
+#   treinos_rotas.csv                  pontos GPX com o workout_id
+#   treinos_frequencia_cardiaca.csv    registros de FC com o workout_id
+#
+# As rotas vão para o treino que as referencia (<FileReference>); GPX sem
+# referência e os registros de FC são ligados pelo horário, com uma junção
+# por intervalo sobre os dois lados ordenados (intervalos.juntar_intervalos):
+# cada lado é lido uma única vez, sem um laço por treino.
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from datas_apple import epoch_series
+from indice_temporal import ARQUIVO_INDICE, PASTA_INDICE, IndiceTemporal
+from intervalos import juntar_intervalos
+
+PASTA_TREINOS = "treinos"
+TIPO_FC = "HKQuantityTypeIdentifierHeartRate"
+CAMPOS_TREINO = ["workout_id", "workoutActivityType", "duration", "durationUnit",
+                 "sourceName", "startDate", "endDate", "rota"]
+
+
+def ler_treinos(outdir):
+    """export_workouts.csv com inicio/fim/tzOffsetMin em epoch, em ordem de início (ou None)."""
+    path = Path(outdir) / "export_workouts.csv"
+    if not path.exists():
+        return None
+    df = pd.read_csv(path, dtype="string")
+    inicio, offset = epoch_series(df["startDate"])
+    fim, _ = epoch_series(df["endDate"])
+    df["inicio"], df["fim"], df["tzOffsetMin"] = inicio, fim, offset
+    df = df.dropna(subset=["inicio", "fim"])
+    df = df.astype({"inicio": "int64", "fim": "int64", "tzOffsetMin": "int64"})
+    return df.sort_values("inicio", kind="stable").reset_index(drop=True)
+
+
+def _nome_arquivo(caminhos):
+    """Nome do arquivo (sem pastas) de caminhos relativos, com / ou \\."""
+    return caminhos.str.replace("\\", "/", regex=False).str.rsplit("/", n=1).str[-1]
+
+
+def _treino_por_arquivo(treinos):
+    """Series nome do GPX -> workout_id, pelas referências <FileReference> dos treinos."""
+    referencias = treinos.dropna(subset=["rota"])
+    por_nome = pd.Series(referencias["workout_id"].to_numpy(),
+                         index=_nome_arquivo(referencias["rota"]).to_numpy())
+    return por_nome[~por_nome.index.duplicated()]
+
+
+def treino_das_rotas(treinos, arquivos, inicios):
+    """
+    workout_id de cada rota (arquivos: caminhos dos GPX; inicios: epoch do
+    primeiro ponto, NaN se sem horário): pela referência do treino ao
+    arquivo ou, sem ela, pelo treino em curso no início da rota.
+    """
+    arquivos = pd.Series(arquivos, dtype="string").reset_index(drop=True)
+    ids = _nome_arquivo(arquivos).map(_treino_por_arquivo(treinos)).to_numpy(dtype=object, copy=True)
+    inicios = pd.Series(inicios, dtype="float64").to_numpy()
+    soltos = np.flatnonzero(pd.isna(ids) & ~np.isnan(inicios))
+    ordem = soltos[np.argsort(inicios[soltos], kind="stable")]
+    i, j = juntar_intervalos(treinos["inicio"].to_numpy(), treinos["fim"].to_numpy(), inicios[ordem])
+    # com treinos sobrepostos fica o primeiro
+    _, primeiro = np.unique(j, return_index=True)
+    ids[ordem[j[primeiro]]] = treinos["workout_id"].to_numpy()[i[primeiro]]
+    return ids
+
+
+def _pontos_rotas(outdir, treinos):
+    """Pontos do routes_all.csv com o workout_id de cada treino (ou None sem rotas)."""
+    path = Path(outdir) / "routes_all.csv"
+    if not path.exists():
+        return None
+    pontos = pd.read_csv(path, dtype={"workout_id": "string", "file": "string", "time": "string"})
+    pontos = pontos.rename(columns={"workout_id": "arquivo_id"})
+    tempo = pd.to_datetime(pontos["time"], utc=True, format="ISO8601", errors="coerce")
+    pontos["epoch"] = (tempo - pd.Timestamp(0, tz="UTC")) // pd.Timedelta(seconds=1)
+
+    # 1) pela referência do <Workout> ao arquivo (comparando o nome do GPX)
+    pontos["workout_id"] = _nome_arquivo(pontos["file"]).map(_treino_por_arquivo(treinos)).astype("string")
+    ligados = pontos[pontos["workout_id"].notna()]
+
+    # 2) GPX sem referência: pelo horário de cada ponto dentro do treino
+    soltos = pontos[pontos["workout_id"].isna() & pontos["epoch"].notna()]
+    soltos = soltos.sort_values("epoch", kind="stable")
+    i, j = juntar_intervalos(treinos["inicio"].to_numpy(), treinos["fim"].to_numpy(),
+                             soltos["epoch"].to_numpy(np.int64))
+    pelo_horario = soltos.iloc[j].copy()
+    pelo_horario["workout_id"] = treinos["workout_id"].to_numpy()[i]
+
+    pontos = pd.concat([ligados, pelo_horario], ignore_index=True)
+    inicio = pontos["workout_id"].map(treinos.set_index("workout_id")["inicio"])
+    pontos["segundos_do_inicio"] = pontos["epoch"] - inicio
+    colunas = ["workout_id", "idx", "lat", "lon", "ele", "time", "segundos_do_inicio", "file"]
+    return pontos[colunas]
+
+
+def _frequencia_cardiaca(outdir, treinos):
+    """Registros de FC com início dentro de cada treino, com o workout_id."""
+    outdir = Path(outdir)
+    inicio, fim = treinos["inicio"].to_numpy(), treinos["fim"].to_numpy()
+    if (outdir / PASTA_INDICE / ARQUIVO_INDICE).exists():
+        indice = IndiceTemporal(outdir)
+        if TIPO_FC not in indice.info:
+            return None
+        # só as páginas do índice dentro dos treinos são lidas
+        i, j = juntar_intervalos(inicio, fim, indice.colunas(TIPO_FC)["startDate"])
+        fc = indice.linhas(TIPO_FC, j)
+    else:
+        path = outdir / "export_cardiaco.csv"
+        if not path.exists():
+            return None
+        df = pd.read_csv(path, usecols=["type", "sourceName", "startDate", "value"], dtype="string")
+        df = df[df["type"] == TIPO_FC]
+        epoch, offset = epoch_series(df["startDate"])
+        fc = pd.DataFrame({"sourceName": df["sourceName"], "startDate": epoch,
+                           "tzOffsetMin": offset,
+                           "value": pd.to_numeric(df["value"], errors="coerce").astype("float64")})
+        fc = fc.dropna(subset=["startDate"]).astype({"startDate": "int64"})
+        fc = fc.sort_values("startDate", kind="stable").reset_index(drop=True)
+        i, j = juntar_intervalos(inicio, fim, fc["startDate"].to_numpy())
+        fc = fc.iloc[j].reset_index(drop=True)
+
+    fc.insert(0, "workout_id", treinos["workout_id"].to_numpy()[i])
+    fc["segundos_do_inicio"] = fc["startDate"].to_numpy() - inicio[i]
+    return fc[["workout_id", "sourceName", "startDate", "tzOffsetMin", "segundos_do_inicio", "value"]]
+
+
+def gerar_treinos(outdir):
+    """Gera <outdir>/treinos com o resumo por treino e as tabelas ligadas."""
+    outdir = Path(outdir)
+    treinos = ler_treinos(outdir)
+    if treinos is None or treinos.empty:
+        print("[INFO] Sem treinos (export_workouts.csv) para ligar (pulando).")
+        return None
+
+    pasta = outdir / PASTA_TREINOS
+    pasta.mkdir(exist_ok=True)
+    resumo = treinos[CAMPOS_TREINO].copy()
+
+    rotas = _pontos_rotas(outdir, treinos)
+    if rotas is not None:
+        rotas.to_csv(pasta / "treinos_rotas.csv", index=False)
+        print(f"[OK] Gerado: {pasta / 'treinos_rotas.csv'}")
+        resumo["pontos_rota"] = resumo["workout_id"].map(rotas.groupby("workout_id").size())
+        resumo["pontos_rota"] = resumo["pontos_rota"].fillna(0).astype("int64")
+
+    fc = _frequencia_cardiaca(outdir, treinos)
+    if fc is not None:
+        fc.to_csv(pasta / "treinos_frequencia_cardiaca.csv", index=False)
+        print(f"[OK] Gerado: {pasta / 'treinos_frequencia_cardiaca.csv'}")
+        estat = fc.groupby("workout_id")["value"].agg(["size", "mean", "min", "max"])
+        estat.columns = ["fc_registros", "fc_media", "fc_min", "fc_max"]
+        resumo = resumo.join(estat, on="workout_id")
+        resumo["fc_registros"] = resumo["fc_registros"].fillna(0).astype("int64")
+        resumo["fc_media"] = resumo["fc_media"].round(2)
+
+    resumo.to_csv(pasta / "treinos.csv", index=False)
+    print(f"[OK] Gerado: {pasta / 'treinos.csv'} ({len(resumo)} treinos)")
+    return pasta
@@ -0,0 +1,25 @@
+# =============================================================
+# Testes: conftest.py
+# Projeto: PPP Gerontologia / DISCF / CTI Renato Archer
+# Export sintético pequeno (bench/gerar_export_sintetico.py) compartilhado
+# pelos testes, e src/ e bench/ no caminho de importação.
+# =============================================================
+
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ / "src"))
+sys.path.insert(0, str(RAIZ / "bench"))
+
+from gerar_export_sintetico import gerar_export  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def export_sintetico(tmp_path_factory):
+    """Pasta apple_health_export/ com ~3.000 registros, treinos com rota e CDA."""
+    destino = tmp_path_factory.mktemp("export")
+    gerar_export(destino, registros=3_000, anos=1, observacoes_cda=200, rotas=4, pontos_rota=300)
+    return destino / "apple_health_export"
@@ -0,0 +1,73 @@
+# Métricas de HRV (RMSSD, pNN50...) sobre séries RR conhecidas.
+
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+import apple_health_export_to_tables_v1_3 as extracao
+from batimentos_hrv import BatimentosHRV, GravadorBatimentos, TIPO_HRV, ms_do_dia
+
+
+def _medicao(gravador, inicio, batimentos, fonte="Apple Watch"):
+    lista = ET.Element("HeartRateVariabilityMetadataList")
+    for bpm, hora in batimentos:
+        ET.SubElement(lista, "InstantaneousBeatsPerMinute", bpm=str(bpm), time=hora)
+    gravador.adicionar({"type": TIPO_HRV, "sourceName": fonte, "startDate": inicio, "value": "50"}, lista)
+
+
+@pytest.fixture
+def hrv(tmp_path):
+    gravador = GravadorBatimentos(tmp_path / "hrv_batimentos", avisar=False)
+    # RR 1000, 1200, 800, 1000 ms
+    _medicao(gravador, "2025-10-26 08:00:00 -0300",
+             [(60, "8:00:01.00 AM"), (50, "8:00:02.20 AM"), (75, "8:00:03.00 AM"), (60, "8:00:04.00 AM")])
+    # RR 1000, 960, 1000, 1200 ms, atravessando a meia-noite local
+    _medicao(gravador, "2025-10-26 23:59:58 -0300",
+             [(60, "11:59:58.50 PM"), (62.5, "11:59:59.46 PM"), (60, "12:00:00.46 AM"), (50, "12:00:01.66 AM")],
+             fonte="iPhone")
+    gravador.fechar()
+    return BatimentosHRV(tmp_path)
+
+
+def test_ms_do_dia():
+    assert ms_do_dia("12:00:00.46 AM") == 460
+    assert ms_do_dia("8:45:12.34 PM") == ((20 * 60 + 45) * 60 + 12) * 1000 + 340
+    assert ms_do_dia("20:45:12,34") == ms_do_dia("8:45:12.34 PM")
+    assert ms_do_dia("sem horário") is None
+
+
+def test_metricas_serie_conhecida(hrv):
+    m = hrv.metricas()
+    assert m["batimentos"].tolist() == [4, 4]
+    assert m["sourceName"].tolist() == ["Apple Watch", "iPhone"]
+    assert m["rr_medio_ms"].tolist() == [1000.0, 1040.0]
+    assert m["sdnn_ms"].tolist() == [141.42, 93.81]
+    assert m["rmssd_ms"].tolist() == [282.84, 120.0]
+    assert m["pnn50"].tolist() == [100.0, 33.33]
+
+
+def test_blocos_nao_misturam_medicoes(hrv):
+    assert hrv.metricas(batimentos_por_bloco=3).equals(hrv.metricas())
+
+
+def test_tempos_atravessam_a_meia_noite(hrv):
+    tempo, _ = hrv.medicao(1)
+    assert np.diff(tempo).tolist() == [960, 1000, 1200]
+    # 23:59:58.50 de -0300 = 02:59:58.50 UTC do dia seguinte
+    assert int(tempo[0]) == int(np.datetime64("2025-10-27T02:59:58.500", "ms").astype(np.int64))
+
+
+def test_export_sintetico(export_sintetico, tmp_path):
+    extracao.processar_exportacao(export_sintetico, tmp_path)
+    hrv = BatimentosHRV(tmp_path)
+    assert len(hrv) > 0
+    m = hrv.metricas(batimentos_por_bloco=50)
+    for i in range(len(hrv)):
+        _, bpm = hrv.medicao(i)
+        rr = 60000.0 / np.asarray(bpm, dtype=np.float64)
+        dif = np.diff(rr)
+        assert m["rr_medio_ms"][i] == pytest.approx(rr.mean(), abs=0.01)
+        assert m["sdnn_ms"][i] == pytest.approx(rr.std(), abs=0.01)
+        assert m["rmssd_ms"][i] == pytest.approx(np.sqrt(np.mean(dif ** 2)), abs=0.01)
+        assert m["pnn50"][i] == pytest.approx(100.0 * np.mean(np.abs(dif) > 50), abs=0.01)
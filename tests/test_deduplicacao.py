@@ -0,0 +1,86 @@
+# Deduplicação entre fontes por prioridade, contra uma referência segundo a segundo.
+
+import numpy as np
+import pytest
+
+import apple_health_export_to_tables_v1_3 as extracao
+from deduplicacao_fontes import deduplicar, gerar_deduplicacao, ordem_fontes, valores_deduplicados
+from indice_temporal import IndiceTemporal
+
+
+def _referencia(inicio, fim, valor, fonte, posicao):
+    """Cada amostra fica com a fração dos seus segundos sem fonte acima dela."""
+    nivel = [posicao[f] if f >= 0 else len(posicao) for f in fonte]
+    segundos = {}
+    for c, d, n in zip(inicio, fim, nivel):
+        segundos.setdefault(n, set()).update(range(c, d))
+    acima_de = {n: set().union(*(s for m, s in segundos.items() if m < n)) for n in segundos}
+    saida = []
+    for a, b, v, n in zip(inicio, fim, valor, nivel):
+        acima = acima_de[n]
+        if b == a:
+            saida.append(0.0 if a in acima else v)
+        else:
+            livres = sum(1 for t in range(a, b) if t not in acima)
+            saida.append(v * livres / (b - a))
+    return np.array(saida)
+
+
+def test_ordem_fontes():
+    fontes = ["Zepp", "iPhone de Ana", "Apple Watch de Ana", "Balança", "Meu Watch"]
+    posicao = ordem_fontes(fontes)
+    assert [fontes[k] for k in np.argsort(posicao)] == [
+        "Apple Watch de Ana", "Meu Watch", "iPhone de Ana", "Balança", "Zepp"]
+    assert ordem_fontes(fontes, ["zepp"]).tolist()[0] == 0
+
+
+def test_watch_cobre_iphone():
+    # fonte 0 = iPhone, 1 = Watch; Watch de 0 a 60, iPhone de 30 a 90
+    posicao = ordem_fontes(["iPhone", "Apple Watch"])
+    saida = deduplicar([0, 30, 45, 100], [60, 90, 45, 100], [100.0, 60.0, 7.0, 5.0],
+                       [1, 0, 0, -1], posicao)
+    # metade do iPhone coberta; a instantânea das 45 s também; a sem fonte está livre
+    assert saida.tolist() == [100.0, 30.0, 0.0, 5.0]
+
+
+def test_mesma_fonte_nao_se_anula():
+    posicao = ordem_fontes(["iPhone"])
+    saida = deduplicar([0, 10], [20, 30], [4.0, 4.0], [0, 0], posicao)
+    assert saida.tolist() == [4.0, 4.0]
+
+
+def test_igual_a_referencia():
+    rng = np.random.default_rng(17)
+    n = 150
+    inicio = rng.integers(0, 3000, n)
+    fim = inicio + rng.choice([0, 5, 30, 120], n)
+    valor = rng.uniform(1, 50, n).round(2)
+    fonte = rng.integers(-1, 3, n)
+    posicao = ordem_fontes(["Zepp", "iPhone", "Apple Watch"])
+    saida = deduplicar(inicio, fim, valor, fonte, posicao)
+    assert np.allclose(saida, _referencia(inicio, fim, valor, fonte, posicao))
+
+
+@pytest.fixture(scope="module")
+def saida_dedup(export_sintetico, tmp_path_factory):
+    saida = tmp_path_factory.mktemp("dedup")
+    extracao.processar_exportacao(export_sintetico, saida)
+    assert gerar_deduplicacao(saida) is not None
+    return saida
+
+
+def test_export_sintetico(saida_dedup):
+    indice = IndiceTemporal(saida_dedup)
+    tipo = "HKQuantityTypeIdentifierStepCount"
+    info, colunas = indice.info[tipo], indice.colunas(tipo)
+    assert len(info["fontes"]) > 1
+    posicao = ordem_fontes(info["fontes"])
+    inicio = np.asarray(colunas["startDate"]).tolist()
+    fim = np.asarray(colunas["endDate"]).tolist()
+    valor = np.asarray(colunas["value"])
+    fonte = np.asarray(colunas["sourceName"]).tolist()
+    dedup = np.asarray(valores_deduplicados(saida_dedup, tipo))
+    assert np.allclose(dedup, _referencia(inicio, fim, valor, fonte, posicao))
+    # a fonte mais prioritária nunca perde valor
+    topo = np.asarray(fonte) == int(np.argmin(posicao))
+    assert topo.any() and np.array_equal(dedup[topo], valor[topo])
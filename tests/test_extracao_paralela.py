@@ -0,0 +1,44 @@
+# Extração em paralelo por faixas de bytes: mesmas saídas que o passe serial.
+
+import filecmp
+
+import pytest
+
+import apple_health_export_to_tables_v1_3 as extracao
+
+
+@pytest.fixture(scope="module")
+def saidas(export_sintetico, tmp_path_factory):
+    base = tmp_path_factory.mktemp("paralela")
+    extracao.processar_exportacao(export_sintetico, base / "serial", processos=1)
+    # o export de teste é pequeno: sem o mínimo, o passe serial seria usado
+    mp = pytest.MonkeyPatch()
+    mp.setattr(extracao, "MIN_BYTES_PARALELO", 0)
+    try:
+        extracao.processar_exportacao(export_sintetico, base / "paralelo", processos=3)
+    finally:
+        mp.undo()
+    return base / "serial", base / "paralelo"
+
+
+def test_divide_em_mais_de_um_bloco(export_sintetico):
+    _, faixas = extracao.dividir_em_blocos(export_sintetico / "export.xml", 6)
+    assert len(faixas) > 1
+
+
+def test_csvs_identicos(saidas):
+    serial, paralelo = saidas
+    csvs = sorted(p.name for p in serial.glob("*.csv"))
+    assert "export_master.csv" in csvs and "export_workouts.csv" in csvs
+    assert csvs == sorted(p.name for p in paralelo.glob("*.csv"))
+    for nome in csvs:
+        assert filecmp.cmp(serial / nome, paralelo / nome, shallow=False), nome
+
+
+def test_batimentos_hrv_identicos(saidas):
+    serial, paralelo = saidas
+    pasta = extracao.PASTA_HRV
+    arquivos = sorted(p.name for p in (serial / pasta).iterdir())
+    assert arquivos == sorted(p.name for p in (paralelo / pasta).iterdir())
+    for nome in arquivos:
+        assert filecmp.cmp(serial / pasta / nome, paralelo / pasta / nome, shallow=False), nome
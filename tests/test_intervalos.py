@@ -0,0 +1,66 @@
+# União de intervalos de sono e divisão nas fronteiras de dia.
+
+import numpy as np
+
+from intervalos import DIA_S, cobertura, dividir_por_dia, somar_por_dia, unir_intervalos
+
+H = 3600
+
+
+def test_unir_sobrepostos_e_encostados():
+    # Watch e iPhone registram o mesmo sono; um cochilo à parte; um vazio
+    inicio = [22 * H, 23 * H, 30 * H, 31 * H, 40 * H, 50 * H]
+    fim = [30 * H, 29 * H, 31 * H, 32 * H, 41 * H, 50 * H]
+    offset = [-180, -120, 0, 0, -180, 0]
+    i, f, o = unir_intervalos(inicio, fim, offset)
+    assert i.tolist() == [22 * H, 40 * H]
+    assert f.tolist() == [32 * H, 41 * H]
+    assert o.tolist() == [-180, -180]
+
+
+def test_unir_contra_referencia_por_segundo():
+    rng = np.random.default_rng(7)
+    inicio = rng.integers(0, 2000, 60)
+    fim = inicio + rng.integers(0, 80, 60)
+    i, f, _ = unir_intervalos(inicio, fim)
+    cobertos = set()
+    for a, b in zip(inicio, fim):
+        cobertos.update(range(a, b))
+    assert sum((f - i).tolist()) == len(cobertos)
+    assert set().union(*(range(a, b) for a, b in zip(i, f))) == cobertos
+    assert (i[1:] > f[:-1]).all()
+
+
+def test_dividir_por_dia_calendario():
+    # de 22:00 do dia 0 até 07:30 do dia 2 (atravessa duas meias-noites)
+    dia, seg = dividir_por_dia([22 * H], [2 * DIA_S + 7 * H + 1800])
+    assert dia.tolist() == [0, 1, 2]
+    assert seg.tolist() == [2 * H, 24 * H, 7 * H + 1800]
+
+
+def test_dividir_por_dia_as_18h():
+    # com o dia começando às 18:00, a noite toda vai para a data em que termina
+    dia, seg = dividir_por_dia([DIA_S + 22 * H], [2 * DIA_S + 6 * H], inicio_dia_h=18)
+    assert dia.tolist() == [2]
+    assert seg.tolist() == [8 * H]
+    # das 17:00 às 19:00 cruza a fronteira das 18:00
+    dia, seg = dividir_por_dia([DIA_S + 17 * H], [DIA_S + 19 * H], inicio_dia_h=18)
+    assert dia.tolist() == [1, 2]
+    assert seg.tolist() == [H, H]
+
+
+def test_dividir_e_somar_preservam_a_duracao():
+    rng = np.random.default_rng(3)
+    inicio = rng.integers(0, 10 * DIA_S, 200)
+    fim = inicio + rng.integers(1, 3 * DIA_S, 200)
+    dia, seg = dividir_por_dia(inicio, fim, inicio_dia_h=18)
+    assert seg.sum() == (fim - inicio).sum()
+    assert (seg > 0).all() and (seg <= DIA_S).all()
+    dias, somas = somar_por_dia(dia, seg)
+    assert somas.sum() == (fim - inicio).sum()
+    assert (np.diff(dias) > 0).all()
+
+
+def test_cobertura():
+    i, f, _ = unir_intervalos([10, 30], [20, 40])
+    assert cobertura(i, f, [0, 10, 15, 25, 35, 50]).tolist() == [0, 0, 5, 10, 15, 20]
@@ -0,0 +1,62 @@
+# Douglas–Peucker vetorizado contra a recursão clássica.
+
+import numpy as np
+
+from metricas_rotas import douglas_peucker
+
+
+def _referencia(x, y, tolerancia):
+    """Recursão ponto a ponto (distância à reta pelos extremos do trecho)."""
+    manter = np.zeros(len(x), dtype=bool)
+    manter[0] = manter[-1] = True
+
+    def trecho(a, b):
+        if b - a < 2:
+            return
+        dx, dy = x[b] - x[a], y[b] - y[a]
+        comprimento = np.hypot(dx, dy)
+        melhor, dist_max = None, -1.0
+        for k in range(a + 1, b):
+            px, py = x[k] - x[a], y[k] - y[a]
+            d = abs(dx * py - dy * px) / comprimento if comprimento > 0 else np.hypot(px, py)
+            if d > dist_max:
+                melhor, dist_max = k, d
+        if dist_max > tolerancia:
+            manter[melhor] = True
+            trecho(a, melhor)
+            trecho(melhor, b)
+
+    trecho(0, len(x) - 1)
+    return manter
+
+
+def _rota(rng, n):
+    passo = rng.normal(0, 5, (n, 2)) + [4, 1]
+    xy = np.cumsum(passo, axis=0)
+    return xy[:, 0], xy[:, 1]
+
+
+def test_igual_a_referencia():
+    rng = np.random.default_rng(11)
+    for n, tolerancia in [(2, 1.0), (3, 0.5), (50, 2.0), (400, 5.0), (400, 0.0)]:
+        x, y = _rota(rng, n)
+        assert (douglas_peucker(x, y, tolerancia) == _referencia(x, y, tolerancia)).all()
+
+
+def test_rotas_agrupadas_independentes():
+    rng = np.random.default_rng(5)
+    rotas = [_rota(rng, n) for n in (120, 1, 2, 300, 60)]
+    x = np.concatenate([r[0] for r in rotas])
+    y = np.concatenate([r[1] for r in rotas])
+    grupo = np.repeat(np.arange(len(rotas)), [len(r[0]) for r in rotas])
+    esperado = np.concatenate([_referencia(rx, ry, 3.0) for rx, ry in rotas])
+    assert (douglas_peucker(x, y, 3.0, grupo) == esperado).all()
+
+
+def test_linha_reta_e_pontos_repetidos():
+    x = np.arange(10, dtype=float)
+    assert douglas_peucker(x, 2 * x, 0.1).tolist() == [True] + [False] * 8 + [True]
+    # início e fim no mesmo lugar: distância ao ponto
+    x = np.array([0.0, 3.0, 4.0, 0.0])
+    y = np.array([0.0, 4.0, 0.0, 0.0])
+    assert (douglas_peucker(x, y, 1.0) == _referencia(x, y, 1.0)).all()
@@ -0,0 +1,81 @@
+# Cache de etapas do pipeline: o que é pulado e o que roda de novo.
+
+import shutil
+
+import pytest
+
+import pipeline
+
+
+@pytest.fixture(scope="module")
+def saida_base(export_sintetico, tmp_path_factory):
+    saida = tmp_path_factory.mktemp("pipeline") / "Saida"
+    ctx = pipeline.executar_pipeline(export_sintetico, saida, processos=1)
+    assert ctx["executadas"] == pipeline.NOMES_ETAPAS
+    return saida
+
+
+@pytest.fixture
+def saida(saida_base, tmp_path):
+    destino = tmp_path / "Saida"
+    shutil.copytree(saida_base, destino)
+    return destino
+
+
+def test_sem_mudanca_pula_tudo(export_sintetico, saida):
+    ctx = pipeline.executar_pipeline(export_sintetico, saida, processos=1)
+    assert ctx["executadas"] == []
+    assert ctx["puladas"] == pipeline.NOMES_ETAPAS
+
+
+def test_saida_apagada_refaz_so_a_etapa(export_sintetico, saida):
+    (saida / "hrv_metricas.csv").unlink()
+    ctx = pipeline.executar_pipeline(export_sintetico, saida, processos=1)
+    assert ctx["executadas"] == ["hrv"]
+    assert (saida / "hrv_metricas.csv").exists()
+
+
+def test_forcar(export_sintetico, saida):
+    ctx = pipeline.executar_pipeline(export_sintetico, saida, processos=1, forcar=["cubo"])
+    assert ctx["executadas"] == ["cubo"]
+    with pytest.raises(ValueError):
+        pipeline.executar_pipeline(export_sintetico, saida, forcar=["nao_existe"])
+
+
+def test_codigo_de_dependencia_refaz_as_etapas_que_a_importam(export_sintetico, saida, tmp_path,
+                                                               monkeypatch):
+    # cópia de src/ só para o hash do código: as etapas rodam o código real
+    src = tmp_path / "src"
+    shutil.copytree(pipeline.SRC, src, ignore=shutil.ignore_patterns("__pycache__"))
+    monkeypatch.setattr(pipeline, "SRC", src)
+    with open(src / "intervalos.py", "a", encoding="utf-8") as f:
+        f.write("\n# mudança\n")
+
+    esperadas = [e.nome for e in pipeline.ETAPAS if "intervalos" in pipeline.modulos_da_etapa(e, src)]
+    assert {"deduplicacao", "treinos", "series"} <= set(esperadas)
+    ctx = pipeline.executar_pipeline(export_sintetico, saida, processos=1)
+    assert ctx["executadas"] == esperadas
+
+
+def test_modulos_importados_entram_na_chave():
+    etapas = {e.nome: pipeline.modulos_da_etapa(e) for e in pipeline.ETAPAS}
+    assert {"cubo_agregacoes", "deduplicacao_fontes", "catalogo_metricas"} <= set(etapas["series"])
+    assert {"indice_temporal", "datas_apple"} <= set(etapas["treinos"])
+    assert "tabela_registros" in etapas["cubo"] and "tabela_registros" in etapas["indice"]
+    # o catálogo entra na extração pelos parâmetros, não pelo código
+    assert "catalogo_metricas" not in etapas["extracao"]
+    assert "instrumentacao" not in etapas["extracao"]
+
+
+def test_cada_arquivo_lido_uma_vez(export_sintetico, tmp_path, monkeypatch):
+    lidos = []
+
+    def abrir(path, *args, **kwargs):
+        lidos.append(str(path))
+        return open(path, *args, **kwargs)
+
+    # pipeline.open encobre o open embutido só dentro do módulo
+    monkeypatch.setattr(pipeline, "open", abrir, raising=False)
+    pipeline.executar_pipeline(export_sintetico, tmp_path / "Saida", processos=1)
+    assert any(p.endswith("export_master.csv") for p in lidos)
+    assert len(lidos) == len(set(lidos))